@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hydrogen Infrastructure Optimization - ASGI Service
+Async front end for the Python backend: optimizations run on a bounded worker pool, excess load is
+shed with 503s instead of queueing without limit, and result logging never blocks a request.
+
+Run with: uvicorn asgi_backend:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from optimized_hydrogen_system import metrics
+from urllib.parse import parse_qs
+
+from python_backend import (health_payload, run_optimization, run_validation, run_status, metrics_text,
+                            open_recommendation_stream, stream_frame, post_optimization_log, error_payload,
+                            wants_profile, profile_index, start_profile_window, profile_collapsed, loads_json,
+                            ARROW_STREAM, is_arrow, decode_arrow_request, encode_arrow_response)
+
+OPTIMIZER_WORKERS = int(os.environ.get('OPTIMIZER_WORKERS', min(os.cpu_count() or 4, 8)))
+OPTIMIZER_QUEUE = int(os.environ.get('OPTIMIZER_QUEUE', 2 * OPTIMIZER_WORKERS))  # Waiting requests before 503
+OPTIMIZER_MAX_BODY = int(os.environ.get('OPTIMIZER_MAX_BODY_MB', 64)) * 1024 * 1024
+LOG_QUEUE = 1000  # Pending result logs; further logs are dropped while the Node backend is slow
+LOG_WORKERS = 2  # Concurrent log POSTs
+LOG_TIMEOUT = 3  # Seconds per log POST
+RETRY_AFTER = 1  # Seconds suggested to rejected clients
+
+class AdmissionControl:
+    """Runs at most `limit` optimizations at once and lets at most `queue` more wait; the rest are rejected
+
+    Keeping the wait queue short bounds queueing delay, so latency of admitted requests stays flat
+    under bursts and overload surfaces as fast 503s the caller can retry.
+    """
+
+    def __init__(self, limit: int, queue: int):
+        self.limit = max(int(limit), 1)
+        self.queue = max(int(queue), 0)
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> bool:
+        if self._slots is None:
+            # Created lazily so the semaphore belongs to the serving event loop
+            self._slots = asyncio.Semaphore(self.limit)
+        if self._slots.locked() and self.waiting >= self.queue:
+            self.rejected += 1
+            return False
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        return True
+
+    def release(self) -> None:
+        self.running -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {'running': self.running, 'waiting': self.waiting, 'rejected': self.rejected,
+                'limit': self.limit, 'queue': self.queue}
+
+class LogShipper:
+    """Posts result logs to the Node.js backend from a bounded queue, off the request path"""
+
+    def __init__(self, maxsize: int = LOG_QUEUE, workers: int = LOG_WORKERS, timeout: float = LOG_TIMEOUT):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.timeout = timeout
+        self.sent = 0
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(self.maxsize)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='log-shipper')
+        self._tasks = [asyncio.ensure_future(self._run()) for _ in range(self.workers)]
+
+    def submit(self, url: str, payload: Dict[str, Any]) -> bool:
+        """Queue one log without waiting; False when it had to be dropped"""
+        self.start()
+        try:
+            self._queue.put_nowait((url, payload))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            url, payload = await self._queue.get()
+            try:
+                await loop.run_in_executor(self._executor, post_optimization_log, url, payload, self.timeout)
+                self.sent += 1
+            finally:
+                self._queue.task_done()
+
+    async def stop(self, timeout: float = LOG_TIMEOUT) -> None:
+        """Give queued logs up to `timeout` seconds to go out, then stop the workers"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False)
+        self._queue, self._tasks = None, []
+
+    def stats(self) -> Dict[str, int]:
+        return {'pending': self._queue.qsize() if self._queue else 0, 'sent': self.sent, 'dropped': self.dropped}
+
+executor = ThreadPoolExecutor(OPTIMIZER_WORKERS, thread_name_prefix='optimizer')
+admission = AdmissionControl(OPTIMIZER_WORKERS, OPTIMIZER_QUEUE)
+log_shipper = LogShipper()
+
+def _encode(payload: Any) -> bytes:
+    return json.dumps(payload).encode('utf-8')
+
+def _headers(content_type: str, extra: Iterable[Tuple[str, str]] = ()) -> list:
+    headers = [(b'content-type', content_type.encode()), (b'access-control-allow-origin', b'*')]
+    return headers + [(name.encode(), value.encode()) for name, value in extra]
+
+async def _respond(send: Callable, status: int, body: bytes, content_type: str = 'application/json',
+                   extra: Iterable[Tuple[str, str]] = ()) -> None:
+    await send({'type': 'http.response.start', 'status': status, 'headers': _headers(content_type, extra)})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _read_body(receive: Callable) -> Tuple[Optional[bytes], Optional[str]]:
+    """Raw request body: (body, None), or (None, error) for oversized bodies and disconnects"""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None, 'Client disconnected'
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > OPTIMIZER_MAX_BODY:
+            return None, 'Request body too large'
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks), None
+
+async def _read_json(receive: Callable) -> Tuple[Any, Optional[str]]:
+    """Request body as JSON: (data, None), or (None, error) for oversized or malformed bodies"""
+    body, error = await _read_body(receive)
+    if error or not body:
+        return None, error
+    try:
+        return loads_json(body), None
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+
+async def _offload(send: Callable, work: Callable, *args) -> Optional[Any]:
+    """Run `work` on the optimizer pool under admission control; None (after a 503) when rejected"""
+    if not await admission.acquire():
+        await _respond(send, 503, _encode({'error': 'Optimizer busy, retry later', 'success': False}),
+                       extra=[('retry-after', str(RETRY_AFTER))])
+        return None
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, work, *args)
+    finally:
+        admission.release()
+
+def _encoded(work: Callable) -> Callable:
+    # JSON encoding of large results also stays off the event loop
+    def run(data):
+        payload, status, *rest = work(data)
+        return (_encode(payload), status, *rest)
+    return run
+
+async def health(scope: Dict, receive: Callable, send: Callable) -> None:
+    payload = dict(health_payload(), load=admission.stats(), logs=log_shipper.stats())
+    await _respond(send, 200, _encode(payload))
+
+async def prometheus(scope: Dict, receive: Callable, send: Callable) -> None:
+    gauges = {f"admission_{name}": value for name, value in admission.stats().items()}
+    gauges.update((f"log_{name}", value) for name, value in log_shipper.stats().items())
+    await _respond(send, 200, metrics_text(gauges).encode('utf-8'), 'text/plain; version=0.0.4')
+
+def _optimization(profile: bool, arrow_in: bool, arrow_out: bool) -> Callable:
+    # Arrow decoding and encoding run on the pool along with the optimization
+    def run(data):
+        if arrow_in:
+            try:
+                data = decode_arrow_request(data)
+            except ValueError as e:
+                return _encode({'error': f"Invalid Arrow request: {e}", 'success': False}), 400, 'application/json'
+        payload, status = run_optimization(data, profile)
+        if status == 200 and arrow_out:
+            return encode_arrow_response(payload), status, ARROW_STREAM
+        return _encode(payload), status, 'application/json'
+    return run
+
+async def optimize(scope: Dict, receive: Callable, send: Callable) -> None:
+    headers = {name.decode('latin-1').title(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+    arrow_in = is_arrow(headers.get('Content-Type'))
+    data, error = await (_read_body(receive) if arrow_in else _read_json(receive))
+    if error:
+        return await _respond(send, 400, _encode({'error': error, 'success': False}))
+    args = {key: values[-1] for key, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+    work = _optimization(wants_profile(headers, args), arrow_in, is_arrow(headers.get('Accept')))
+    result = await _offload(send, work, data)
+    if result is not None:
+        await _respond(send, result[1], result[0], result[2])
+
+async def optimize_stream(scope: Dict, receive: Callable, send: Callable) -> None:
+    data, error = await _read_json(receive)
+    if error:
+        return await _respond(send, 400, _encode({'error': error, 'success': False}))
+    if not await admission.acquire():
+        return await _respond(send, 503, _encode({'error': 'Optimizer busy, retry later', 'success': False}),
+                              extra=[('retry-after', str(RETRY_AFTER))])
+    # The slot is held for the whole stream; each batch is scored on the pool between sends
+    started = False
+    try:
+        loop = asyncio.get_running_loop()
+        updates, error = await loop.run_in_executor(executor, open_recommendation_stream, data)
+        if error:
+            return await _respond(send, error[1], _encode(error[0]))
+        accept = dict(scope.get('headers', [])).get(b'accept', b'').decode('latin-1')
+        sse = 'text/event-stream' in accept
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': _headers('text/event-stream' if sse else 'application/x-ndjson',
+                                        [('cache-control', 'no-cache'), ('x-accel-buffering', 'no')])})
+        started = True
+        while True:
+            update = await loop.run_in_executor(executor, next, updates, None)
+            if update is None:
+                break
+            await send({'type': 'http.response.body', 'body': stream_frame(update, sse).encode('utf-8'),
+                        'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    except Exception as e:
+        print("Error in optimization: {}".format(str(e)))
+        if not started:
+            await _respond(send, 500, _encode(error_payload(e)))
+    finally:
+        admission.release()
+
+async def list_profiles(scope: Dict, receive: Callable, send: Callable) -> None:
+    await _respond(send, 200, _encode(profile_index()))
+
+async def start_profile(scope: Dict, receive: Callable, send: Callable) -> None:
+    data, error = await _read_json(receive)
+    if error:
+        return await _respond(send, 400, _encode({'error': error, 'success': False}))
+    payload, code = start_profile_window(data)
+    await _respond(send, code, _encode(payload))
+
+async def get_profile(scope: Dict, receive: Callable, send: Callable) -> None:
+    body, code, content_type = profile_collapsed(scope['path'].rstrip('/').rsplit('/', 1)[-1])
+    await _respond(send, code, body.encode('utf-8'), content_type)
+
+async def validate(scope: Dict, receive: Callable, send: Callable) -> None:
+    data, error = await _read_json(receive)
+    if error:
+        return await _respond(send, 400, _encode({'error': error, 'success': False}))
+    payload, status = run_validation(data)
+    await _respond(send, status, _encode(payload))
+
+async def status(scope: Dict, receive: Callable, send: Callable) -> None:
+    data, error = await _read_json(receive)
+    if error:
+        return await _respond(send, 400, _encode({'error': error, 'success': False}))
+    result = await _offload(send, _encoded(run_status), data)
+    if result is None:
+        return
+    body, code, log = result
+    if log:
+        log_shipper.submit(*log)
+    await _respond(send, code, body)
+
+ROUTES = {
+    ('GET', '/health'): health,
+    ('GET', '/metrics'): prometheus,
+    ('POST', '/optimize'): optimize,
+    ('POST', '/optimize/stream'): optimize_stream,
+    ('POST', '/validate'): validate,
+    ('GET', '/status'): status,
+    ('GET', '/profile'): list_profiles,
+    ('POST', '/profile'): start_profile
+}
+
+async def _lifespan(receive: Callable, send: Callable) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            log_shipper.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await log_shipper.stop()
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+def _counting(send: Callable, endpoint: str) -> Callable:
+    async def counted(message: Dict) -> None:
+        if message['type'] == 'http.response.start':
+            metrics.count('requests', endpoint=endpoint, status=str(message['status']))
+        await send(message)
+    return counted
+
+async def app(scope: Dict, receive: Callable, send: Callable) -> None:
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    method, path = scope['method'], scope['path'].rstrip('/') or '/'
+    if method == 'OPTIONS':
+        # CORS preflight, matching flask_cors defaults on the WSGI app
+        return await _respond(send, 204, b'', extra=[('access-control-allow-methods', 'GET, POST, OPTIONS'),
+                                                     ('access-control-allow-headers', '*')])
+    handler = ROUTES.get((method, path))
+    endpoint = path if handler is not None else 'unmatched'
+    if handler is None and method == 'GET' and path.startswith('/profile/'):
+        handler, endpoint = get_profile, '/profile/<profile_id>'
+    send = _counting(send, endpoint)
+    if handler is None:
+        known = any(route_path == path for _, route_path in ROUTES)
+        return await _respond(send, 405 if known else 404,
+                              _encode({'error': 'Method not allowed' if known else 'Not found', 'success': False}))
+    try:
+        await handler(scope, receive, send)
+    except Exception as e:
+        print("Error in request: {}".format(str(e)))
+        await _respond(send, 500, _encode(error_payload(e)))
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("uvicorn is required to serve the ASGI app: pip install uvicorn")
+        raise SystemExit(1)
+    print("Starting Hydrogen Optimization ASGI Backend")
+    print(f"Optimizer workers: {OPTIMIZER_WORKERS}, wait queue: {OPTIMIZER_QUEUE}")
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
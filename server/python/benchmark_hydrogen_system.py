@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hydrogen Infrastructure Optimization - Benchmark Suite
+Seeded synthetic networks from 1k to 10M assets, per-stage latency percentiles and peak memory,
+written as JSON so results can be compared between releases.
+
+Usage:
+    python benchmark_hydrogen_system.py --scales small,medium --output results.json
+    python benchmark_hydrogen_system.py --compare baseline.json results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from optimized_hydrogen_system import OptimizedHydrogenSystem
+
+BENCHMARK_FORMAT = 'hydrogen-benchmark'
+BENCHMARK_VERSION = 1
+US_BOUNDS = (-124.5, 25.0, -67.0, 49.0)  # Synthetic networks are spread over the contiguous US
+SCALES = {
+    # name: (assets, regulatory zones)
+    'small': (1_000, 10),
+    'medium': (100_000, 100),
+    'large': (1_000_000, 1_000),
+    'national': (10_000_000, 10_000)
+}
+ASSET_MIX = {'plant': 0.3, 'storage': 0.2, 'demand': 0.5}  # Share of each asset type
+MAX_RECORD_ASSETS = 1_000_000  # Larger networks skip the record-based `initialize` stage
+REGRESSION_THRESHOLD = 0.2  # A stage regresses when its p50 grows by more than this share
+
+def synthetic_network(assets: int, zones: int, seed: int = 0, pipelines: Optional[int] = None) -> Dict[str, Any]:
+    """Seeded network: assets clustered around weighted population centers, polygon zones, short pipelines
+
+    Asset columns are numpy arrays ('id', 'type', 'lng', 'lat', 'capacity'); 'zones' and 'pipelines'
+    are records in the `initialize` format.
+    """
+    rng = np.random.default_rng(seed)
+    min_lng, min_lat, max_lng, max_lat = US_BOUNDS
+    # Heavy-tailed center weights give a few dense metro areas and a long rural tail
+    n_centers = int(np.clip(assets // 2000, 8, 500))
+    center_lng = rng.uniform(min_lng, max_lng, n_centers)
+    center_lat = rng.uniform(min_lat, max_lat, n_centers)
+    weight = rng.pareto(1.5, n_centers) + 1
+    spread = rng.uniform(0.1, 1.0, n_centers)
+    which = rng.choice(n_centers, assets, p=weight / weight.sum())
+    lng = np.clip(center_lng[which] + rng.normal(0, 1, assets) * spread[which], min_lng, max_lng)
+    lat = np.clip(center_lat[which] + rng.normal(0, 1, assets) * spread[which] * 0.8, min_lat, max_lat)
+    names = np.array(list(ASSET_MIX))
+    kind = rng.choice(len(names), assets, p=list(ASSET_MIX.values()))
+    low = np.array([50.0, 500.0, 1.0])[kind]
+    high = np.array([500.0, 5000.0, 50.0])[kind]
+    capacity = rng.uniform(low, high)
+    ids = np.char.add(np.array(['p', 's', 'd'])[kind], np.arange(assets).astype(str))
+
+    zone_records = []
+    zone_lng = rng.uniform(min_lng, max_lng, zones)
+    zone_lat = rng.uniform(min_lat, max_lat, zones)
+    for z in range(zones):
+        sides = int(rng.integers(5, 12))
+        angles = np.sort(rng.uniform(0, 2 * np.pi, sides))
+        radius = rng.uniform(0.05, 1.0) * rng.uniform(0.7, 1.0, sides)
+        ring = np.column_stack((zone_lng[z] + radius * np.cos(angles), zone_lat[z] + radius * np.sin(angles)))
+        record = {'id': f"zone{z}", 'polygon': ring.tolist()}
+        if rng.random() < 0.7:
+            record.update(type='restricted', penalty=float(rng.uniform(5, 30)))
+        else:
+            record.update(type='incentive', bonus=float(rng.uniform(5, 15)))
+        zone_records.append(record)
+
+    # Pipelines join a sample of plants to a storage site in the same cluster
+    plants = np.flatnonzero(kind == 0)
+    storages = np.flatnonzero(kind == 1)
+    count = min(len(plants), pipelines if pipelines is not None else min(assets // 100, 10_000))
+    pipeline_records = []
+    if count and len(storages):
+        for i, p in enumerate(rng.choice(plants, count, replace=False)):
+            s = storages[int(rng.integers(len(storages)))]
+            if abs(lng[s] - lng[p]) + abs(lat[s] - lat[p]) > 3:
+                s = p
+            mid = [(lng[p] + lng[s]) / 2 + rng.normal(0, 0.02), (lat[p] + lat[s]) / 2 + rng.normal(0, 0.02)]
+            pipeline_records.append({
+                'id': f"pipe{i}",
+                'path': [[float(lng[p]), float(lat[p])], [float(v) for v in mid],
+                         [float(lng[s]) + 0.01, float(lat[s]) + 0.01]],
+                'capacity': float(rng.uniform(20, 200))
+            })
+    return {
+        'id': ids, 'type': names[kind], 'lng': lng, 'lat': lat, 'capacity': capacity,
+        'zones': zone_records, 'pipelines': pipeline_records, 'seed': seed
+    }
+
+def network_records(network: Dict[str, Any]) -> Dict[str, Any]:
+    """The network as an `initialize` payload"""
+    groups = {'plant': 'plants', 'storage': 'storage_facilities', 'demand': 'demand_centers'}
+    data = {'regulatory_zones': network['zones'], 'pipelines': network['pipelines']}
+    for asset_type, key in groups.items():
+        rows = np.flatnonzero(network['type'] == asset_type)
+        amount = 'demand' if asset_type == 'demand' else 'capacity'
+        data[key] = [
+            {'id': asset_id, 'location': [lng, lat, 0.0], amount: capacity}
+            for asset_id, lng, lat, capacity in zip(network['id'][rows].tolist(), network['lng'][rows].tolist(),
+                                                    network['lat'][rows].tolist(),
+                                                    network['capacity'][rows].tolist())
+        ]
+    return data
+
+def write_parquet(network: Dict[str, Any], path: str, row_group_size: int = 1 << 20) -> str:
+    """Asset columns as a Parquet file in the layout `ingest_assets_from_file` reads"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    table = pa.table({key: network[key] for key in ('id', 'type', 'lng', 'lat', 'capacity')})
+    pq.write_table(table, path, row_group_size=row_group_size)
+    return path
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """Latency percentiles over one stage's samples"""
+    values = np.asarray(samples_ms, dtype=np.float64)
+    if not len(values):
+        return {}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        'count': int(len(values)),
+        'mean_ms': round(float(values.mean()), 3),
+        'min_ms': round(float(values.min()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p90_ms': round(float(p90), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(values.max()), 3)
+    }
+
+def time_stage(run: Callable[[int], Any], repeats: int, warmup: int = 1,
+               setup: Optional[Callable[[], None]] = None, memory: bool = True) -> Dict[str, Any]:
+    """Time `run(i)` over `repeats` iterations after `warmup`, then measure its peak traced memory once
+
+    `setup` runs untimed before every iteration. Memory is traced in a separate, untimed iteration
+    because tracemalloc slows allocation-heavy code.
+    """
+    samples, ok = [], True
+    for i in range(warmup + repeats):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = run(i)
+        elapsed = (time.perf_counter() - started) * 1000
+        ok = ok and result is not False
+        if i >= warmup:
+            samples.append(elapsed)
+    stage = dict(summarize(samples), ok=ok, samples_ms=[round(s, 3) for s in samples])
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            run(warmup + repeats)
+            stage['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        finally:
+            tracemalloc.stop()
+    return stage
+
+def benchmark_network(assets: int, zones: int, seed: int = 0, repeats: int = 5, warmup: int = 1,
+                      memory: bool = True, grid: bool = True, workdir: Optional[str] = None) -> Dict[str, Any]:
+    """Benchmark every stage on one synthetic network"""
+    started = time.perf_counter()
+    network = synthetic_network(assets, zones, seed)
+    generate_s = time.perf_counter() - started
+    system = OptimizedHydrogenSystem()
+    stages: Dict[str, Any] = {}
+
+    if assets <= MAX_RECORD_ASSETS:
+        records = network_records(network)
+        stages['initialize'] = time_stage(lambda i: system.initialize(records), repeats, warmup, memory=memory)
+        del records
+    else:
+        stages['initialize'] = {'skipped': f"more than {MAX_RECORD_ASSETS} assets"}
+
+    # Ingestion starts from a network holding only the zones and pipelines, like a fresh deployment
+    base = {'regulatory_zones': network['zones'], 'pipelines': network['pipelines']}
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        path = write_parquet(network, os.path.join(tmp, 'assets.parquet'))
+        stages['ingest'] = time_stage(lambda i: system.ingest_assets_from_file(path, 'parquet', chunksize=1 << 18),
+                                      repeats, warmup, setup=lambda: system.initialize(base), memory=memory)
+        stages['ingest']['rows_per_second'] = round(system.last_ingest_stats.get('rows_per_second', 0))
+
+    # Query stages use distinct seeds so no iteration is served from the result cache
+    stages['plant_siting'] = time_stage(lambda i: system.optimize_plant_location(seed=seed + i), repeats, warmup,
+                                        memory=memory)
+    stages['storage_siting'] = time_stage(lambda i: system.optimize_storage_location(seed=seed + i), repeats,
+                                          warmup, memory=memory)
+    if grid:
+        stages['grid_siting'] = time_stage(lambda i: system.optimize_plant_location(search_mode='grid',
+                                                                                    seed=seed + i),
+                                           repeats, warmup, memory=memory)
+    plants = np.flatnonzero(network['type'] == 'plant')
+    storages = np.flatnonzero(network['type'] == 'storage')
+    rng = np.random.default_rng(seed)
+    pairs = [(int(rng.choice(plants)), int(rng.choice(storages))) for _ in range(warmup + repeats + 1)]
+
+    def route(i: int):
+        p, s = pairs[i]
+        return system.optimize_pipeline_route([network['lng'][p], network['lat'][p]],
+                                              [network['lng'][s], network['lat'][s]], num_recommendations=1)
+
+    stages['pipeline_routing'] = time_stage(route, repeats, warmup, memory=memory)
+    return {
+        'assets': assets,
+        'zones': zones,
+        'pipelines': len(network['pipelines']),
+        'seed': seed,
+        'generate_s': round(generate_s, 3),
+        'network_mb': round(system.nbytes / 2 ** 20, 2),
+        'stages': stages
+    }
+
+def environment() -> Dict[str, Any]:
+    """Host and build details recorded with every result file"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=5,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024, 1)
+
+def run_benchmarks(scales: List[str], seed: int = 0, repeats: int = 5, warmup: int = 1, memory: bool = True,
+                   grid: bool = True, workdir: Optional[str] = None) -> Dict[str, Any]:
+    """Run the suite over named scales (see SCALES) or explicit 'ASSETSxZONES' sizes"""
+    results = []
+    for scale in scales:
+        if scale in SCALES:
+            assets, zones = SCALES[scale]
+        else:
+            assets, zones = (int(float(v)) for v in scale.lower().split('x'))
+        print(f"Benchmarking {scale}: {assets} assets, {zones} zones")
+        result = benchmark_network(assets, zones, seed, repeats, warmup, memory, grid, workdir)
+        result['scale'] = scale
+        for name, stage in result['stages'].items():
+            if 'p50_ms' in stage:
+                peak = f"  peak {stage['peak_mb']:8.1f}MB" if 'peak_mb' in stage else ''
+                print(f"   {name:18s} p50 {stage['p50_ms']:10.2f}ms  p99 {stage['p99_ms']:10.2f}ms{peak}")
+        results.append(result)
+    return {
+        'format': BENCHMARK_FORMAT,
+        'version': BENCHMARK_VERSION,
+        'environment': environment(),
+        'settings': {'seed': seed, 'repeats': repeats, 'warmup': warmup, 'memory': memory},
+        'results': results,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any],
+                    threshold: float = REGRESSION_THRESHOLD) -> List[Dict[str, Any]]:
+    """Stages whose p50 grew by more than `threshold` between two result files, matched by scale and stage"""
+    before = {(r['scale'], r['assets'], r['zones']): r['stages'] for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        stages = before.get((result['scale'], result['assets'], result['zones']))
+        if stages is None:
+            continue
+        for name, stage in result['stages'].items():
+            old = stages.get(name, {}).get('p50_ms')
+            new = stage.get('p50_ms')
+            if old and new is not None and new > old * (1 + threshold):
+                regressions.append({'scale': result['scale'], 'stage': name, 'baseline_p50_ms': old,
+                                    'p50_ms': new, 'change': round(new / old - 1, 3)})
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the hydrogen optimizer on synthetic networks')
+    parser.add_argument('--scales', default='small,medium',
+                        help=f"comma-separated scales ({', '.join(SCALES)}) or ASSETSxZONES sizes")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak-memory pass')
+    parser.add_argument('--no-grid', action='store_true', help='skip the exhaustive grid siting stage')
+    parser.add_argument('--workdir', default=None, help='directory for temporary ingest files')
+    parser.add_argument('--output', default=None, help='write results JSON here')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='report stages that regressed between two result files')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare_results(baseline, current, args.threshold)
+        for r in regressions:
+            print(f"❌ {r['scale']} {r['stage']}: p50 {r['baseline_p50_ms']}ms -> {r['p50_ms']}ms "
+                  f"(+{r['change'] * 100:.0f}%)")
+        print(f"{'✅ No regressions' if not regressions else f'{len(regressions)} regressions'}")
+        return 1 if regressions else 0
+
+    report = run_benchmarks([s.strip() for s in args.scales.split(',') if s.strip()], args.seed, args.repeats,
+                            args.warmup, not args.no_memory, not args.no_grid, args.workdir)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,11 +4,1517 @@ High-performance version with minimal overhead and fast algorithms
 """
 
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Callable, Optional, Tuple
 from dataclasses import dataclass
+import copy
+import functools
+import hashlib
+import heapq
 import json
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import weakref
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import math
+import os
+import re
+import sys
+import time
+import uuid
+
+EARTH_RADIUS_M = 6371000  # Earth radius in meters
+KERNEL_CHUNK_ELEMENTS = 4_000_000  # Max candidate x reference pairs per kernel pass
+METERS_PER_DEGREE = 111320  # Meters per degree of latitude (and of longitude at the equator)
+GRID_SEARCH_DEFAULTS = {
+    'cell_km': None,       # Coarse lattice spacing; derived from max_cells when None
+    'max_cells': 20000,    # Upper bound on the coarse lattice size
+    'padding_km': 30,      # Margin added around the network's bounding box
+    'levels': 2,           # Coarse-to-fine refinement passes
+    'refine_top': 32,      # Best cells refined at each pass
+    'refine_factor': 3     # Spacing divisor per pass
+}
+FACILITY_SEARCH_DEFAULTS = {
+    'cell_km': None,           # Candidate lattice spacing; derived from max_cells when None
+    'max_cells': 5000,         # Upper bound on the candidate lattice size
+    'max_matrix': 10_000_000,  # Upper bound on candidate x demand distance matrix entries
+    'padding_km': 30,          # Margin added around the network's bounding box
+    'capacity': None,          # Capacity per new site; None leaves sites uncapacitated
+    'neighbors': 8,            # Nearest open sites each demand point may be assigned to
+    'max_swaps': 200           # Local-search swap budget
+}
+ROUTE_TILE_CELLS = 64  # Routing grid cells per cached cost-surface tile side
+ROUTE_TARGET_CELLS = 128  # Routing grid cells along the start-end axis
+ROUTE_CORRIDOR_PAD = 0.25  # Corridor margin around start/end as a share of their separation
+ROUTE_ZONE_COST = 0.1  # Per-meter cost added for each net zone penalty point
+ROUTE_MIN_MULTIPLIER = 0.25  # Floor for bonus zones, keeps every edge cost positive
+ROUTE_ALT_PENALTY = 1.6  # Cost multiplier on cells used by earlier routes when seeking alternatives
+ROUTE_ALT_GREED = 1.5  # Weighted-A* heuristic inflation when searching for alternatives
+ROUTE_MAX_OVERLAP = 0.7  # Alternatives running more of their length near an earlier route are dropped
+ROUTE_OVERLAP_CELLS = 3  # Within this many cells of an earlier route counts as the same corridor
+ROUTE_BATCH_TARGET_CELLS = 64  # Batch routing trades grid resolution for one search per origin
+ROUTE_BATCH_MAX_CELLS = 250_000  # Shared window size cap for batch routing (coarser cells beyond it)
+ROUTE_BATCH_MAX_PAIRS = 1000  # Default pair budget for network-wide routing
+SEGMENT_MAX_M = 2000  # Pipeline segments are split to this length for the segment index
+PIPELINE_PROXIMITY_M = 20000  # Distance at which the pipeline proximity bonus fades to zero
+PIPELINE_CORRIDOR_M = 500  # Routes within this distance of a pipeline count as sharing its corridor
+CANDIDATE_CAPACITY = 100  # Capacity assumed for a not-yet-built candidate site
+PARALLEL_MIN_CANDIDATES = 50_000  # Below this, process-pool overhead outweighs the speedup
+FLOW_NEIGHBORS = 8  # Transport arcs from each plant/storage site to its nearest receiving sites
+FLOW_SCALE = 1000  # Integer flow units per unit of capacity
+FLOW_MAX_UNITS = 2 ** 30  # Total flow, in integer units, stays within int32 for the max-flow phases
+FLOW_TRANSPORT_COST = 1.0  # Default transport cost per unit of flow per km (cost_model['transport_cost'])
+FLOW_PIPELINE_COST_FACTOR = 0.2  # Moving flow through an existing pipeline costs this share of transport
+CANDIDATE_REFRESH_MAX_POINTS = 256  # Beyond this many changed points an edit rescores tracked sets in full
+RESULT_CACHE_SIZE = 256  # Seeded recommendation results kept per system
+PROFILE_INTERVAL_S = 0.005  # Stack sampling period while a profile is running
+PROFILE_MAX_WINDOW_S = 300  # Longest time-window profile
+PROFILE_KEEP = 32  # Finished profiles kept in memory
+METRICS_BUCKETS_S = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Stage histogram bounds
+STREAM_FIRST_BATCH = 256  # Candidates in the first streamed batch; later batches double up to batch_size
+STREAM_BATCH_SIZE = 16384  # Default largest streamed batch
+SNAPSHOT_FORMAT = 'hydrogen-network-snapshot'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_LOAD_ATTEMPTS = 3  # Loads restart on the current version when saves prune the one being read
+SNAPSHOT_RETAIN_S = 60  # Replaced snapshot versions stay readable at least this long
+SQL_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+
+def haversine_nearest(lngs: np.ndarray, lats: np.ndarray,
+                      ref_lngs: np.ndarray, ref_lats: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Batched haversine: minimum distance (m) and nearest reference index per candidate"""
+    lat1 = np.radians(np.asarray(lats, dtype=np.float64))
+    lng1 = np.radians(np.asarray(lngs, dtype=np.float64))
+    lat2 = np.radians(np.asarray(ref_lats, dtype=np.float64))
+    lng2 = np.radians(np.asarray(ref_lngs, dtype=np.float64))
+    n = lat1.shape[0]
+    min_dist = np.full(n, np.inf)
+    nearest = np.full(n, -1, dtype=np.int64)
+    if n == 0 or lat2.shape[0] == 0:
+        return min_dist, nearest
+    cos_lat2 = np.cos(lat2)
+    # Chunk over candidates so the pairwise matrix stays bounded in memory
+    step = max(1, KERNEL_CHUNK_ELEMENTS // lat2.shape[0])
+    for lo in range(0, n, step):
+        hi = min(n, lo + step)
+        la = lat1[lo:hi, None]
+        a = (np.sin((lat2 - la) / 2) ** 2
+             + np.cos(la) * cos_lat2 * np.sin((lng2 - lng1[lo:hi, None]) / 2) ** 2)
+        # haversine is monotonic in `a`, so only the winning pair needs asin/sqrt
+        idx = np.argmin(a, axis=1)
+        best = np.clip(a[np.arange(hi - lo), idx], 0.0, 1.0)
+        nearest[lo:hi] = idx
+        min_dist[lo:hi] = EARTH_RADIUS_M * 2 * np.arcsin(np.sqrt(best))
+    return min_dist, nearest
+
+def haversine_matrix(lngs: np.ndarray, lats: np.ndarray,
+                     ref_lngs: np.ndarray, ref_lats: np.ndarray) -> np.ndarray:
+    """Full candidate x reference haversine distance matrix in meters"""
+    lat1 = np.radians(np.asarray(lats, dtype=np.float64))[:, None]
+    lng1 = np.radians(np.asarray(lngs, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(ref_lats, dtype=np.float64))[None, :]
+    lng2 = np.radians(np.asarray(ref_lngs, dtype=np.float64))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_pairwise(lngs: np.ndarray, lats: np.ndarray,
+                       other_lngs: np.ndarray, other_lats: np.ndarray) -> np.ndarray:
+    """Element-wise haversine distance in meters between two equally long point arrays"""
+    lat1, lng1 = np.radians(np.asarray(lats, dtype=np.float64)), np.radians(np.asarray(lngs, dtype=np.float64))
+    lat2 = np.radians(np.asarray(other_lats, dtype=np.float64))
+    lng2 = np.radians(np.asarray(other_lngs, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def _unit_vectors(lngs: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """Project lng/lat degrees onto the unit sphere (chord length is monotonic in great-circle distance)"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lng = np.radians(np.asarray(lngs, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+def hex_lattice(min_lng: float, min_lat: float, max_lng: float, max_lat: float,
+                spacing_m: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Hexagonal lattice of roughly `spacing_m` ground spacing covering a lng/lat box
+
+    Rows are sqrt(3)/2 spacings apart with every other row shifted half a cell; the
+    longitude step widens with latitude so cells keep the same ground area.
+    """
+    row_step = spacing_m * math.sqrt(3) / 2 / METERS_PER_DEGREE
+    row_lats = np.arange(min_lat, max_lat + row_step / 2, row_step)
+    lngs, lats = [], []
+    for r, lat in enumerate(row_lats):
+        step = spacing_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        row = np.arange(min_lng + (step / 2 if r % 2 else 0.0), max_lng + step / 2, step)
+        lngs.append(row)
+        lats.append(np.full(len(row), lat))
+    if not lngs:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(lngs), np.concatenate(lats)
+
+def hex_patches(lngs: np.ndarray, lats: np.ndarray, radius_m: float,
+                spacing_m: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Finer hexagonal patches of `spacing_m` covering +/- `radius_m` around each center"""
+    # One offset template in meters, projected per center with a local equirectangular scale
+    row_dy = np.arange(-radius_m, radius_m + 1e-9, spacing_m * math.sqrt(3) / 2)
+    dx, dy = [], []
+    for r, y in enumerate(row_dy):
+        row = np.arange(-radius_m + (spacing_m / 2 if r % 2 else 0.0), radius_m + 1e-9, spacing_m)
+        dx.append(row)
+        dy.append(np.full(len(row), y))
+    dx, dy = np.concatenate(dx), np.concatenate(dy)
+    lats = np.asarray(lats, dtype=np.float64)[:, None]
+    cos_lat = np.maximum(np.cos(np.radians(lats)), 1e-6)
+    patch_lngs = np.asarray(lngs, dtype=np.float64)[:, None] + dx[None, :] / (METERS_PER_DEGREE * cos_lat)
+    patch_lats = lats + dy[None, :] / METERS_PER_DEGREE
+    return patch_lngs.ravel(), patch_lats.ravel()
+
+def _facility_nearest(open_dist: np.ndarray, far: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Closest and second-closest open facility distance per demand point, plus the closest's row"""
+    n_open, n_demand = open_dist.shape
+    if n_open == 0:
+        return np.full(n_demand, far), np.full(n_demand, far), np.full(n_demand, -1, dtype=np.int64)
+    owner = np.argmin(open_dist, axis=0)
+    cols = np.arange(n_demand)
+    d1 = open_dist[owner, cols]
+    if n_open == 1:
+        return d1, np.full(n_demand, far), owner
+    masked = open_dist.copy()
+    masked[owner, cols] = np.inf
+    return d1, masked.min(axis=0), owner
+
+def facility_location(dist: np.ndarray, demand: np.ndarray, k: int, fixed_dist: Optional[np.ndarray] = None,
+                      max_swaps: int = 200) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Choose k of the candidate rows of a candidate x demand distance matrix (p-median)
+
+    Minimizes total demand-weighted distance to the nearest open site; rows of `fixed_dist`
+    are facilities that are already open. Greedy addition, then best-improvement swaps whose
+    deltas (Resende-Werneck gain/loss/extra terms) are updated only for the demand points
+    whose two nearest open sites a swap changed.
+    """
+    n_cand, n_demand = dist.shape
+    fixed_dist = np.empty((0, n_demand)) if fixed_dist is None else fixed_dist
+    n_fixed = len(fixed_dist)
+    k = min(k, n_cand)
+    w = np.asarray(demand, dtype=np.float64)
+    far = 2.0 * max(float(dist.max()) if dist.size else 0.0, float(fixed_dist.max()) if fixed_dist.size else 0.0) + 1.0
+    stats = {'candidates': n_cand, 'demand_points': n_demand, 'sites': k, 'swaps': 0}
+    if k == 0:
+        stats['objective'] = stats['greedy_objective'] = float(w @ _facility_nearest(fixed_dist, far)[0])
+        return np.zeros(0, dtype=np.int64), stats
+    # Demand-major copy: every update below gathers the candidate distances of a few demand points
+    by_demand = np.ascontiguousarray(dist.T)
+
+    # Greedy: open the candidate with the largest drop in weighted distance, k times
+    d1 = _facility_nearest(fixed_dist, far)[0]
+    gain = w @ np.maximum(d1[:, None] - by_demand, 0.0)
+    chosen = []
+    for _ in range(k):
+        gain[chosen] = -np.inf
+        best = int(np.argmax(gain))
+        chosen.append(best)
+        moved = np.flatnonzero(by_demand[:, best] < d1)
+        sub = by_demand[moved]
+        gain -= w[moved] @ (np.maximum(d1[moved, None] - sub, 0.0) - np.maximum(sub[:, best:best + 1] - sub, 0.0))
+        d1[moved] = by_demand[moved, best]
+    chosen = np.array(chosen, dtype=np.int64)
+    stats['greedy_objective'] = float(w @ d1)
+
+    # Swaps: slot s < n_fixed is an existing facility, n_fixed + j holds chosen[j]
+    slots = n_fixed + k
+    open_rows = lambda: np.vstack((fixed_dist, by_demand[:, chosen].T))
+    d1, d2, owner = _facility_nearest(open_rows(), far)
+    gain, loss, extra = np.zeros(n_cand), np.zeros(slots), np.zeros((slots, n_cand))
+
+    def account(points: np.ndarray, sign: float) -> None:
+        # gain[c]: saving from opening c; loss[s]: cost of closing s; extra[s, c]: overlap of both
+        if not len(points):
+            return
+        points = points[np.argsort(owner[points], kind='stable')]
+        sub, wp = by_demand[points], w[points]
+        gain[:] += sign * (wp @ np.maximum(d1[points, None] - sub, 0.0))
+        loss[:] += sign * np.bincount(owner[points], wp * (d2[points] - d1[points]), slots)
+        share = np.clip(d2[points, None] - np.maximum(sub, d1[points, None]), 0.0, None) * wp[:, None]
+        owners, starts = np.unique(owner[points], return_index=True)
+        extra[owners] += sign * np.add.reduceat(share, starts, axis=0)
+
+    account(np.arange(n_demand), 1.0)
+    objective = float(w @ d1)
+    while stats['swaps'] < max_swaps:
+        delta = loss[:, None] - extra - gain[None, :]
+        delta[:n_fixed] = np.inf
+        delta[:, chosen] = np.inf
+        s, c = np.unravel_index(int(np.argmin(delta)), delta.shape)
+        if not delta[s, c] < -1e-9 * max(objective, 1.0):
+            break
+        chosen[s - n_fixed] = c
+        new_d1, new_d2, new_owner = _facility_nearest(open_rows(), far)
+        changed = np.flatnonzero((new_d1 != d1) | (new_d2 != d2) | (new_owner != owner) | (owner == s))
+        account(changed, -1.0)
+        d1, d2, owner = new_d1, new_d2, new_owner
+        account(changed, 1.0)
+        objective = float(w @ d1)
+        stats['swaps'] += 1
+    stats['objective'] = objective
+    return chosen, stats
+
+def capacitated_assignment(open_dist: np.ndarray, demand: np.ndarray, capacity: np.ndarray,
+                           neighbors: int = 8) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Assign weighted demand to open sites under capacity limits (transportation LP)
+
+    Each demand point may use its `neighbors` nearest sites; whatever they cannot take is
+    left unmet. Returns the (site, demand) amounts, unmet amount per demand point and the
+    weighted distance of the served demand.
+    """
+    from scipy.optimize import linprog
+    from scipy.sparse import csr_matrix
+    n_open, n_demand = open_dist.shape
+    k = min(neighbors, n_open)
+    sites = np.argsort(open_dist, axis=0)[:k]                 # (k, D) nearest site rows
+    cols = np.broadcast_to(np.arange(n_demand), sites.shape)
+    cost = open_dist[sites, cols].ravel()
+    n_vars = cost.size
+    penalty = 10.0 * (float(cost.max()) if n_vars else 0.0) + 1.0
+    # Variables: k assignments per demand point, then one unmet slack per demand point
+    c = np.concatenate((cost, np.full(n_demand, penalty)))
+    a_eq = csr_matrix((np.ones(n_vars + n_demand),
+                       (np.concatenate((cols.ravel(), np.arange(n_demand))), np.arange(n_vars + n_demand))),
+                      shape=(n_demand, n_vars + n_demand))
+    a_ub = csr_matrix((np.ones(n_vars), (sites.ravel(), np.arange(n_vars))), shape=(n_open, n_vars + n_demand))
+    result = linprog(c, A_ub=a_ub, b_ub=capacity, A_eq=a_eq, b_eq=demand, bounds=(0, None), method='highs')
+    if result.status != 0:
+        raise RuntimeError(f"Assignment LP failed: {result.message}")
+    amounts = np.zeros((n_open, n_demand))
+    np.add.at(amounts, (sites.ravel(), cols.ravel()), result.x[:n_vars])
+    return amounts, result.x[n_vars:], float(cost @ result.x[:n_vars])
+
+class Metrics:
+    """Process-wide stage timings and counters, plus per-request traces for the calling thread
+
+    Recording is a perf_counter pair and a short locked update, cheap enough for the scoring hot path.
+    Inside `trace()` the same observations are also summed into the trace, for response metadata.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = METRICS_BUCKETS_S):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages: Dict[str, List] = {}  # name -> [count, seconds, per-bucket counts]
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage `name`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def timed(self, name: str):
+        """Decorator form of `stage` for whole functions"""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe(self, name: str, seconds: float) -> None:
+        slot = int(np.searchsorted(self.buckets, seconds))
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                entry = self._stages[name] = [0, 0.0, [0] * (len(self.buckets) + 1)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2][slot] += 1
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            stages = trace['stages_ms']
+            stages[name] = stages.get(name, 0.0) + seconds * 1000
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None and not labels:
+            trace['counters'][name] = trace['counters'].get(name, 0) + value
+
+    @contextmanager
+    def trace(self):
+        """Collect this thread's stage timings and counters into a dict while the block runs"""
+        previous = getattr(self._local, 'trace', None)
+        trace = {'stages_ms': {}, 'counters': {}}
+        self._local.trace = trace
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace['total_ms'] = (time.perf_counter() - started) * 1000
+            self._local.trace = previous
+
+    @staticmethod
+    def summary(trace: Dict[str, Any]) -> Dict[str, Any]:
+        """A finished trace rounded for response metadata"""
+        return {
+            'total_ms': round(trace.get('total_ms', 0.0), 3),
+            'stages_ms': {name: round(ms, 3) for name, ms in trace['stages_ms'].items()},
+            'counters': dict(trace['counters'])
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def prometheus(self, prefix: str = 'hydrogen_optimizer', gauges: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus text exposition of every stage histogram, counter and the given gauges"""
+        with self._lock:
+            stages = {name: (count, total, list(hits)) for name, (count, total, hits) in self._stages.items()}
+            counters = dict(self._counters)
+        lines = [f"# HELP {prefix}_stage_seconds Time spent per optimizer stage",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        for name in sorted(stages):
+            count, total, hits = stages[name]
+            cumulative = np.cumsum(hits)
+            for bound, seen in zip(self.buckets, cumulative):
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {int(seen)}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {count}')
+        for metric in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {prefix}_{metric}_total counter")
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+                    lines.append(f"{prefix}_{metric}_total{{{label_text}}} {value:g}" if label_text
+                                 else f"{prefix}_{metric}_total {value:g}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class StackSampler:
+    """Statistical profiler: samples the Python stacks of chosen threads into collapsed-stack counts
+
+    Nothing runs until `start`; the sampler thread then wakes every `interval` seconds and walks
+    the target frames. `collapsed()` is the `frame;frame;frame count` format flamegraph.pl and
+    speedscope read.
+    """
+
+    def __init__(self, thread_ids: Optional[List[int]] = None, interval: float = PROFILE_INTERVAL_S):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _label(code) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if self.thread_ids is None:
+                stack.append(names.get(ident, f"thread-{ident}"))
+            self.counts[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> 'StackSampler':
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> 'StackSampler':
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+class ProfileStore:
+    """Per-call and time-window stack profiles, the latest PROFILE_KEEP kept in memory
+
+    With `directory` every finished profile is also written there as `<id>.collapsed`.
+    """
+
+    def __init__(self, directory: Optional[str] = None, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._profiles: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._keep = keep
+        self._window: Optional[str] = None
+
+    def _finish(self, record: Dict[str, Any], sampler: StackSampler) -> Dict[str, Any]:
+        record.update(status='done', samples=sampler.samples, collapsed=sampler.collapsed(),
+                      elapsed_ms=round((time.time() - record['started']) * 1000, 2))
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            record['path'] = os.path.join(self.directory, f"{record['id']}.collapsed")
+            with open(record['path'], 'w') as f:
+                f.write(record['collapsed'])
+        return record
+
+    def _add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._profiles[record['id']] = record
+            while len(self._profiles) > self._keep:
+                self._profiles.popitem(last=False)
+
+    def profile(self, fn, *args, interval: float = PROFILE_INTERVAL_S, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+        """Run `fn` on this thread while sampling only this thread: (result, profile record)"""
+        record = {'id': uuid.uuid4().hex[:12], 'kind': 'call', 'started': time.time(),
+                  'interval_ms': interval * 1000, 'status': 'running'}
+        sampler = StackSampler([threading.get_ident()], interval).start()
+        try:
+            return fn(*args, **kwargs), record
+        finally:
+            self._add(self._finish(record, sampler.stop()))
+
+    def start_window(self, seconds: float, interval: float = PROFILE_INTERVAL_S) -> Optional[Dict[str, Any]]:
+        """Sample every thread for `seconds` in the background; None while another window is running"""
+        seconds = min(max(float(seconds), interval), PROFILE_MAX_WINDOW_S)
+        with self._lock:
+            if self._window is not None:
+                return None
+            record = {'id': uuid.uuid4().hex[:12], 'kind': 'window', 'started': time.time(), 'seconds': seconds,
+                      'interval_ms': interval * 1000, 'status': 'running'}
+            self._window = record['id']
+        self._add(record)
+        sampler = StackSampler(None, interval).start()
+
+        def finish() -> None:
+            self._finish(record, sampler.stop())
+            with self._lock:
+                self._window = None
+
+        timer = threading.Timer(seconds, finish)
+        timer.daemon = True
+        timer.start()
+        return {key: value for key, value in record.items() if key != 'collapsed'}
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{key: value for key, value in record.items() if key != 'collapsed'}
+                    for record in reversed(self._profiles.values())]
+
+class SpatialIndex:
+    """Haversine-correct k-nearest / radius index over lng/lat points.
+
+    Points live in a KD-tree over unit-sphere vectors; appended points sit in a
+    small brute-force buffer until it outgrows a fraction of the tree, then the
+    tree is rebuilt. Without scipy every query falls back to the batched kernels.
+    A `deferred` index adopts its arrays as-is (e.g. memory-mapped) and builds the
+    tree on first query instead of at construction.
+    """
+    MIN_REBUILD = 1024  # Buffered points tolerated before building a tree
+    REBUILD_FRACTION = 0.25  # Rebuild once the buffer exceeds this share of the tree
+
+    def __init__(self, lngs: Optional[np.ndarray] = None, lats: Optional[np.ndarray] = None,
+                 deferred: bool = False):
+        self.lngs = np.empty(0, dtype=np.float64)
+        self.lats = np.empty(0, dtype=np.float64)
+        self._tree = None
+        self._tree_size = 0
+        self._deferred = False
+        self._build_lock = threading.Lock()
+        if lngs is not None and deferred:
+            self.lngs, self.lats = lngs, lats
+            self._deferred = len(self) > 0
+        elif lngs is not None:
+            self.add(lngs, lats)
+
+    def __len__(self) -> int:
+        return self.lngs.shape[0]
+
+    def add(self, lngs: np.ndarray, lats: np.ndarray) -> None:
+        """Append points; indices continue from the current size"""
+        self.lngs = np.concatenate((self.lngs, np.asarray(lngs, dtype=np.float64)))
+        self.lats = np.concatenate((self.lats, np.asarray(lats, dtype=np.float64)))
+        pending = len(self) - self._tree_size
+        if pending >= max(self.MIN_REBUILD, self.REBUILD_FRACTION * self._tree_size):
+            self.rebuild()
+
+    def rebuild(self) -> None:
+        """Fold buffered points into the KD-tree"""
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            return
+        # Median-of-range splits build faster than balanced ones and query no slower on unit vectors
+        tree = cKDTree(_unit_vectors(self.lngs, self.lats), balanced_tree=False)
+        self._tree, self._tree_size = tree, len(self)
+        self._deferred = False
+
+    def _build_deferred(self) -> None:
+        # Concurrent first queries build the tree once; later queries never take the lock
+        with self._build_lock:
+            if self._deferred:
+                self.rebuild()
+
+    def nearest(self, lngs: np.ndarray, lats: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest points per query: (distances in meters, indices), each shaped (n, k)"""
+        if self._deferred:
+            self._build_deferred()
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        n = lngs.shape[0]
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty((n, 0)), np.empty((n, 0), dtype=np.int64)
+        parts_d, parts_i = [], []
+        tree_k = min(k, self._tree_size)
+        if tree_k > 0:
+            chord, idx = self._tree.query(_unit_vectors(lngs, lats), k=tree_k)
+            chord = np.asarray(chord).reshape(n, tree_k)
+            parts_d.append(EARTH_RADIUS_M * 2 * np.arcsin(np.clip(chord / 2, 0.0, 1.0)))
+            parts_i.append(np.asarray(idx, dtype=np.int64).reshape(n, tree_k))
+        lo = self._tree_size
+        if lo < len(self):
+            if k == 1:
+                dist, idx = haversine_nearest(lngs, lats, self.lngs[lo:], self.lats[lo:])
+                parts_d.append(dist[:, None])
+                parts_i.append(idx[:, None] + lo)
+            else:
+                dist = haversine_matrix(lngs, lats, self.lngs[lo:], self.lats[lo:])
+                take = min(k, dist.shape[1])
+                idx = np.argpartition(dist, take - 1, axis=1)[:, :take]
+                parts_d.append(np.take_along_axis(dist, idx, axis=1))
+                parts_i.append(idx + lo)
+        dist = np.concatenate(parts_d, axis=1)
+        idx = np.concatenate(parts_i, axis=1)
+        order = np.argsort(dist, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(dist, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+    def within(self, lng: float, lat: float, radius_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        """All points within radius_m of (lng, lat): (distances in meters, indices), nearest first"""
+        if self._deferred:
+            self._build_deferred()
+        hits = []
+        if self._tree_size > 0:
+            chord = 2 * math.sin(min(radius_m / EARTH_RADIUS_M, math.pi) / 2)
+            hits.append(np.asarray(self._tree.query_ball_point(_unit_vectors([lng], [lat])[0], chord), dtype=np.int64))
+        lo = self._tree_size
+        if lo < len(self):
+            hits.append(np.arange(lo, len(self), dtype=np.int64))
+        idx = np.concatenate(hits) if hits else np.empty(0, dtype=np.int64)
+        dist = haversine_matrix([lng], [lat], self.lngs[idx], self.lats[idx])[0]
+        keep = dist <= radius_m
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind='stable')
+        return dist[order], idx[order]
+
+class SegmentIndex:
+    """Pipeline polylines as short straight segments behind a `SpatialIndex` of segment midpoints.
+
+    Segments are split to at most SEGMENT_MAX_M, so no segment is closer to a point than that
+    point's distance to its midpoint minus half that length. The K nearest midpoints plus this
+    bound give exact nearest-segment answers without scanning every segment.
+    """
+    K = 16  # Midpoint candidates examined per query before falling back to a radius search
+
+    def __init__(self, a_lng: np.ndarray, a_lat: np.ndarray, b_lng: np.ndarray, b_lat: np.ndarray,
+                 owner: np.ndarray):
+        self.a_lng, self.a_lat = np.asarray(a_lng, dtype=np.float64), np.asarray(a_lat, dtype=np.float64)
+        self.b_lng, self.b_lat = np.asarray(b_lng, dtype=np.float64), np.asarray(b_lat, dtype=np.float64)
+        self.owner = np.asarray(owner, dtype=np.int64)
+        self.n_polylines = int(self.owner.max()) + 1 if len(self.owner) else 0
+        lengths = haversine_pairwise(self.a_lng, self.a_lat, self.b_lng, self.b_lat)
+        self.half = float(lengths.max()) / 2 if len(lengths) else 0.0
+        self.index = SpatialIndex((self.a_lng + self.b_lng) / 2, (self.a_lat + self.b_lat) / 2)
+
+    @classmethod
+    def from_polylines(cls, offsets: np.ndarray, vertices: np.ndarray) -> 'SegmentIndex':
+        """Split CSR polylines (vertices[offsets[i]:offsets[i + 1]] is polyline i) into indexed segments"""
+        counts = np.diff(offsets)
+        owner_v = np.repeat(np.arange(len(counts)), counts)
+        same = owner_v[:-1] == owner_v[1:]
+        a, b, owner = vertices[:-1][same], vertices[1:][same], owner_v[:-1][same]
+        # A single-vertex polyline is kept as a zero-length segment so it stays findable
+        single = np.flatnonzero(counts == 1)
+        a = np.concatenate((a, vertices[offsets[single]]))
+        b = np.concatenate((b, vertices[offsets[single]]))
+        owner = np.concatenate((owner, single))
+        pieces = np.maximum(1, np.ceil(haversine_pairwise(a[:, 0], a[:, 1], b[:, 0], b[:, 1]) / SEGMENT_MAX_M))
+        pieces = pieces.astype(np.int64)
+        src = np.repeat(np.arange(len(a)), pieces)
+        k = np.arange(len(src)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        t0 = (k / pieces[src])[:, None]
+        t1 = ((k + 1) / pieces[src])[:, None]
+        start = a[src] + t0 * (b[src] - a[src])
+        end = a[src] + t1 * (b[src] - a[src])
+        index = cls(start[:, 0], start[:, 1], end[:, 0], end[:, 1], owner[src])
+        index.n_polylines = len(counts)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.owner)
+
+    def _project(self, lngs: np.ndarray, lats: np.ndarray, seg: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Distance (m) from each point to segment `seg` and the projection parameter t in [0, 1]
+
+        Uses an equirectangular plane centered on the query point, accurate for short segments.
+        """
+        cos_lat = np.cos(np.radians(lats)) * METERS_PER_DEGREE
+        ax = (self.a_lng[seg] - lngs) * cos_lat
+        ay = (self.a_lat[seg] - lats) * METERS_PER_DEGREE
+        dx = (self.b_lng[seg] - self.a_lng[seg]) * cos_lat
+        dy = (self.b_lat[seg] - self.a_lat[seg]) * METERS_PER_DEGREE
+        length2 = dx * dx + dy * dy
+        t = np.clip(-(ax * dx + ay * dy) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+        return np.hypot(ax + t * dx, ay + t * dy), t
+
+    def nearest(self, lngs: np.ndarray, lats: np.ndarray,
+                max_dist: float = math.inf) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Nearest segment per point: (distance m, segment index, tap-in lng, tap-in lat)
+
+        Exact wherever the true distance is within `max_dist`; beyond it the K-candidate
+        answer is returned as-is. Without segments distances are inf and indices -1.
+        """
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        n = lngs.shape[0]
+        dist = np.full(n, np.inf)
+        seg = np.full(n, -1, dtype=np.int64)
+        t = np.zeros(n)
+        if n == 0 or len(self) == 0:
+            return dist, seg, np.full(n, np.nan), np.full(n, np.nan)
+        k = min(self.K, len(self))
+        step = max(1, KERNEL_CHUNK_ELEMENTS // k)
+        for lo in range(0, n, step):
+            hi = min(n, lo + step)
+            mid_dist, cand = self.index.nearest(lngs[lo:hi], lats[lo:hi], k)
+            d, tt = self._project(lngs[lo:hi, None], lats[lo:hi, None], cand)
+            best = np.argmin(d, axis=1)
+            rows = np.arange(hi - lo)
+            dist[lo:hi], seg[lo:hi], t[lo:hi] = d[rows, best], cand[rows, best], tt[rows, best]
+            if k < len(self):
+                # An unseen segment's midpoint is at least the K-th distance away
+                floor = mid_dist[:, -1] - self.half
+                for q in np.flatnonzero((dist[lo:hi] > floor) & (floor < max_dist)) + lo:
+                    _, near = self.index.within(lngs[q], lats[q], min(dist[q], max_dist) + self.half)
+                    if len(near):
+                        dq, tq = self._project(np.full(len(near), lngs[q]), np.full(len(near), lats[q]), near)
+                        j = int(np.argmin(dq))
+                        if dq[j] < dist[q]:
+                            dist[q], seg[q], t[q] = dq[j], near[j], tq[j]
+        tap_lng = self.a_lng[seg] + t * (self.b_lng[seg] - self.a_lng[seg])
+        tap_lat = self.a_lat[seg] + t * (self.b_lat[seg] - self.a_lat[seg])
+        return dist, seg, tap_lng, tap_lat
+
+    def corridor_overlap(self, lngs: np.ndarray, lats: np.ndarray, buffer_m: float) -> Tuple[float, np.ndarray]:
+        """Share of a polyline's length within `buffer_m` of a segment, and the polylines it runs along"""
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        if len(lngs) < 2 or len(self) == 0:
+            return 0.0, np.empty(0, dtype=np.int64)
+        # Sample every leg at half-buffer spacing (sample midpoints, so each stands for one step)
+        legs = haversine_pairwise(lngs[:-1], lats[:-1], lngs[1:], lats[1:])
+        steps = np.maximum(1, np.ceil(legs / (buffer_m / 2))).astype(np.int64)
+        leg = np.repeat(np.arange(len(legs)), steps)
+        frac = ((np.arange(len(leg)) - np.repeat(np.cumsum(steps) - steps, steps)) + 0.5) / steps[leg]
+        sample_lng = lngs[leg] + frac * (lngs[leg + 1] - lngs[leg])
+        sample_lat = lats[leg] + frac * (lats[leg + 1] - lats[leg])
+        dist, seg, _, _ = self.nearest(sample_lng, sample_lat, buffer_m)
+        inside = dist <= buffer_m
+        total = float(legs.sum())
+        share = float((legs[leg] / steps[leg])[inside].sum()) / total if total > 0 else float(inside.all())
+        return share, np.unique(self.owner[seg[inside]])
+
+class ZoneIndex:
+    """Regulatory zones compiled once into prepared polygons behind a shapely STRtree"""
+
+    def __init__(self, zones: List[Dict], geoms: Optional[np.ndarray] = None):
+        import shapely
+        self.zones = zones
+        if geoms is None:
+            # Assume zone is a dict with 'polygon' (list of [lng,lat]) and 'penalty' or 'bonus'
+            geoms = np.array([shapely.Polygon(zone.get('polygon', [])) for zone in zones], dtype=object)
+        self.geoms = geoms
+        self.penalty = np.array([zone.get('penalty', 0) for zone in zones], dtype=np.float64)
+        self.bonus = np.array([zone.get('bonus', 0) for zone in zones], dtype=np.float64)
+        shapely.prepare(self.geoms)
+        self.tree = shapely.STRtree(self.geoms)
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    def pairs(self, lngs: np.ndarray, lats: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(point index, zone index) for every point-in-zone hit, sorted by point then zone"""
+        import shapely
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        if lngs.shape[0] == 0 or not self.zones:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # Bounding-box candidates from the tree, then exact tests on the prepared polygons
+        pts, zone = self.tree.query(shapely.points(lngs, lats))
+        metrics.count('zone_tests', len(zone))
+        inside = shapely.contains_xy(self.geoms[zone], lngs[pts], lats[pts])
+        pts, zone = pts[inside], zone[inside]
+        order = np.lexsort((zone, pts))
+        return pts[order], zone[order]
+
+    def containing(self, lngs: np.ndarray, lats: np.ndarray) -> List[np.ndarray]:
+        """Zone indices (in zone order) containing each point, vectorized over the whole array"""
+        pts, zone = self.pairs(lngs, lats)
+        return np.split(zone, np.searchsorted(pts, np.arange(1, len(lngs))))
+
+    def adjustments(self, lngs: np.ndarray, lats: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Per point: summed bonus minus penalty of containing zones, and number of containing zones"""
+        n = len(lngs)
+        pts, zone = self.pairs(lngs, lats)
+        adjust = np.bincount(pts, weights=self.bonus[zone] - self.penalty[zone], minlength=n)
+        return adjust, np.bincount(pts, minlength=n)
+
+    def cell_adjustments(self, lngs: np.ndarray, lats: np.ndarray, half: float) -> np.ndarray:
+        """Per square cell (center, half side): summed bonus of zones containing the center minus
+        the penalty of every zone the cell touches, so a path between clear cells stays clear
+        """
+        import shapely
+        pts, zone = self.pairs(lngs, lats)
+        adjust = np.bincount(pts, weights=self.bonus[zone], minlength=len(lngs)).astype(np.float64)
+        if len(lngs) and (self.penalty > 0).any():
+            cell, zone = self.tree.query(shapely.box(lngs - half, lats - half, lngs + half, lats + half),
+                                         predicate='intersects')
+            metrics.count('zone_tests', len(zone))
+            adjust -= np.bincount(cell, weights=self.penalty[zone], minlength=len(lngs))
+        return adjust
+
+    def crossed_by(self, line) -> np.ndarray:
+        """Indices (in zone order) of zones a shapely line intersects"""
+        if not self.zones:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(self.tree.query(line, predicate='intersects'))
+
+def score_arrays(lngs: np.ndarray, lats: np.ndarray, plant_index: SpatialIndex, n_plants: int,
+                 zone_index: ZoneIndex, cost_model: Dict[str, float], weights: Dict[str, float],
+                 constraints: Dict[str, Any], safety: np.ndarray,
+                 segment_index: Optional[SegmentIndex] = None) -> Dict[str, np.ndarray]:
+    """Vectorized candidate scoring: the array form of `OptimizedHydrogenSystem._fast_scoring`"""
+    n = len(lngs)
+    metrics.count('candidates_scored', n)
+    score = np.full(n, 100.0)
+    # Distance to nearest plant
+    use_distance = n_plants > 0 and weights.get('distance_weight', 0.3) > 0
+    if use_distance:
+        with metrics.stage('distance'):
+            dists, idx = plant_index.nearest(lngs, lats, 1)
+        min_dist, nearest = dists[:, 0], idx[:, 0]
+        score[min_dist > 100000] -= 30
+        score[min_dist < 5000] += 20
+    else:
+        min_dist, nearest = np.full(n, np.nan), np.full(n, -1, dtype=np.int64)
+    # Regulatory zone penalty/bonus
+    with metrics.stage('zone_checks'):
+        zone_adjust, zone_count = zone_index.adjustments(lngs, lats)
+    score += zone_adjust
+    # Proximity to existing pipelines (opt-in through 'pipeline_weight')
+    pipeline_weight = weights.get('pipeline_weight', 0)
+    if pipeline_weight > 0 and segment_index is not None and len(segment_index):
+        with metrics.stage('pipeline_distance'):
+            pipeline_dist = segment_index.nearest(lngs, lats, PIPELINE_PROXIMITY_M)[0]
+        # Only exact within the proximity radius; beyond it no pipeline counts, so edits cannot leave it stale
+        pipeline_dist[pipeline_dist > PIPELINE_PROXIMITY_M] = np.inf
+        score += pipeline_weight * np.clip(1 - pipeline_dist / PIPELINE_PROXIMITY_M, 0.0, 1.0)
+    else:
+        pipeline_dist = np.full(n, np.inf)
+    # Cost model
+    cost = cost_model.get('base_cost', 100) + cost_model.get('distance_cost', 0.01) * (min_dist if use_distance else np.zeros(n))
+    over_cost = cost > constraints['max_cost'] if 'max_cost' in constraints else np.zeros(n, dtype=bool)
+    score[over_cost] -= 50
+    # Custom constraints (candidates carry the default capacity)
+    below_capacity = constraints.get('min_capacity', 0) > 0 and CANDIDATE_CAPACITY < constraints['min_capacity']
+    if below_capacity:
+        score -= 20
+    # Basic safety check (simulated)
+    score *= safety / 100
+    # Capacity bonus
+    if n_plants < 3:
+        score += 10
+    return {
+        'score': np.maximum(0, score),
+        'min_dist': min_dist,
+        'nearest': nearest,
+        'zone_count': zone_count,
+        'cost': cost,
+        'over_cost': over_cost,
+        'safety': safety,
+        'below_capacity': np.full(n, below_capacity),
+        'pipeline_dist': pipeline_dist
+    }
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` highest scores, best first; ties keep index order like a stable descending sort"""
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        # Partial selection: everything above the k-th best score, then the earliest ties at it
+        kth = np.partition(scores, n - k)[n - k]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        picked = np.sort(np.concatenate((above, ties)))
+        return picked[np.argsort(-scores[picked], kind='stable')]
+    return np.argsort(-scores, kind='stable')
+
+class TopK:
+    """Bounded best-`k` buffer over scored candidate batches, in arrival order for ties"""
+
+    def __init__(self, k: int):
+        self.k = max(int(k), 0)
+        self.lngs = self.lats = self.alts = None
+        self.scored: Optional[Dict[str, np.ndarray]] = None
+        self.seen = 0
+        self.batches = 0
+
+    def __len__(self) -> int:
+        return 0 if self.lngs is None else len(self.lngs)
+
+    def push(self, lngs: np.ndarray, lats: np.ndarray, alts: np.ndarray, scored: Dict[str, np.ndarray]) -> bool:
+        """Merge one scored batch; True when the best `k` changed"""
+        with metrics.stage('sort'):
+            return self._merge(lngs, lats, alts, scored)
+
+    def _merge(self, lngs: np.ndarray, lats: np.ndarray, alts: np.ndarray, scored: Dict[str, np.ndarray]) -> bool:
+        self.seen += len(lngs)
+        self.batches += 1
+        best = top_k_indices(scored['score'], self.k)
+        if not len(best):
+            return False
+        lngs, lats, alts = lngs[best], lats[best], alts[best]
+        scored = {key: values[best] for key, values in scored.items()}
+        if self.lngs is None:
+            self.lngs, self.lats, self.alts, self.scored = lngs, lats, alts, scored
+            return True
+        # Held entries come first, so an incoming tie never displaces an earlier candidate
+        score = np.concatenate((self.scored['score'], scored['score']))
+        keep = top_k_indices(score, self.k)
+        if np.array_equal(keep, np.arange(len(self))):
+            return False
+        self.lngs = np.concatenate((self.lngs, lngs))[keep]
+        self.lats = np.concatenate((self.lats, lats))[keep]
+        self.alts = np.concatenate((self.alts, alts))[keep]
+        self.scored = {key: np.concatenate((values, scored[key]))[keep] for key, values in self.scored.items()}
+        return True
+
+def _attach_block(spec: Tuple[str, Tuple[int, ...], str]):
+    """Map a shared memory block described by (name, shape, dtype) as a NumPy array"""
+    from multiprocessing import shared_memory
+    name, shape, dtype = spec
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: workers share the owner's resource tracker, so registering again is harmless
+        shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+_WORKER_STATE: Dict[str, Any] = {}
+
+def _init_scoring_worker(specs: Dict[str, Tuple], n_plants: int, cost_model: Dict[str, float]) -> None:
+    import shapely
+    blocks = {name: _attach_block(spec) for name, spec in specs.items()}
+    arrays = {name: array for name, (_, array) in blocks.items()}
+    blob, offsets = arrays['zone_wkb'], arrays['zone_offsets']
+    geoms = np.array(shapely.from_wkb([bytes(blob[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]),
+                     dtype=object)
+    zones = [{'penalty': p, 'bonus': b} for p, b in zip(arrays['zone_penalty'], arrays['zone_bonus'])]
+    _WORKER_STATE.update(
+        blocks=blocks,
+        plant_index=SpatialIndex(arrays['plant_lng'], arrays['plant_lat'], deferred=True),
+        zone_index=ZoneIndex(zones, geoms),
+        segment_index=SegmentIndex(arrays['seg_a_lng'], arrays['seg_a_lat'], arrays['seg_b_lng'],
+                                   arrays['seg_b_lat'], arrays['seg_owner']),
+        n_plants=n_plants,
+        cost_model=cost_model
+    )
+
+def _score_shard(call_specs: Dict[str, Tuple], lo: int, hi: int, weights: Dict[str, float],
+                 constraints: Dict[str, Any]) -> int:
+    """Score candidates [lo, hi) of the shared candidate block into the shared output block"""
+    blocks = {name: _attach_block(spec) for name, spec in call_specs.items()}
+    try:
+        lngs, lats = blocks['lng'][1][lo:hi], blocks['lat'][1][lo:hi]
+        result = score_arrays(lngs, lats, _WORKER_STATE['plant_index'], _WORKER_STATE['n_plants'],
+                              _WORKER_STATE['zone_index'], _WORKER_STATE['cost_model'], weights, constraints,
+                              blocks['safety'][1][lo:hi],
+                              _WORKER_STATE['segment_index'])
+        for name, values in result.items():
+            blocks[f'out_{name}'][1][lo:hi] = values
+        return hi - lo
+    finally:
+        for shm, _ in blocks.values():
+            shm.close()
+
+class ParallelScorer:
+    """Process-pool scoring over one pinned network state.
+
+    Plant coordinates and compiled zones are copied once into shared memory blocks that
+    each worker maps at start-up; candidates and results travel through per-call shared
+    blocks, so tasks carry only shard offsets and the scoring parameters.
+    """
+    OUTPUTS = (('score', np.float64), ('min_dist', np.float64), ('nearest', np.int64), ('zone_count', np.int64),
+               ('cost', np.float64), ('over_cost', np.bool_), ('safety', np.float64), ('below_capacity', np.bool_),
+               ('pipeline_dist', np.float64))
+
+    def __init__(self, state: 'NetworkState', workers: int, shard_size: int = 65536):
+        import shapely
+        self.state = state
+        self.workers = workers
+        self.shard_size = shard_size
+        zone_index = state.zone_index
+        wkb = shapely.to_wkb(zone_index.geoms) if len(zone_index) else []
+        static = {
+            'plant_lng': state.plants.lng,
+            'plant_lat': state.plants.lat,
+            'zone_wkb': np.frombuffer(b''.join(wkb), dtype=np.uint8),
+            'zone_offsets': np.cumsum([0] + [len(b) for b in wkb], dtype=np.int64),
+            'zone_penalty': zone_index.penalty,
+            'zone_bonus': zone_index.bonus
+        }
+        segments = state.segment_index
+        static.update(seg_a_lng=segments.a_lng, seg_a_lat=segments.a_lat, seg_b_lng=segments.b_lng,
+                      seg_b_lat=segments.b_lat, seg_owner=segments.owner)
+        self._blocks, specs = self._share(static)
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_scoring_worker,
+                                        initargs=(specs, len(state.plants), state.cost_model))
+        self._finalizer = weakref.finalize(self, ParallelScorer._release, self.pool, self._blocks)
+
+    @staticmethod
+    def _share(arrays: Dict[str, np.ndarray]):
+        """Copy arrays into fresh shared memory blocks: ({name: block}, {name: (block name, shape, dtype)})"""
+        from multiprocessing import shared_memory
+        blocks, specs = {}, {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+            blocks[name] = shm
+            specs[name] = (shm.name, array.shape, array.dtype.str)
+        return blocks, specs
+
+    @staticmethod
+    def _release(pool, blocks) -> None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        for shm in blocks.values():
+            shm.close()
+            shm.unlink()
+
+    def close(self) -> None:
+        self._finalizer()
+
+    def score(self, lngs: np.ndarray, lats: np.ndarray, weights: Dict[str, float],
+              constraints: Dict[str, Any], safety: np.ndarray) -> Dict[str, np.ndarray]:
+        """Score a candidate array across the pool; same result layout as `score_arrays`
+
+        Safety scores are drawn by the caller, so results do not depend on how work is sharded.
+        """
+        n = len(lngs)
+        # Workers record into their own process; count the batch here
+        metrics.count('candidates_scored', n)
+        arrays = {'lng': np.asarray(lngs, dtype=np.float64), 'lat': np.asarray(lats, dtype=np.float64),
+                  'safety': np.asarray(safety, dtype=np.float64)}
+        arrays.update((f'out_{name}', np.empty(n, dtype=dtype)) for name, dtype in self.OUTPUTS)
+        blocks, specs = self._share(arrays)
+        try:
+            futures = [self.pool.submit(_score_shard, specs, lo, min(n, lo + self.shard_size), weights, constraints)
+                       for lo in range(0, n, self.shard_size)]
+            for future in futures:
+                future.result()
+            return {name: np.ndarray(n, dtype=dtype, buffer=blocks[f'out_{name}'].buf).copy()
+                    for name, dtype in self.OUTPUTS}
+        finally:
+            for shm in blocks.values():
+                shm.close()
+                shm.unlink()
+
+class RouteCostSurface:
+    """Per-cell route cost multipliers on a global lng/lat grid, rasterized tile by tile and cached
+
+    Cells are `cell_deg` squares aligned to (0, 0), so every query on the same grid level
+    reuses the tiles earlier routes already rasterized against the zone index.
+    """
+
+    def __init__(self, zone_index: ZoneIndex, max_tiles: int = 1024):
+        self.zone_index = zone_index
+        self.max_tiles = max_tiles
+        self._tiles: 'OrderedDict[Tuple[float, int, int], np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _tile(self, cell_deg: float, ty: int, tx: int) -> np.ndarray:
+        key = (cell_deg, ty, tx)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return tile
+        # Rasterize outside the lock; a concurrent miss on the same tile just computes it twice
+        n = ROUTE_TILE_CELLS
+        centers = np.arange(n) + 0.5
+        grid_lng, grid_lat = np.meshgrid((tx * n + centers) * cell_deg, (ty * n + centers) * cell_deg)
+        adjust = self.zone_index.cell_adjustments(grid_lng.ravel(), grid_lat.ravel(), cell_deg / 2)
+        tile = np.maximum(1.0 - ROUTE_ZONE_COST * adjust, ROUTE_MIN_MULTIPLIER).reshape(n, n)
+        tile.setflags(write=False)
+        with self._lock:
+            self.misses += 1
+            self._tiles[key] = tile
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def window(self, cell_deg: float, row0: int, col0: int, rows: int, cols: int) -> np.ndarray:
+        """Multipliers for global grid rows [row0, row0 + rows) and columns [col0, col0 + cols)"""
+        if not len(self.zone_index):
+            return np.ones((rows, cols))
+        n = ROUTE_TILE_CELLS
+        out = np.empty((rows, cols))
+        for ty in range(row0 // n, (row0 + rows - 1) // n + 1):
+            r0, r1 = max(row0, ty * n), min(row0 + rows, (ty + 1) * n)
+            for tx in range(col0 // n, (col0 + cols - 1) // n + 1):
+                c0, c1 = max(col0, tx * n), min(col0 + cols, (tx + 1) * n)
+                tile = self._tile(cell_deg, ty, tx)
+                out[r0 - row0:r1 - row0, c0 - col0:c1 - col0] = tile[r0 - ty * n:r1 - ty * n, c0 - tx * n:c1 - tx * n]
+        return out
+
+def grid_astar(mult: np.ndarray, dx: np.ndarray, dy: float,
+               start: int, goal: int, greed: float = 1.0) -> Tuple[List[int], float, int]:
+    """8-connected A* over a cost-multiplier raster
+
+    `dx[r]` is the east-west cell width (m) of row r and `dy` the cell height; an edge costs its
+    length times the mean multiplier of its two cells. `greed` > 1 inflates the heuristic
+    (weighted A*: faster, at most `greed` times the optimal cost).
+    Returns (flat cell path, cost, nodes expanded).
+    """
+    rows, cols = mult.shape
+    m = mult.ravel().tolist()
+    dxs = dx.tolist()
+    # Diagonal length between row r and r + 1
+    diag = [math.hypot((dxs[r] + dxs[min(r + 1, rows - 1)]) / 2, dy) for r in range(rows)]
+    # Octile distance with the narrowest cell and cheapest multiplier never overestimates
+    dx_min, m_min = float(dx.min()), float(mult.min()) * greed
+    diag_min = math.hypot(dx_min, dy)
+    goal_r, goal_c = divmod(goal, cols)
+
+    def h(r: int, c: int) -> float:
+        ac, ar = abs(c - goal_c), abs(r - goal_r)
+        short = min(ac, ar)
+        return m_min * (dx_min * (ac - short) + dy * (ar - short) + diag_min * short)
+
+    n = rows * cols
+    best = [math.inf] * n
+    parent = [-1] * n
+    done = bytearray(n)
+    best[start] = 0.0
+    # Per row: (flat offset, row step, column step, edge length) for the 8 neighbours
+    moves = [[(dr * cols + dc, dr, dc, dxs[r] if dr == 0 else dy if dc == 0 else diag[r if dr > 0 else max(r - 1, 0)])
+              for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc] for r in range(rows)]
+    # Ties on f go to the deeper node (larger g), which keeps open-field searches narrow
+    heap = [(h(*divmod(start, cols)), -0.0, start)]
+    push, pop = heapq.heappush, heapq.heappop
+    expanded = 0
+    while heap:
+        f, g, node = pop(heap)
+        g = -g
+        if node == goal:
+            path = [node]
+            while parent[path[-1]] != -1:
+                path.append(parent[path[-1]])
+            return path[::-1], g, expanded
+        if done[node]:
+            continue
+        done[node] = 1
+        expanded += 1
+        r, c = divmod(node, cols)
+        m_here = m[node]
+        for step, dr, dc, length in moves[r]:
+            nr, nc = r + dr, c + dc
+            if nr < 0 or nr >= rows or nc < 0 or nc >= cols:
+                continue
+            nxt = node + step
+            if done[nxt]:
+                continue
+            ng = g + length * (m_here + m[nxt]) / 2
+            if ng < best[nxt]:
+                best[nxt] = ng
+                parent[nxt] = node
+                ac, ar = abs(nc - goal_c), abs(nr - goal_r)
+                short = ac if ac < ar else ar
+                push(heap, (ng + m_min * (dx_min * (ac - short) + dy * (ar - short) + diag_min * short), -ng, nxt))
+    return [], math.inf, expanded
+
+def _segment_samples(r0: int, c0: int, r1: int, c1: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Cells under a straight segment between two cell centers, sampled at half-cell steps"""
+    steps = 2 * max(abs(r1 - r0), abs(c1 - c0)) + 1
+    t = (np.arange(steps) + 0.5) / steps
+    return np.rint(r0 + t * (r1 - r0)).astype(np.int64), np.rint(c0 + t * (c1 - c0)).astype(np.int64)
+
+def _segment_cost(mult: np.ndarray, dx: np.ndarray, dy: float, r0: int, c0: int, r1: int, c1: int) -> float:
+    """Cost of a straight segment between two cell centers"""
+    rows, cols = _segment_samples(r0, c0, r1, c1)
+    length = math.hypot((c1 - c0) * dx[(r0 + r1) // 2], (r1 - r0) * dy)
+    values = mult[rows, cols]
+    return length * float(values.sum()) / len(values)
+
+def _smooth_cells(path: List[int], mult: np.ndarray, dx: np.ndarray, dy: float,
+                  blocked: Optional[Callable[[int, int], bool]] = None) -> Tuple[List[int], float, float]:
+    """Replace grid staircases with straight shortcuts that cost no more than the cells they skip
+
+    `blocked(i, j)`, if given, vetoes the shortcut between path positions i and j. Returns the
+    kept cells, the weighted cost and the plain length (m) of the smoothed path.
+    """
+    cols = mult.shape[1]
+    rows_, cols_ = np.divmod(np.asarray(path, dtype=np.int64), cols)
+    rc = list(zip(rows_.tolist(), cols_.tolist()))
+    # Cost along the grid path (A* edge costs), so a shortcut can be compared with the stretch it replaces
+    flat = mult.ravel()[path]
+    steps = np.hypot(np.diff(cols_) * dx[(rows_[:-1] + rows_[1:]) // 2], np.diff(rows_) * dy)
+    along = np.concatenate(([0.0], np.cumsum(steps * (flat[:-1] + flat[1:]) / 2))).tolist()
+    last = len(path) - 1
+
+    def shortcut(i: int, j: int) -> Optional[float]:
+        if blocked is not None and blocked(i, j):
+            return None
+        cost = _segment_cost(mult, dx, dy, *rc[i], *rc[j])
+        # Small relative slack absorbs the row-to-row change in cell width
+        return cost if cost <= (along[j] - along[i]) * (1 + 1e-3) else None
+
+    kept, cost, length, i = [0], 0.0, 0.0, 0
+    while i < last:
+        # Gallop outwards to the first rejected shortcut, then bisect back to the last accepted one
+        j, step, width, bad = i + 1, along[i + 1] - along[i], 1, None
+        while j < last:
+            probe = min(j + width, last)
+            probe_cost = shortcut(i, probe)
+            if probe_cost is None:
+                bad = probe
+                break
+            j, step, width = probe, probe_cost, width * 2
+        while bad is not None and bad - j > 1:
+            mid = (j + bad) // 2
+            mid_cost = shortcut(i, mid)
+            if mid_cost is None:
+                bad = mid
+            else:
+                j, step = mid, mid_cost
+        kept.append(j)
+        cost += step
+        length += math.hypot((rc[j][1] - rc[i][1]) * dx[(rc[i][0] + rc[j][0]) // 2], (rc[j][0] - rc[i][0]) * dy)
+        i = j
+    return [path[k] for k in kept], cost, length
+
+def _route_graph(mult: np.ndarray, dx: np.ndarray, dy: float):
+    """8-connected routing graph over a multiplier raster as a symmetric sparse matrix
+
+    Edge costs match `grid_astar`: length times the mean multiplier of the two cells.
+    """
+    from scipy.sparse import csr_matrix
+    rows, cols = mult.shape
+    idx = np.arange(rows * cols).reshape(rows, cols)
+    diag = np.hypot((dx[:-1] + dx[1:]) / 2, dy)
+    heads, tails, costs = [], [], []
+    for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        c_lo, c_hi = max(0, -dc), cols - max(0, dc)
+        a = idx[:rows - dr, c_lo:c_hi]
+        b = idx[dr:, c_lo + dc:c_hi + dc]
+        if dr == 0:
+            length = np.broadcast_to(dx[:, None], a.shape)
+        elif dc == 0:
+            length = np.full(a.shape, dy)
+        else:
+            length = np.broadcast_to(diag[:, None], a.shape)
+        heads.append(a.ravel())
+        tails.append(b.ravel())
+        costs.append((length * (mult.ravel()[a] + mult.ravel()[b]) / 2).ravel())
+    # Both directions stored, so searches run as directed and skip a per-call symmetrization
+    heads, tails, costs = np.concatenate(heads), np.concatenate(tails), np.concatenate(costs)
+    return csr_matrix((np.concatenate((costs, costs)), (np.concatenate((heads, tails)), np.concatenate((tails, heads)))),
+                      shape=(rows * cols, rows * cols))
+
+def _route_sources(mult: np.ndarray, dx: np.ndarray, dy: float, sources: List[int],
+                   targets: List[List[int]], graph=None) -> List[List[List[int]]]:
+    """Cell paths from each source to each of its targets: one one-to-many Dijkstra per source
+
+    Each search stops past a bound taken from the straight-line costs to its targets, and
+    only re-runs unbounded if some target lies beyond it.
+    """
+    from scipy.sparse.csgraph import dijkstra
+    if graph is None:
+        graph = _route_graph(mult, dx, dy)
+    cols = mult.shape[1]
+    paths = []
+    for src, dsts in zip(sources, targets):
+        r0, c0 = divmod(src, cols)
+        # Staircases run up to 1/cos(22.5 deg) longer than the straight line; leave extra slack for zones
+        bound = 1.25 * max(_segment_cost(mult, dx, dy, r0, c0, *divmod(dst, cols)) for dst in dsts) + 1.0
+        _, parents = dijkstra(graph, indices=src, return_predecessors=True, limit=bound)
+        if any(parents[dst] < 0 and dst != src for dst in dsts):
+            _, parents = dijkstra(graph, indices=src, return_predecessors=True)
+        found = []
+        for dst in dsts:
+            path = [dst]
+            while path[-1] != src and path[-1] >= 0:
+                path.append(int(parents[path[-1]]))
+            found.append(path[::-1] if path[-1] == src else [])
+        paths.append(found)
+    return paths
+
+class FlowNetwork:
+    """Min-cost flow network over plants, storage sites, demand centers and pipelines
+
+    Node 0 is a super source feeding every plant up to its capacity and node 1 a super
+    sink fed by every demand center up to its demand (by storage sites when there are no
+    demand centers). Plants ship to their nearest storage sites and demand centers, and
+    storage sites to their nearest demand centers; pipelines add cheap arcs between the
+    sites nearest their two ends. A direct source-to-sink arc at a prohibitive cost keeps
+    every instance feasible and carries the unmet demand.
+
+    Amounts are integers in units of 1 / `scale`, so solutions are exact and can be carried
+    over to an edited network as a warm start (`warm_start` + `repair`).
+    """
+    SUPPLY, TRUCK, STORE, SINK, UNMET, PIPE = range(6)
+
+    def __init__(self, keys: np.ndarray, tail: np.ndarray, head: np.ndarray, kind: np.ndarray,
+                 cost: np.ndarray, cap: np.ndarray, distance: np.ndarray, ref: np.ndarray, scale: float):
+        self.keys = keys
+        self.tail, self.head, self.kind = tail, head, kind
+        self.cost, self.cap = cost, cap
+        self.distance, self.ref = distance, ref
+        self.scale = scale
+        self.n_nodes = len(keys)
+        self._layout: Optional[Tuple[np.ndarray, ...]] = None
+        self.supply = np.zeros(self.n_nodes, dtype=np.int64)
+        demand = int(cap[kind == self.SINK].sum())
+        self.supply[0], self.supply[1] = demand, -demand
+        self.tol = 1e-9 * max(1.0, float(np.abs(cost).max()) if len(cost) else 1.0)
+
+    @classmethod
+    def from_state(cls, state: 'NetworkState', neighbors: int = 8) -> 'FlowNetwork':
+        plants, storages, demands = state.plants, state.storages, state.demands
+        n_p, n_s, n_d = len(plants), len(storages), len(demands)
+        plant0, store_in0, store_out0, demand0 = 2, 2 + n_p, 2 + n_p + n_s, 2 + n_p + 2 * n_s
+        keys = np.array(['S', 'T'] + [f'plant:{i}' for i in plants.ids]
+                        + [f'storage_in:{i}' for i in storages.ids] + [f'storage_out:{i}' for i in storages.ids]
+                        + [f'demand:{i}' for i in demands.ids], dtype=object)
+        # Demand centers are the sinks; without any, storage sites are filled instead
+        sink_rows = demands if n_d else storages
+        total = max(float(plants.capacity.sum()), float(sink_rows.capacity.sum()), 1.0)
+        scale = min(FLOW_SCALE, FLOW_MAX_UNITS / total)
+        units = lambda values: np.rint(np.asarray(values, dtype=np.float64) * scale).astype(np.int64)
+        big = int(units(plants.capacity).sum())
+        arcs = []
+
+        def add(tail, head, kind, cap, distance=0.0, ref=-1, cost=None):
+            tail, head = np.asarray(tail, dtype=np.int64), np.asarray(head, dtype=np.int64)
+            n = len(tail)
+            distance = np.broadcast_to(np.asarray(distance, dtype=np.float64), n)
+            arcs.append((tail, head, np.full(n, kind, dtype=np.int8),
+                         distance / 1000 * transport if cost is None else np.broadcast_to(cost, n),
+                         np.broadcast_to(np.asarray(cap, dtype=np.int64), n),
+                         distance, np.broadcast_to(np.asarray(ref, dtype=np.int64), n)))
+
+        def nearest_arcs(src_lng, src_lat, src0, index, dst0, kind):
+            k = min(neighbors, len(index))
+            if not len(src_lng) or not k:
+                return
+            dists, idx = index.nearest(src_lng, src_lat, k)
+            add(np.repeat(np.arange(len(src_lng)) + src0, k), idx.ravel() + dst0, kind, big, dists.ravel())
+
+        transport = state.cost_model.get('transport_cost', FLOW_TRANSPORT_COST)
+        add(np.zeros(n_p), np.arange(n_p) + plant0, cls.SUPPLY, units(plants.capacity), cost=0.0)
+        nearest_arcs(plants.lng, plants.lat, plant0, state.storage_index, store_in0, cls.TRUCK)
+        nearest_arcs(plants.lng, plants.lat, plant0, state.demand_index, demand0, cls.TRUCK)
+        nearest_arcs(storages.lng, storages.lat, store_out0, state.demand_index, demand0, cls.TRUCK)
+        add(np.arange(n_s) + store_in0, np.arange(n_s) + store_out0, cls.STORE, units(storages.capacity), cost=0.0)
+        sink0 = demand0 if n_d else store_out0
+        add(np.arange(len(sink_rows)) + sink0, np.ones(len(sink_rows)), cls.SINK, units(sink_rows.capacity), cost=0.0)
+
+        # Pipelines connect the sites nearest their two ends, in both directions
+        offsets, vertices = state.pipeline_offsets, state.pipeline_vertices
+        if len(offsets) > 1 and len(keys) > 2:
+            ends = np.concatenate((vertices[offsets[:-1]], vertices[offsets[1:] - 1]))
+            site_lng = np.concatenate((plants.lng, storages.lng, demands.lng))
+            site_lat = np.concatenate((plants.lat, storages.lat, demands.lat))
+            sites = SpatialIndex(site_lng, site_lat)
+            gap, site = sites.nearest(ends[:, 0], ends[:, 1], 1)
+            gap, site = gap[:, 0], site[:, 0]
+            # Site row -> (outgoing node, incoming node); storage flows leave from storage_out
+            out_node = np.concatenate((np.arange(n_p) + plant0, np.arange(n_s) + store_out0, np.arange(n_d) + demand0))
+            in_node = np.concatenate((np.arange(n_p) + plant0, np.arange(n_s) + store_in0, np.arange(n_d) + demand0))
+            n_pipes = len(offsets) - 1
+            a, b = site[:n_pipes], site[n_pipes:]
+            linked = (gap[:n_pipes] <= PIPELINE_PROXIMITY_M) & (gap[n_pipes:] <= PIPELINE_PROXIMITY_M) & (a != b)
+            rows = np.flatnonzero(linked)
+            if len(rows):
+                seg = haversine_pairwise(vertices[:-1, 0], vertices[:-1, 1], vertices[1:, 0], vertices[1:, 1])
+                # Polyline length: cumulative segment lengths, minus the joins between polylines
+                cum = np.concatenate(([0.0], np.cumsum(seg)))
+                length = cum[offsets[1:] - 1] - cum[offsets[:-1]]
+                pipe_cap = units(state.pipelines.capacity)
+                for tails, heads in ((out_node[a[rows]], in_node[b[rows]]), (out_node[b[rows]], in_node[a[rows]])):
+                    add(tails, heads, cls.PIPE, pipe_cap[rows], length[rows], rows,
+                        length[rows] / 1000 * transport * FLOW_PIPELINE_COST_FACTOR)
+
+        tail, head, kind, cost, cap, distance, ref = (np.concatenate(column) for column in zip(*arcs))
+        # Unmet demand: priced above any path through the network, so it only carries what nothing else can
+        demand = int(cap[kind == cls.SINK].sum())
+        unmet_cost = state.cost_model.get('unmet_cost', 10.0 * (float(cost.max()) if len(cost) else 0.0) + 1.0)
+        tail, head = np.append(tail, 0), np.append(head, 1)
+        kind, cost = np.append(kind, np.int8(cls.UNMET)), np.append(cost, unmet_cost)
+        cap, distance, ref = np.append(cap, demand), np.append(distance, 0.0), np.append(ref, -1)
+        return cls(keys, tail, head, kind, cost.astype(np.float64), cap, distance, ref, scale)
+
+    def reduced_costs(self, pi: np.ndarray) -> np.ndarray:
+        return self.cost + pi[self.tail] - pi[self.head]
+
+    def excess(self, x: np.ndarray) -> np.ndarray:
+        moved = np.bincount(self.head, x, self.n_nodes) - np.bincount(self.tail, x, self.n_nodes)
+        return self.supply + np.rint(moved).astype(np.int64)
+
+    def solve_cold(self) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Solve from scratch with HiGHS, then make the (rounded) solution exact with `repair`"""
+        from scipy.optimize import linprog
+        from scipy.sparse import csr_matrix
+        n_arcs = len(self.tail)
+        arcs = np.arange(n_arcs)
+        incidence = csr_matrix((np.concatenate((np.ones(n_arcs), -np.ones(n_arcs))),
+                                (np.concatenate((self.tail, self.head)), np.concatenate((arcs, arcs)))),
+                               shape=(self.n_nodes, n_arcs))
+        result = linprog(self.cost, A_eq=incidence, b_eq=self.supply,
+                         bounds=np.column_stack((np.zeros(n_arcs), self.cap)), method='highs')
+        if result.status != 0:
+            raise RuntimeError(f"Flow LP failed: {result.message}")
+        x = np.clip(np.rint(result.x).astype(np.int64), 0, self.cap)
+        # eqlin marginals are d(objective)/d(b); with rows as out - in, potentials are their negation
+        return self.repair(x, -np.asarray(result.eqlin.marginals, dtype=np.float64))
+
+    def warm_start(self, previous: 'FlowNetwork', x: np.ndarray, pi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Carry a solution of `previous` over to this network, matching nodes by key and arcs by endpoints"""
+        lookup = {key: i for i, key in enumerate(self.keys)}
+        to_new = np.fromiter((lookup.get(key, -1) for key in previous.keys), dtype=np.int64, count=previous.n_nodes)
+        new_pi = np.full(self.n_nodes, np.nan)
+        known = to_new >= 0
+        new_pi[to_new[known]] = pi[known]
+        arc_keys = self._arc_keys(self.tail, self.head, self.kind)
+        order = np.argsort(arc_keys, kind='stable')
+        sorted_keys = arc_keys[order]
+        tails, heads = to_new[previous.tail], to_new[previous.head]
+        mapped = (tails >= 0) & (heads >= 0)
+        old_keys = self._arc_keys(tails[mapped], heads[mapped], previous.kind[mapped])
+        pos = np.minimum(np.searchsorted(sorted_keys, old_keys), len(sorted_keys) - 1)
+        hit = sorted_keys[pos] == old_keys
+        new_x = np.zeros(len(self.tail), dtype=np.int64)
+        carried = np.rint(x[mapped][hit] * (self.scale / previous.scale)).astype(np.int64)
+        new_x[order[pos[hit]]] = carried
+        new_x = np.clip(new_x, 0, self.cap)
+        # New nodes get the cheapest potential reachable over one arc from a known node
+        for _ in range(3):
+            missing = np.isnan(new_pi)
+            if not missing.any():
+                break
+            reach = missing[self.head] & ~np.isnan(new_pi[self.tail])
+            if not reach.any():
+                break
+            np.fmin.at(new_pi, self.head[reach], new_pi[self.tail[reach]] + self.cost[reach])
+        return new_x, np.nan_to_num(new_pi, nan=0.0)
+
+    def _arc_keys(self, tail: np.ndarray, head: np.ndarray, kind: np.ndarray) -> np.ndarray:
+        return (tail.astype(np.int64) * self.n_nodes + head) * 8 + kind
+
+    def _residual_layout(self) -> Tuple[np.ndarray, ...]:
+        """Residual arcs (forward arcs, then backward ones) grouped by (from, to) node pair, built once
+
+        Every phase reuses the grouping, so collapsing parallel arcs is a segmented reduction.
+        """
+        if self._layout is None:
+            n_arcs = len(self.tail)
+            pair = np.concatenate((self.tail * self.n_nodes + self.head, self.head * self.n_nodes + self.tail))
+            order = np.argsort(pair, kind='stable')
+            pair = pair[order]
+            starts = np.flatnonzero(np.concatenate(([True], pair[1:] != pair[:-1])))
+            group = np.cumsum(np.isin(np.arange(len(pair)), starts)) - 1
+            sign = np.where(order < n_arcs, 1, -1)
+            rows, cols = np.divmod(pair[starts], self.n_nodes)
+            self._layout = (order, order % n_arcs, sign, starts, group, rows, cols)
+        return self._layout
+
+    def repair(self, x: np.ndarray, pi: np.ndarray, max_phases: int = 10_000) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Turn any pseudoflow and potentials into an optimal flow (primal-dual)
+
+        Arcs are first pushed to the bound their reduced cost calls for, which keeps every
+        residual arc non-negative. Each phase then runs one multi-source Dijkstra from the
+        nodes with excess, raises potentials up to the nearest deficit, and sends a maximum
+        flow over the zero reduced cost residual arcs. A warm start close to the optimum
+        needs only a handful of phases.
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra, maximum_flow
+        n, cap, tol = self.n_nodes, self.cap, self.tol
+        order, arc, sign, starts, group, rows, cols = self._residual_layout()
+        indptr = lambda r: np.searchsorted(r, np.arange(n + 1))
+        pi = pi.astype(np.float64)
+        rc = self.reduced_costs(pi)
+        x = np.where(rc < -tol, cap, np.where(rc > tol, 0, np.clip(x, 0, cap)))
+        for phase in range(max_phases):
+            excess = self.excess(x)
+            sources = np.flatnonzero(excess > 0)
+            if not len(sources):
+                return x, pi, phase
+            r_cap = np.concatenate((cap - x, x))[order]
+            open_ = r_cap > 0
+            # Parallel residual arcs collapse to their cheapest one for the distance search
+            r_cost = np.where(open_, np.maximum(np.concatenate((rc, -rc))[order], 0.0), np.inf)
+            cheapest = np.minimum.reduceat(r_cost, starts)
+            keep = np.isfinite(cheapest)
+            graph = csr_matrix((cheapest[keep], cols[keep], indptr(rows[keep])), shape=(n, n))
+            dist = dijkstra(graph, indices=sources, min_only=True)
+            reach = dist[excess < 0].min()
+            if not np.isfinite(reach):
+                raise RuntimeError("Flow network has no feasible flow")
+            pi = pi + np.minimum(dist, reach)
+            rc = self.reduced_costs(pi)
+            # Maximum flow from the excess nodes to the deficit nodes over zero reduced cost arcs
+            a_cap = np.where(open_ & (np.concatenate((rc, -rc))[order] <= tol), r_cap, 0)
+            pair_cap = np.add.reduceat(a_cap, starts)
+            keep = np.flatnonzero(pair_cap > 0)
+            sinks = np.flatnonzero(excess < 0)
+            m_from = np.concatenate((rows[keep], np.full(len(sources), n), sinks))
+            m_to = np.concatenate((cols[keep], sources, np.full(len(sinks), n + 1)))
+            m_cap = np.concatenate((np.minimum(pair_cap[keep], FLOW_MAX_UNITS), excess[sources], -excess[sinks]))
+            network = csr_matrix((m_cap.astype(np.int32), (m_from, m_to)), shape=(n + 2, n + 2))
+            flow = maximum_flow(network, n, n + 1).flow
+            sent = np.zeros(len(starts), dtype=np.int64)
+            sent[keep] = np.maximum(np.asarray(flow[rows[keep], cols[keep]]).ravel(), 0)
+            # Split each pair's flow over its parallel residual arcs in order
+            before = np.cumsum(a_cap) - a_cap
+            before = before - before[starts][group]
+            moved = np.clip(sent[group] - before, 0, a_cap)
+            x = x + np.rint(np.bincount(arc, sign * moved, len(x))).astype(np.int64)
+        raise RuntimeError(f"Flow repair did not converge in {max_phases} phases")
 
 @dataclass
 class Location:
@@ -19,7 +1525,7 @@ class Location:
     
     def distance_to(self, other: 'Location') -> float:
         """Fast haversine distance calculation"""
-        R = 6371000  # Earth radius in meters
+        R = EARTH_RADIUS_M
         lat1, lng1 = math.radians(self.lat), math.radians(self.lng)
         lat2, lng2 = math.radians(other.lat), math.radians(other.lng)
         
@@ -37,6 +1543,356 @@ class Asset:
     capacity: float
     asset_type: str
 
+class AssetColumns:
+    """Point assets already split into columns; `initialize` accepts these in place of record lists"""
+
+    def __init__(self, ids: List[Any], lng, lat, alt=None, capacity=None):
+        self.ids = ids
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.alt = np.zeros(len(self.lng)) if alt is None else np.asarray(alt, dtype=np.float64)
+        self.capacity = None if capacity is None else np.asarray(capacity, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def location(self, i: int) -> List[float]:
+        return [float(self.lng[i]), float(self.lat[i]), float(self.alt[i])]
+
+    def digest(self) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        for column in (self.lng, self.lat, self.alt, self.capacity):
+            h.update(b'-' if column is None else column.tobytes())
+        h.update('\x1f'.join(map(str, self.ids)).encode('utf-8'))
+        return h.hexdigest()
+
+class AssetTable:
+    """Columnar asset store: lng/lat/alt/capacity float arrays, type codes and interned ids.
+
+    Indexing, slicing and iteration hand out `Asset` views built on demand, so code
+    written against `List[Asset]` keeps working while kernels read the arrays directly.
+    """
+    # Process-wide code vocabulary, append-only so existing codes never change meaning
+    TYPE_NAMES: List[str] = ['plant', 'storage', 'pipeline']
+    _type_lock = threading.Lock()
+
+    def __init__(self, asset_type: str = 'unknown', capacity_hint: int = 16):
+        self.asset_type = asset_type
+        self._n = 0
+        self._lng = np.empty(capacity_hint, dtype=np.float64)
+        self._lat = np.empty(capacity_hint, dtype=np.float64)
+        self._alt = np.empty(capacity_hint, dtype=np.float64)
+        self._capacity = np.empty(capacity_hint, dtype=np.float64)
+        self._type_code = np.empty(capacity_hint, dtype=np.int8)
+        self.ids: List[str] = []  # or a fixed-width str array when adopted from a snapshot
+        self._row_of: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def type_code(cls, asset_type: str) -> int:
+        with cls._type_lock:
+            if asset_type not in cls.TYPE_NAMES:
+                if len(cls.TYPE_NAMES) > np.iinfo(np.int8).max:
+                    raise ValueError(f"Too many asset types to add '{asset_type}'")
+                cls.TYPE_NAMES.append(asset_type)
+            return cls.TYPE_NAMES.index(asset_type)
+
+    @classmethod
+    def type_names(cls) -> List[str]:
+        """Copy of the type vocabulary, safe to store while other threads add types"""
+        with cls._type_lock:
+            return list(cls.TYPE_NAMES)
+
+    @property
+    def lng(self) -> np.ndarray:
+        return self._lng[:self._n]
+
+    @property
+    def lat(self) -> np.ndarray:
+        return self._lat[:self._n]
+
+    @property
+    def alt(self) -> np.ndarray:
+        return self._alt[:self._n]
+
+    @property
+    def capacity(self) -> np.ndarray:
+        return self._capacity[:self._n]
+
+    @property
+    def type_codes(self) -> np.ndarray:
+        return self._type_code[:self._n]
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the table (arrays plus id strings)"""
+        arrays = sum(a.nbytes for a in (self._lng, self._lat, self._alt, self._capacity, self._type_code))
+        if isinstance(self.ids, np.ndarray):
+            return arrays + self.ids.nbytes
+        return arrays + 8 * len(self.ids) + sum(map(sys.getsizeof, self.ids))
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._view(i) for i in range(*key.indices(self._n))]
+        if key < 0:
+            key += self._n
+        if not 0 <= key < self._n:
+            raise IndexError('asset index out of range')
+        return self._view(key)
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self._view(i)
+
+    def _view(self, i: int) -> Asset:
+        return Asset(str(self.ids[i]), Location(float(self._lng[i]), float(self._lat[i]), float(self._alt[i])),
+                     float(self._capacity[i]), self.TYPE_NAMES[self._type_code[i]])
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._n + extra
+        if needed <= self._lng.shape[0]:
+            return
+        size = max(needed, 2 * self._lng.shape[0])
+        for name in ('_lng', '_lat', '_alt', '_capacity', '_type_code'):
+            old = getattr(self, name)
+            grown = np.empty(size, dtype=old.dtype)
+            grown[:self._n] = old[:self._n]
+            setattr(self, name, grown)
+
+    def extend(self, ids: List[Any], lngs: np.ndarray, lats: np.ndarray, alts: np.ndarray = None,
+               capacities: np.ndarray = None, asset_type: Optional[str] = None) -> None:
+        """Append a batch of rows from column arrays"""
+        count = len(ids)
+        if count == 0:
+            return
+        self._reserve(count)
+        lo, hi = self._n, self._n + count
+        self._lng[lo:hi] = lngs
+        self._lat[lo:hi] = lats
+        self._alt[lo:hi] = 0.0 if alts is None else alts
+        self._capacity[lo:hi] = 100.0 if capacities is None else capacities
+        self._type_code[lo:hi] = self.type_code(asset_type or self.asset_type)
+        if not isinstance(self.ids, list):
+            self.ids = self.ids.tolist()
+        self.ids.extend(sys.intern(str(i)) for i in ids)
+        self._n = hi
+        self._row_of = None
+
+    def append(self, asset: Asset) -> None:
+        loc = asset.location
+        self.extend([asset.id], [loc.lng], [loc.lat], [loc.alt], [asset.capacity], asset.asset_type)
+
+    def clear(self) -> None:
+        self.__init__(self.asset_type)
+
+    @classmethod
+    def from_arrays(cls, asset_type: str, ids: np.ndarray, lng: np.ndarray, lat: np.ndarray, alt: np.ndarray,
+                    capacity: np.ndarray, type_code: np.ndarray) -> 'AssetTable':
+        """Adopt existing column arrays (e.g. read-only memory maps) without copying.
+
+        The first append copies the columns into fresh growable buffers.
+        """
+        table = cls(asset_type, 0)
+        table._lng, table._lat, table._alt = lng, lat, alt
+        table._capacity, table._type_code = capacity, type_code
+        table.ids = ids
+        table._n = lng.shape[0]
+        return table
+
+    def fork(self) -> 'AssetTable':
+        """Copy-on-write clone: shares the column buffers, appends only ever write past `len(self)`"""
+        table = copy.copy(self)
+        table.ids = list(self.ids) if isinstance(self.ids, list) else self.ids
+        # The id map is never mutated in place (extend drops it), so forks can share it
+        table._row_of = self._row_of
+        return table
+
+    def take(self, rows: np.ndarray) -> 'AssetTable':
+        """New table holding only `rows` (in the given order)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        table = AssetTable.from_arrays(self.asset_type, [], self.lng[rows], self.lat[rows], self.alt[rows],
+                                       self.capacity[rows], self.type_codes[rows])
+        ids = self.ids
+        table.ids = [str(ids[i]) for i in rows.tolist()]
+        return table
+
+    def updated(self, rows: np.ndarray, lngs: np.ndarray, lats: np.ndarray, alts: np.ndarray,
+                capacities: np.ndarray) -> 'AssetTable':
+        """Copy with new values written into `rows`; forks sharing the old buffers are unaffected"""
+        table = AssetTable.from_arrays(self.asset_type, self.ids, self.lng.copy(), self.lat.copy(), self.alt.copy(),
+                                       self.capacity.copy(), self.type_codes.copy())
+        table._lng[rows], table._lat[rows], table._alt[rows] = lngs, lats, alts
+        table._capacity[rows] = capacities
+        table.ids = list(self.ids)
+        table._row_of = self._row_of
+        return table
+
+    def row_of(self, asset_id: str) -> int:
+        """Row index for an asset id (-1 when absent)"""
+        if self._row_of is None:
+            self._row_of = {str(asset_id): i for i, asset_id in enumerate(self.ids)}
+        return self._row_of.get(asset_id, -1)
+
+class NetworkState:
+    """Asset tables, their spatial indexes, compiled zones and cost model as one unit.
+
+    A state is never mutated once published: writers build a fresh one (or `fork()` the
+    current one), fill it, and publish it with a single reference swap. Readers pin the
+    state once per call and keep a consistent view without taking any lock.
+    """
+    GROUPS = (('plant', 'plants', 'plant_index'),
+              ('storage', 'storages', 'storage_index'),
+              ('pipeline', 'pipelines', 'pipeline_index'),
+              ('demand', 'demands', 'demand_index'))
+
+    def __init__(self, regulatory_zones: Optional[List[Dict]] = None, cost_model: Optional[Dict[str, float]] = None,
+                 zone_geoms: Optional[np.ndarray] = None):
+        self.plants = AssetTable('plant')
+        self.storages = AssetTable('storage')
+        self.pipelines = AssetTable('pipeline')
+        # Demand centers keep their demand (kg/day) in the capacity column
+        self.demands = AssetTable('demand')
+        self.plant_index = SpatialIndex()
+        self.storage_index = SpatialIndex()
+        self.pipeline_index = SpatialIndex()
+        self.demand_index = SpatialIndex()
+        self.regulatory_zones: List[Dict] = regulatory_zones or []
+        self.zone_index = ZoneIndex(self.regulatory_zones, zone_geoms)
+        self.cost_model: Dict[str, float] = cost_model or {}
+        # Pipeline geometry as CSR polylines: vertices[offsets[i]:offsets[i + 1]] belongs to pipelines row i
+        self.pipeline_offsets = np.zeros(1, dtype=np.int64)
+        self.pipeline_vertices = np.empty((0, 2), dtype=np.float64)
+        self._segment_index: Optional[SegmentIndex] = None
+        self._fingerprint: Optional[str] = None
+        self.initialized = False
+
+    def fork(self) -> 'NetworkState':
+        state = copy.copy(self)
+        state._fingerprint = None
+        for _, tables, _ in self.GROUPS:
+            setattr(state, tables, getattr(self, tables).fork())
+        return state
+
+    def sync_indexes(self) -> None:
+        """Extend (copies of) the spatial indexes with rows added since the last sync"""
+        for _, tables, indexes in self.GROUPS:
+            table, index = getattr(self, tables), getattr(self, indexes)
+            if len(table) > len(index):
+                index = copy.copy(index)
+                index.add(table.lng[len(index):], table.lat[len(index):])
+                setattr(self, indexes, index)
+        # Pipelines added without a path are single-vertex polylines at their location
+        known = len(self.pipeline_offsets) - 1
+        if len(self.pipelines) > known:
+            added = len(self.pipelines) - known
+            self.pipeline_offsets = np.concatenate((self.pipeline_offsets,
+                                                    self.pipeline_offsets[-1] + np.arange(1, added + 1)))
+            self.pipeline_vertices = np.concatenate((
+                self.pipeline_vertices, np.column_stack((self.pipelines.lng[known:], self.pipelines.lat[known:]))))
+
+    def add_pipeline_paths(self, paths) -> None:
+        """Append polylines ([[lng, lat(, alt)], ...] each) for the next pipeline rows"""
+        paths = [np.array([vertex[:2] for vertex in path], dtype=np.float64).reshape(-1, 2) for path in paths]
+        if not paths:
+            return
+        counts = np.array([len(path) for path in paths], dtype=np.int64)
+        # New arrays rather than in-place growth: forks of this state may share the old ones
+        self.pipeline_offsets = np.concatenate((self.pipeline_offsets, self.pipeline_offsets[-1] + np.cumsum(counts)))
+        self.pipeline_vertices = np.concatenate([self.pipeline_vertices] + paths)
+
+    def remove_rows(self, asset_type: str, rows: np.ndarray) -> np.ndarray:
+        """Drop rows of one group and rebuild its index; returns the old -> new row map (-1 if dropped)"""
+        tables, indexes = self.names(asset_type)
+        table = getattr(self, tables)
+        keep = np.ones(len(table), dtype=bool)
+        keep[rows] = False
+        table = table.take(np.flatnonzero(keep))
+        setattr(self, tables, table)
+        setattr(self, indexes, SpatialIndex(table.lng, table.lat))
+        if asset_type == 'pipeline':
+            counts = np.diff(self.pipeline_offsets)
+            self.pipeline_vertices = self.pipeline_vertices[np.repeat(keep, counts)]
+            self.pipeline_offsets = np.concatenate(([0], np.cumsum(counts[keep])))
+            self._segment_index = None
+        return np.where(keep, np.cumsum(keep) - 1, -1)
+
+    def update_rows(self, asset_type: str, rows: np.ndarray, lngs: np.ndarray, lats: np.ndarray,
+                    alts: np.ndarray, capacities: np.ndarray) -> None:
+        """Overwrite rows of one group, rebuilding its index only if a point moved"""
+        tables, indexes = self.names(asset_type)
+        old = getattr(self, tables)
+        table = old.updated(rows, lngs, lats, alts, capacities)
+        setattr(self, tables, table)
+        if not (np.array_equal(old.lng[rows], table.lng[rows]) and np.array_equal(old.lat[rows], table.lat[rows])):
+            setattr(self, indexes, SpatialIndex(table.lng, table.lat))
+
+    def polylines(self, rows) -> List[np.ndarray]:
+        return [self.pipeline_vertices[self.pipeline_offsets[i]:self.pipeline_offsets[i + 1]] for i in rows]
+
+    def replace_pipeline_paths(self, rows: np.ndarray, paths) -> None:
+        """Swap the polylines of existing pipeline rows"""
+        lines = self.polylines(range(len(self.pipeline_offsets) - 1))
+        for row, path in zip(rows, paths):
+            lines[row] = np.array([vertex[:2] for vertex in path], dtype=np.float64).reshape(-1, 2)
+        self.pipeline_offsets = np.concatenate(([0], np.cumsum([len(line) for line in lines], dtype=np.int64)))
+        self.pipeline_vertices = np.concatenate(lines) if lines else np.empty((0, 2), dtype=np.float64)
+        self._segment_index = None
+
+    def set_zones(self, zones: List[Dict], geoms: np.ndarray) -> None:
+        self.regulatory_zones = zones
+        self.zone_index = ZoneIndex(zones, geoms)
+
+    @property
+    def segment_index(self) -> SegmentIndex:
+        """Segment index over the pipeline polylines, built on first use after they change"""
+        index = self._segment_index
+        if index is None or index.n_polylines != len(self.pipeline_offsets) - 1:
+            index = SegmentIndex.from_polylines(self.pipeline_offsets, self.pipeline_vertices)
+            self._segment_index = index
+        return index
+
+    @property
+    def fingerprint(self) -> str:
+        """Digest of the network contents, computed once per (published, hence immutable) state"""
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            for _, group, _ in self.GROUPS:
+                table = getattr(self, group)
+                digest.update(f'{group}:{len(table)}'.encode('utf-8'))
+                for column in (table.lng, table.lat, table.alt, table.capacity):
+                    digest.update(np.ascontiguousarray(column, dtype=np.float64).tobytes())
+                digest.update('\x1f'.join(map(str, table.ids)).encode('utf-8'))
+            digest.update(self.pipeline_offsets.tobytes())
+            digest.update(np.ascontiguousarray(self.pipeline_vertices).tobytes())
+            digest.update(json.dumps([self.regulatory_zones, self.cost_model], sort_keys=True,
+                                     default=str).encode('utf-8'))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def names(self, asset_type: str) -> Tuple[str, str]:
+        """(table attribute, index attribute) of an asset group"""
+        for name, tables, indexes in self.GROUPS:
+            if name == asset_type:
+                return tables, indexes
+        raise ValueError(f"Unknown asset type: {asset_type}")
+
+    def group(self, asset_type: str) -> Tuple[AssetTable, SpatialIndex]:
+        tables, indexes = self.names(asset_type)
+        return getattr(self, tables), getattr(self, indexes)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory footprint of the prepared network (tables plus indexes)"""
+        tables = sum(getattr(self, group).nbytes for _, group, _ in self.GROUPS) + self.pipeline_vertices.nbytes
+        # Index copies of lng/lat plus roughly 48 bytes per KD-tree point
+        indexed = sum(len(getattr(self, indexes)) for _, _, indexes in self.GROUPS)
+        return tables + 64 * indexed + 1024 * len(self.zone_index)
+
+def _state_attribute(name: str) -> property:
+    return property(lambda self: getattr(self._state, name), doc=f"`{name}` of the current network state")
+
 @dataclass
 class Recommendation:
     """Optimization result"""
@@ -44,105 +1900,655 @@ class Recommendation:
     score: float
     reasons: List[str]
 
+class ResultCache:
+    """LRU cache of finished recommendation lists, keyed by network fingerprint and request"""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Callers own what they get back, so hand out copies
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Any) -> None:
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class CandidateSet:
+    """A scored candidate array kept current while the network is edited
+
+    Edits hand over what changed; only candidates a spatial lookup finds near a changed
+    plant, pipeline or zone are rescored. Safety scores are drawn once, so a candidate's
+    score only moves when the network around it does.
+    """
+
+    def __init__(self, lngs: np.ndarray, lats: np.ndarray, alts: np.ndarray, weights: Dict[str, float],
+                 constraints: Dict[str, Any], safety: np.ndarray, state: 'NetworkState'):
+        self.lngs, self.lats, self.alts = lngs, lats, alts
+        self.weights, self.constraints = weights, constraints
+        self.safety = safety
+        self.index = SpatialIndex(lngs, lats)
+        self.state = state
+        self.scored = self._score(state, np.arange(len(lngs)))
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.lngs)
+
+    def _score(self, state: 'NetworkState', rows: np.ndarray) -> Dict[str, np.ndarray]:
+        return score_arrays(self.lngs[rows], self.lats[rows], state.plant_index, len(state.plants),
+                            state.zone_index, state.cost_model, self.weights, self.constraints,
+                            self.safety[rows], state.segment_index)
+
+    def _affected(self, old: 'NetworkState', state: 'NetworkState', changes: Optional[Dict[str, Any]]):
+        """Rows whose score may differ between `old` and `state` (None: all of them)"""
+        if changes is None or state.cost_model is not old.cost_model:
+            return None
+        n_old, n_new = len(old.plants), len(state.plants)
+        # The no-plant and few-plant bonuses apply to every candidate at once
+        if (n_old > 0) != (n_new > 0) or (n_old < 3) != (n_new < 3):
+            return None
+        empty = np.empty(0, dtype=np.int64)
+        kind, hits = changes.get('asset_type'), [empty]
+        if kind == 'plant' and n_new > 0 and self.weights.get('distance_weight', 0.3) > 0:
+            removed, added = changes.get('removed', []), changes.get('added', [])
+            if len(removed) + len(added) > CANDIDATE_REFRESH_MAX_POINTS:
+                return None
+            min_dist, nearest = self.scored['min_dist'], self.scored['nearest']
+            # No candidate is farther than `reach` from its nearest plant, so nothing beyond it can change
+            reach = float(np.max(min_dist)) + 1.0 if len(min_dist) else 0.0
+            for lng, lat, row in removed:
+                _, idx = self.index.within(lng, lat, reach)
+                hits.append(idx[nearest[idx] == row])
+            for lng, lat in added:
+                dist, idx = self.index.within(lng, lat, reach)
+                hits.append(idx[dist < min_dist[idx]])
+        elif kind == 'pipeline' and self.weights.get('pipeline_weight', 0) > 0:
+            for line in changes.get('polylines', []):
+                ends = np.vstack((line[:1], line)) if len(line) == 1 else line
+                mids, halves = (ends[:-1] + ends[1:]) / 2, haversine_pairwise(*ends[:-1].T, *ends[1:].T) / 2
+                if len(mids) > CANDIDATE_REFRESH_MAX_POINTS:
+                    return None
+                for (lng, lat), half in zip(mids, halves):
+                    hits.append(self.index.within(lng, lat, PIPELINE_PROXIMITY_M + half)[1])
+        elif kind == 'zone':
+            import shapely
+            for geom in changes.get('zones', []):
+                min_lng, min_lat, max_lng, max_lat = geom.bounds
+                lng, lat = (min_lng + max_lng) / 2, (min_lat + max_lat) / 2
+                radius = float(haversine_matrix([lng], [lat], [min_lng, max_lng, min_lng, max_lng],
+                                                [min_lat, min_lat, max_lat, max_lat]).max()) + 1.0
+                idx = self.index.within(lng, lat, radius)[1]
+                hits.append(idx[shapely.contains_xy(geom, self.lngs[idx], self.lats[idx])])
+        return np.unique(np.concatenate(hits))
+
+    def refresh(self, state: 'NetworkState', changes: Optional[Dict[str, Any]] = None) -> int:
+        """Bring the scores in line with `state`; returns how many candidates were rescored"""
+        with self._lock:
+            rows = self._affected(self.state, state, changes)
+            if rows is None:
+                self.scored, self.state = self._score(state, np.arange(len(self))), state
+                return len(self)
+            if changes.get('row_map') is not None:
+                # Plant rows shifted: renumber the nearest-plant references that survive
+                nearest = self.scored['nearest']
+                self.scored['nearest'] = np.where(nearest >= 0, changes['row_map'][np.maximum(nearest, 0)], -1)
+            if len(rows):
+                for key, values in self._score(state, rows).items():
+                    self.scored[key][rows] = values
+            self.state = state
+            return len(rows)
+
 class OptimizedHydrogenSystem:
-    """High-performance hydrogen infrastructure optimizer"""
+    """High-performance hydrogen infrastructure optimizer
+
+    Network data lives in an immutable `NetworkState`; every write publishes a new
+    state, so any number of threads can optimize concurrently against the same system.
+    """
+    plants = _state_attribute('plants')
+    storages = _state_attribute('storages')
+    pipelines = _state_attribute('pipelines')
+    demands = _state_attribute('demands')
+    plant_index = _state_attribute('plant_index')
+    storage_index = _state_attribute('storage_index')
+    pipeline_index = _state_attribute('pipeline_index')
+    demand_index = _state_attribute('demand_index')
+    regulatory_zones = _state_attribute('regulatory_zones')
+    zone_index = _state_attribute('zone_index')
+    cost_model = _state_attribute('cost_model')
+    _initialized = _state_attribute('initialized')
+    # Id prefix and default capacity for request records of each asset type
+    RECORD_DEFAULTS = {'plant': ('p', 100), 'storage': ('s', 1000), 'pipeline': ('pipe', 50), 'demand': ('d', 0)}
+    # Site search per asset type: (anchor group, anchor radius km, candidates per anchor, default weights)
+    SITE_SEARCH = {
+        'plant': ('storages', 30, 10, {'distance_weight': 0.4, 'safety_weight': 0.6}),
+        'storage': ('plants', 25, 8, {'distance_weight': 0.5, 'safety_weight': 0.5})
+    }
     
     def __init__(self):
-        self.plants: List[Asset] = []
-        self.storages: List[Asset] = []
-        self.pipelines: List[Asset] = []
-        self.regulatory_zones: List[Dict] = []
-        self.cost_model: Dict[str, float] = {}
-        self._initialized = False
-
-    def ingest_assets_from_file(self, filepath: str, filetype: str = 'geojson') -> bool:
-        """Ingest asset data from GeoJSON or CSV file using GeoPandas or Pandas."""
+        self._state = NetworkState()
+        self._write_lock = threading.Lock()
+        self._scorer: Optional[ParallelScorer] = None
+        self._surface: Optional[RouteCostSurface] = None
+        self._results = ResultCache()
+        self._tracked: 'weakref.WeakSet[CandidateSet]' = weakref.WeakSet()
+        self.last_update_stats: Dict[str, Any] = {}
+        # (state ref, neighbors, network, flows, potentials, stats) of the last flow solve
+        self._flow_lock = threading.Lock()
+        self._flow_solution: Optional[Tuple] = None
+        self.last_ingest_stats: Dict[str, Any] = {}
+        self.last_search_stats: Dict[str, Any] = {}
+
+    @staticmethod
+    def _ingest_frame(state: NetworkState, df, lngs: np.ndarray, lats: np.ndarray,
+                      bbox: Optional[Tuple[float, float, float, float]] = None) -> int:
+        """Split a frame's rows by `type` with boolean masks and append each group as columns"""
+        n = len(df)
+        ids = df['id'].astype(str).to_numpy() if 'id' in df.columns else np.full(n, '', dtype=object)
+        capacities = df['capacity'].to_numpy(dtype=np.float64) if 'capacity' in df.columns else np.full(n, 100.0)
+        types = df['type'].to_numpy() if 'type' in df.columns else np.full(n, 'unknown', dtype=object)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        in_bbox = np.ones(n, dtype=bool)
+        if bbox is not None:
+            min_lng, min_lat, max_lng, max_lat = bbox
+            in_bbox = (lngs >= min_lng) & (lngs <= max_lng) & (lats >= min_lat) & (lats <= max_lat)
+        for asset_type, tables, _ in NetworkState.GROUPS:
+            table = getattr(state, tables)
+            mask = (types == asset_type) & in_bbox
+            if mask.any():
+                table.extend(ids[mask].tolist(), lngs[mask], lats[mask], None, capacities[mask], asset_type)
+        return int(in_bbox.sum())
+
+    def _record_ingest(self, source: str, rows: int, chunks: int, started: float) -> None:
+        # Called under `_write_lock`, so the stats always describe the last published ingest
+        elapsed = time.perf_counter() - started
+        self.last_ingest_stats = {
+            'source': source,
+            'rows': rows,
+            'chunks': chunks,
+            'seconds': elapsed,
+            'rows_per_second': rows / elapsed if elapsed > 0 else float('inf')
+        }
+
+    @staticmethod
+    def _check_identifiers(*names: str) -> None:
+        for name in names:
+            if not SQL_IDENTIFIER.match(name):
+                raise ValueError(f"Invalid SQL identifier: {name!r}")
+
+    def _iter_file_chunks(self, filepath: str, filetype: str, chunksize: Optional[int],
+                          columns: Optional[List[str]], bbox: Optional[Tuple[float, float, float, float]]):
+        """Yield (frame, lngs, lats) chunks from a GeoJSON, CSV or Parquet file"""
+        import pandas as pd
+        import shapely
+        if filetype == 'geojson':
+            try:
+                import pyogrio
+            except ImportError:
+                # Without pyogrio the whole file is read at once through geopandas
+                pyogrio = None
+            if chunksize and pyogrio is not None:
+                # Stream Arrow record batches straight from OGR; the bbox is pushed into the reader
+                with pyogrio.open_arrow(filepath, columns=columns, bbox=bbox, batch_size=chunksize,
+                                        use_pyarrow=True) as (meta, reader):
+                    geom_col = meta['geometry_name'] or 'wkb_geometry'
+                    for batch in reader:
+                        centroids = shapely.centroid(shapely.from_wkb(batch.column(geom_col).to_numpy(zero_copy_only=False)))
+                        frame = batch.drop_columns([geom_col]).to_pandas()
+                        yield frame, shapely.get_x(centroids), shapely.get_y(centroids)
+            else:
+                import geopandas as gpd
+                gdf = gpd.read_file(filepath, columns=columns, bbox=bbox)
+                # Assume columns: id, type, capacity, geometry; points are their own centroid
+                centroids = shapely.centroid(gdf.geometry.values)
+                yield gdf, shapely.get_x(centroids), shapely.get_y(centroids)
+        elif filetype == 'csv':
+            usecols = sorted(set(columns) | {'lng', 'lat'}) if columns else None
+            frames = pd.read_csv(filepath, usecols=usecols, chunksize=chunksize) if chunksize else [pd.read_csv(filepath, usecols=usecols)]
+            for df in frames:
+                yield df, df['lng'].to_numpy(), df['lat'].to_numpy()
+        elif filetype == 'parquet':
+            import pyarrow.dataset as ds
+            dataset = ds.dataset(filepath, format='parquet')
+            expr = None
+            if bbox is not None:
+                # Filter on row-group statistics before any rows are decoded
+                min_lng, min_lat, max_lng, max_lat = bbox
+                expr = ((ds.field('lng') >= min_lng) & (ds.field('lng') <= max_lng)
+                        & (ds.field('lat') >= min_lat) & (ds.field('lat') <= max_lat))
+            cols = sorted(set(columns) | {'lng', 'lat'}) if columns else None
+            batches = dataset.to_batches(columns=cols, filter=expr, batch_size=chunksize or 1 << 20)
+            for batch in batches:
+                df = batch.to_pandas()
+                yield df, df['lng'].to_numpy(), df['lat'].to_numpy()
+        else:
+            raise ValueError(f"Unsupported file type: {filetype}")
+
+    @metrics.timed('ingest')
+    def ingest_assets_from_file(self, filepath: str, filetype: str = 'geojson', chunksize: Optional[int] = None,
+                                columns: Optional[List[str]] = None,
+                                bbox: Optional[Tuple[float, float, float, float]] = None) -> bool:
+        """Ingest asset data from GeoJSON, CSV or Parquet file using GeoPandas or Pandas.
+
+        With `chunksize` the file is streamed in fixed-size chunks that are appended as they
+        arrive. `columns` projects the attribute columns read and `bbox` is
+        (min_lng, min_lat, max_lng, max_lat).
+        """
         try:
-            import geopandas as gpd
-            import pandas as pd
-            if filetype == 'geojson':
-                gdf = gpd.read_file(filepath)
-                # Assume columns: id, type, capacity, geometry
-                for _, row in gdf.iterrows():
-                    coords = list(row.geometry.coords)[0] if row.geometry.geom_type == 'Point' else row.geometry.centroid.coords[0]
-                    asset = Asset(str(row.get('id', '')), Location(coords[0], coords[1]), row.get('capacity', 100), row.get('type', 'unknown'))
-                    if asset.asset_type == 'plant':
-                        self.plants.append(asset)
-                    elif asset.asset_type == 'storage':
-                        self.storages.append(asset)
-                    elif asset.asset_type == 'pipeline':
-                        self.pipelines.append(asset)
-            elif filetype == 'csv':
-                df = pd.read_csv(filepath)
-                for _, row in df.iterrows():
-                    asset = Asset(str(row.get('id', '')), Location(row['lng'], row['lat']), row.get('capacity', 100), row.get('type', 'unknown'))
-                    if asset.asset_type == 'plant':
-                        self.plants.append(asset)
-                    elif asset.asset_type == 'storage':
-                        self.storages.append(asset)
-                    elif asset.asset_type == 'pipeline':
-                        self.pipelines.append(asset)
+            started = time.perf_counter()
+            rows = chunks = 0
+            with self._write_lock:
+                state = self._state.fork()
+                for df, lngs, lats in self._iter_file_chunks(filepath, filetype, chunksize, columns, bbox):
+                    rows += self._ingest_frame(state, df, lngs, lats, bbox)
+                    chunks += 1
+                state.sync_indexes()
+                self._publish(state)
+                self._record_ingest(filepath, rows, chunks, started)
             return True
         except Exception as e:
             print(f"Ingestion error: {e}")
             return False
 
-    def ingest_assets_from_db(self, db_conn, table: str = 'assets') -> bool:
-        """Ingest asset data from a database connection (expects SQLAlchemy or psycopg2 conn)."""
+    @metrics.timed('ingest')
+    def ingest_assets_from_db(self, db_conn, table: str = 'assets', chunksize: Optional[int] = None,
+                              columns: Optional[List[str]] = None,
+                              bbox: Optional[Tuple[float, float, float, float]] = None) -> bool:
+        """Ingest asset data from a database connection (expects SQLAlchemy or psycopg2 conn).
+
+        With `chunksize` rows are fetched and appended chunk by chunk. `columns` and `bbox`
+        (min_lng, min_lat, max_lng, max_lat) are applied in the query itself.
+        """
         try:
             import pandas as pd
-            df = pd.read_sql(f'SELECT * FROM {table}', db_conn)
-            for _, row in df.iterrows():
-                asset = Asset(str(row.get('id', '')), Location(row['lng'], row['lat']), row.get('capacity', 100), row.get('type', 'unknown'))
-                if asset.asset_type == 'plant':
-                    self.plants.append(asset)
-                elif asset.asset_type == 'storage':
-                    self.storages.append(asset)
-                elif asset.asset_type == 'pipeline':
-                    self.pipelines.append(asset)
+            started = time.perf_counter()
+            self._check_identifiers(table, *(columns or []))
+            projection = ', '.join(sorted(set(columns) | {'lng', 'lat'})) if columns else '*'
+            query = f'SELECT {projection} FROM {table}'
+            if bbox is not None:
+                min_lng, min_lat, max_lng, max_lat = (float(v) for v in bbox)
+                if not all(math.isfinite(v) for v in (min_lng, min_lat, max_lng, max_lat)):
+                    raise ValueError(f"Invalid bbox: {bbox}")
+                query += (f' WHERE lng BETWEEN {min_lng!r} AND {max_lng!r}'
+                          f' AND lat BETWEEN {min_lat!r} AND {max_lat!r}')
+            frames = pd.read_sql(query, db_conn, chunksize=chunksize) if chunksize else [pd.read_sql(query, db_conn)]
+            rows = chunks = 0
+            with self._write_lock:
+                state = self._state.fork()
+                for df in frames:
+                    rows += self._ingest_frame(state, df, df['lng'].to_numpy(), df['lat'].to_numpy())
+                    chunks += 1
+                state.sync_indexes()
+                self._publish(state)
+                self._record_ingest(table, rows, chunks, started)
             return True
         except Exception as e:
             print(f"DB ingestion error: {e}")
             return False
     
-    def __init__(self):
-        self.plants: List[Asset] = []
-        self.storages: List[Asset] = []
-        self.pipelines: List[Asset] = []
-        self.regulatory_zones: List[Dict] = []
-        self.cost_model: Dict[str, float] = {}
-        self._initialized = False
-    
+    @metrics.timed('initialize')
     def initialize(self, data: Dict[str, Any]) -> bool:
         """Initialization from user data, including regulatory zones and cost model"""
         try:
-            self.plants.clear()
-            self.storages.clear()
-            self.pipelines.clear()
-            self.regulatory_zones = data.get('regulatory_zones', [])
-            self.cost_model = data.get('cost_model', {})
-            # Fast plant creation
-            for p in data.get('plants', []):
-                loc = Location(p['location'][0], p['location'][1], p['location'][2] if len(p['location']) > 2 else 0)
-                self.plants.append(Asset(p.get('id', f"p_{len(self.plants)}"), loc, p.get('capacity', 100), 'plant'))
-            for s in data.get('storage_facilities', []):
-                loc = Location(s['location'][0], s['location'][1], s['location'][2] if len(s['location']) > 2 else 0)
-                self.storages.append(Asset(s.get('id', f"s_{len(self.storages)}"), loc, s.get('capacity', 1000), 'storage'))
-            for pipe in data.get('pipelines', []):
-                if pipe['path']:
-                    start = pipe['path'][0]
-                    loc = Location(start[0], start[1], start[2] if len(start) > 2 else 0)
-                    self.pipelines.append(Asset(pipe.get('id', f"pipe_{len(self.pipelines)}"), loc, pipe.get('capacity', 50), 'pipeline'))
-            self._initialized = True
+            state = NetworkState(data.get('regulatory_zones', []), data.get('cost_model', {}))
+            # Columnar asset creation
+            for asset_type, key in (('plant', 'plants'), ('storage', 'storage_facilities'),
+                                    ('pipeline', 'pipelines'), ('demand', 'demand_centers')):
+                records = data.get(key, [])
+                # Pipelines need their paths, so only point groups take the columnar form
+                if asset_type != 'pipeline' and isinstance(records, AssetColumns):
+                    capacity = records.capacity
+                    if capacity is None:
+                        capacity = np.full(len(records), float(self.RECORD_DEFAULTS[asset_type][1]))
+                    state.group(asset_type)[0].extend(records.ids, records.lng, records.lat, records.alt, capacity)
+                    continue
+                records = self._normalize_records(asset_type, records)
+                self._extend_from_records(state.group(asset_type)[0], records, *self.RECORD_DEFAULTS[asset_type])
+                if asset_type == 'pipeline':
+                    state.add_pipeline_paths([pipe['path'] for pipe in records])
+            state.sync_indexes()
+            state.initialized = True
+            with self._write_lock:
+                self._publish(state)
             return True
         except Exception:
             return False
     
-    def _fast_candidate_generation(self, center: Location, radius_km: float = 50, count: int = 20) -> List[Location]:
+    def _publish(self, state: NetworkState, changes: Optional[Dict[str, Any]] = None) -> int:
+        """Swap in a new state (caller holds `_write_lock`) and bring tracked candidate sets up to date"""
+        self._state = state
+        return sum(candidates.refresh(state, changes) for candidates in list(self._tracked))
+
+    def _edit(self, started: float, apply) -> Dict[str, Any]:
+        with self._write_lock:
+            state = self._state.fork()
+            changes = apply(state)
+            state.sync_indexes()
+            rescored = self._publish(state, changes)
+            stats = {
+                'rescored': rescored,
+                'candidate_sets': len(self._tracked),
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+            }
+            self.last_update_stats = stats
+        return stats
+
+    @classmethod
+    def _normalize_records(cls, asset_type: str, records: List[Dict]) -> List[Dict]:
+        """Request records in `_extend_from_records` form: pipelines located at their first vertex,
+        demand centers carrying their demand as capacity"""
+        if asset_type == 'pipeline':
+            return [dict(r, location=r['path'][0]) for r in records if r.get('path')]
+        if asset_type == 'demand':
+            return [dict(r, capacity=r.get('demand', r.get('capacity', 0))) for r in records]
+        return list(records)
+
+    def add_assets(self, asset_type: str, records: List[Dict]) -> Dict[str, Any]:
+        """Add plants, storages, pipelines or demand centers, rescoring only the tracked candidates they affect"""
+        started = time.perf_counter()
+        records = self._normalize_records(asset_type, records)
+
+        def apply(state: NetworkState) -> Dict[str, Any]:
+            table, _ = state.group(asset_type)
+            base = len(table)
+            self._extend_from_records(table, records, *self.RECORD_DEFAULTS[asset_type])
+            if asset_type == 'pipeline':
+                state.add_pipeline_paths([r['path'] for r in records])
+            return {'asset_type': asset_type,
+                    'added': list(zip(table.lng[base:].tolist(), table.lat[base:].tolist())),
+                    'polylines': [np.asarray([v[:2] for v in r['path']], dtype=np.float64) for r in records]
+                    if asset_type == 'pipeline' else []}
+        return self._edit(started, apply)
+
+    def remove_assets(self, asset_type: str, ids: List[str]) -> Dict[str, Any]:
+        """Remove assets by id (unknown ids are ignored)"""
+        started = time.perf_counter()
+
+        def apply(state: NetworkState) -> Dict[str, Any]:
+            table, _ = state.group(asset_type)
+            rows = np.array(sorted({table.row_of(str(i)) for i in ids} - {-1}), dtype=np.int64)
+            changes = {'asset_type': asset_type,
+                       'removed': list(zip(table.lng[rows].tolist(), table.lat[rows].tolist(), rows.tolist())),
+                       'polylines': state.polylines(rows) if asset_type == 'pipeline' else []}
+            if len(rows):
+                row_map = state.remove_rows(asset_type, rows)
+                if asset_type == 'plant':
+                    changes['row_map'] = row_map
+            return changes
+        return self._edit(started, apply)
+
+    def update_assets(self, asset_type: str, records: List[Dict]) -> Dict[str, Any]:
+        """Move or resize existing assets by id ('location', 'capacity', and 'path' for pipelines)"""
+        started = time.perf_counter()
+        records = self._normalize_records(asset_type, records) if asset_type == 'demand' else records
+
+        def apply(state: NetworkState) -> Dict[str, Any]:
+            table, _ = state.group(asset_type)
+            found = [(table.row_of(str(r['id'])), r) for r in records]
+            found = [(row, r) for row, r in found if row >= 0]
+            rows = np.array([row for row, _ in found], dtype=np.int64)
+            lngs, lats = table.lng[rows].copy(), table.lat[rows].copy()
+            alts, capacities = table.alt[rows].copy(), table.capacity[rows].copy()
+            for i, (_, r) in enumerate(found):
+                location = r['path'][0] if r.get('path') else r.get('location')
+                if location is not None:
+                    lngs[i], lats[i] = location[0], location[1]
+                    alts[i] = location[2] if len(location) > 2 else 0
+                capacities[i] = r.get('capacity', capacities[i])
+            changes = {'asset_type': asset_type,
+                       'removed': list(zip(table.lng[rows].tolist(), table.lat[rows].tolist(), rows.tolist())),
+                       'added': list(zip(lngs.tolist(), lats.tolist()))}
+            if asset_type == 'pipeline':
+                paths = [(row, r['path']) for row, r in found if r.get('path')]
+                changes['polylines'] = state.polylines([row for row, _ in paths])
+                state.replace_pipeline_paths([row for row, _ in paths], [path for _, path in paths])
+                changes['polylines'] += state.polylines([row for row, _ in paths])
+            if len(rows):
+                state.update_rows(asset_type, rows, lngs, lats, alts, capacities)
+            return changes
+        return self._edit(started, apply)
+
+    @staticmethod
+    def _zone_key(zone: Dict) -> Any:
+        return zone.get('id', zone.get('name'))
+
+    def add_zones(self, zones: List[Dict]) -> Dict[str, Any]:
+        """Add regulatory zones ({'polygon', 'penalty' | 'bonus', optional 'id'/'name'})"""
+        started = time.perf_counter()
+
+        def apply(state: NetworkState) -> Dict[str, Any]:
+            added = ZoneIndex(zones).geoms
+            state.set_zones(state.regulatory_zones + list(zones), np.concatenate((state.zone_index.geoms, added)))
+            return {'asset_type': 'zone', 'zones': list(added)}
+        return self._edit(started, apply)
+
+    def remove_zones(self, zone_ids: List[Any]) -> Dict[str, Any]:
+        """Remove regulatory zones by 'id' (or 'name')"""
+        started = time.perf_counter()
+        zone_ids = set(zone_ids)
+
+        def apply(state: NetworkState) -> Dict[str, Any]:
+            keep = np.array([self._zone_key(zone) not in zone_ids for zone in state.regulatory_zones], dtype=bool)
+            geoms = state.zone_index.geoms
+            state.set_zones([zone for zone, k in zip(state.regulatory_zones, keep) if k], geoms[keep])
+            return {'asset_type': 'zone', 'zones': list(geoms[~keep])}
+        return self._edit(started, apply)
+
+    def update_zones(self, zones: List[Dict]) -> Dict[str, Any]:
+        """Replace regulatory zones that share an 'id' (or 'name') with the given ones"""
+        started = time.perf_counter()
+        by_key = {self._zone_key(zone): zone for zone in zones}
+
+        def apply(state: NetworkState) -> Dict[str, Any]:
+            rows = [i for i, zone in enumerate(state.regulatory_zones) if self._zone_key(zone) in by_key]
+            regulatory_zones = list(state.regulatory_zones)
+            geoms = state.zone_index.geoms.copy()
+            replaced = ZoneIndex([by_key[self._zone_key(regulatory_zones[i])] for i in rows]).geoms
+            touched = list(geoms[rows]) + list(replaced)
+            for i, geom in zip(rows, replaced):
+                regulatory_zones[i] = by_key[self._zone_key(regulatory_zones[i])]
+                geoms[i] = geom
+            state.set_zones(regulatory_zones, geoms)
+            return {'asset_type': 'zone', 'zones': touched}
+        return self._edit(started, apply)
+
+    def track_candidates(self, locations: Optional[np.ndarray] = None, constraints: Dict[str, Any] = None,
+                         weights: Dict[str, float] = None, seed: Optional[int] = None) -> CandidateSet:
+        """Score a candidate array once and keep it current across edits (default: the coarse grid lattice)
+
+        The set stays tracked while the caller holds a reference to it.
+        """
+        state = self._state
+        if locations is None and not (len(state.plants) or len(state.storages) or len(state.demands)):
+            # Nothing to lay a lattice over: an empty set
+            lngs = lats = alts = np.empty(0)
+        elif locations is None:
+            opts = GRID_SEARCH_DEFAULTS
+            lngs, lats, _ = self._search_lattice(state, opts['padding_km'], opts['cell_km'], opts['max_cells'])
+            alts = np.zeros(len(lngs))
+        else:
+            locations = np.asarray(locations, dtype=np.float64)
+            lngs, lats = locations[:, 0].copy(), locations[:, 1].copy()
+            alts = locations[:, 2].copy() if locations.shape[1] > 2 else np.zeros(len(locations))
+        weights = weights or {'distance_weight': 0.4, 'safety_weight': 0.6}
+        safety = self._safety_scores(len(lngs), np.random.default_rng(seed))
+        with self._write_lock:
+            # Scored against the latest state under the lock, so no edit can slip in between
+            candidates = CandidateSet(lngs, lats, alts, weights, constraints or {}, safety, self._state)
+            self._tracked.add(candidates)
+        return candidates
+
+    def tracked_recommendations(self, candidates: CandidateSet, num_recommendations: int = 5) -> List[Dict]:
+        """Best `num_recommendations` of a tracked set, from its current scores"""
+        with candidates._lock:
+            return self._rank_candidates(candidates.state, candidates.lngs, candidates.lats, candidates.alts,
+                                         candidates.weights, candidates.constraints, num_recommendations,
+                                         scored=candidates.scored)
+
+    def save_snapshot(self, path: str) -> bool:
+        """Write asset columns, compiled zones and cost model to a versioned snapshot directory.
+
+        Every column is a plain `.npy` file so `load_snapshot` can memory-map it without parsing.
+        Each save writes a fresh `.<name>.*` directory next to `path` and then atomically swaps the
+        `path` symlink onto it, so `path` always names a complete snapshot. Replaced versions are
+        removed once they have been out of use for SNAPSHOT_RETAIN_S, leaving loads that were
+        already reading them time to finish. One writer per path.
+        """
+        import shutil
+        import tempfile
+        import shapely
+        state = self._state
+        try:
+            parent, name = os.path.split(os.path.abspath(path))
+            prefix = f'.{name}.'
+            tmp = tempfile.mkdtemp(prefix=prefix, dir=parent)
+            for _, group, _ in NetworkState.GROUPS:
+                table = getattr(state, group)
+                columns = {'lng': table.lng, 'lat': table.lat, 'alt': table.alt,
+                           'capacity': table.capacity, 'type_code': table.type_codes,
+                           'ids': np.asarray(table.ids, dtype=str) if len(table) else np.empty(0, dtype='<U1')}
+                for name, column in columns.items():
+                    np.save(os.path.join(tmp, f'{group}.{name}.npy'), np.ascontiguousarray(column))
+            np.save(os.path.join(tmp, 'pipelines.offsets.npy'), state.pipeline_offsets)
+            np.save(os.path.join(tmp, 'pipelines.vertices.npy'), state.pipeline_vertices)
+            # Zones: concatenated WKB blobs plus offsets, so the geometry is mappable too
+            wkb = shapely.to_wkb(state.zone_index.geoms) if len(state.zone_index) else []
+            offsets = np.cumsum([0] + [len(b) for b in wkb], dtype=np.int64)
+            np.save(os.path.join(tmp, 'zones.wkb.npy'), np.frombuffer(b''.join(wkb), dtype=np.uint8))
+            np.save(os.path.join(tmp, 'zones.offsets.npy'), offsets)
+            manifest = {
+                'format': SNAPSHOT_FORMAT,
+                'version': SNAPSHOT_VERSION,
+                'type_names': AssetTable.type_names(),
+                'cost_model': state.cost_model,
+                'zones': [{k: v for k, v in zone.items() if k != 'polygon'} for zone in state.regulatory_zones]
+            }
+            with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f)
+            previous = os.path.realpath(path) if os.path.islink(path) else None
+            if os.path.isdir(path) and previous is None:
+                # A plain directory from an older save: move it into the versioned layout first
+                previous = tempfile.mkdtemp(prefix=prefix, dir=parent)
+                os.rmdir(previous)
+                os.rename(path, previous)
+            link = tmp + '.link'
+            os.symlink(os.path.basename(tmp), link)
+            os.replace(link, path)
+            versions = []
+            for entry in os.listdir(parent):
+                full = os.path.join(parent, entry)
+                if not entry.startswith(prefix) or full in (tmp, previous):
+                    continue
+                if os.path.islink(full):
+                    os.unlink(full)  # Link left behind by an interrupted save
+                elif os.path.isdir(full):
+                    versions.append((os.path.getmtime(full), full))
+            # A version went out of use when the next newer one was written
+            versions.sort()
+            replaced_at = [mtime for mtime, _ in versions[1:]] + [os.path.getmtime(previous) if previous else time.time()]
+            for (_, full), out_of_use in zip(versions, replaced_at):
+                if time.time() - out_of_use > SNAPSHOT_RETAIN_S:
+                    shutil.rmtree(full, ignore_errors=True)
+            return True
+        except Exception as e:
+            print(f"Snapshot save error: {e}")
+            return False
+
+    def load_snapshot(self, path: str, mmap: bool = True) -> bool:
+        """Warm start from a snapshot directory; columns are memory-mapped read-only by default"""
+        try:
+            for attempt in range(SNAPSHOT_LOAD_ATTEMPTS):
+                # Pin the current version, so a concurrent save swapping `path` cannot mix two snapshots
+                version = os.path.realpath(path)
+                try:
+                    state = self._read_snapshot(version, mmap)
+                    break
+                except FileNotFoundError:
+                    # Pruned by later saves while being read: start over on the version now current
+                    if os.path.realpath(path) == version or attempt == SNAPSHOT_LOAD_ATTEMPTS - 1:
+                        raise
+            with self._write_lock:
+                self._publish(state)
+            return True
+        except Exception as e:
+            print(f"Snapshot load error: {e}")
+            return False
+
+    @staticmethod
+    def _read_snapshot(path: str, mmap: bool) -> NetworkState:
+        """State of one snapshot version; FileNotFoundError when the version disappears while read"""
+        import shapely
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot {manifest.get('format')} v{manifest.get('version')}")
+        mode = 'r' if mmap else None
+        load = lambda name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode)
+        # Map stored type codes onto this process's vocabulary when it differs
+        remap = np.array([AssetTable.type_code(name) for name in manifest['type_names']], dtype=np.int8)
+        tables = {}
+        for asset_type, group, _ in NetworkState.GROUPS:
+            # Snapshots written before demand centers existed simply have none
+            if not os.path.exists(os.path.join(path, f'{group}.lng.npy')):
+                tables[group] = AssetTable(asset_type)
+                continue
+            type_code = load(f'{group}.type_code')
+            if not np.array_equal(remap, np.arange(len(remap))):
+                type_code = remap[type_code]
+            tables[group] = AssetTable.from_arrays(
+                asset_type, load(f'{group}.ids'), load(f'{group}.lng'), load(f'{group}.lat'),
+                load(f'{group}.alt'), load(f'{group}.capacity'), type_code)
+        blob, offsets = load('zones.wkb'), load('zones.offsets')
+        geoms = np.array(shapely.from_wkb([bytes(blob[offsets[i]:offsets[i + 1]])
+                                           for i in range(len(offsets) - 1)]), dtype=object)
+        zones = [dict(attrs, polygon=[list(c) for c in geom.exterior.coords])
+                 for attrs, geom in zip(manifest['zones'], geoms)]
+        state = NetworkState(zones, manifest['cost_model'], geoms)
+        for _, group, indexes in NetworkState.GROUPS:
+            table = tables[group]
+            setattr(state, group, table)
+            setattr(state, indexes, SpatialIndex(table.lng, table.lat, deferred=True))
+        # Snapshots written before pipeline geometry was kept fall back to point pipelines
+        if os.path.exists(os.path.join(path, 'pipelines.offsets.npy')):
+            state.pipeline_offsets, state.pipeline_vertices = load('pipelines.offsets'), load('pipelines.vertices')
+        # Optional files read as absent once the version is pruned, so make sure it survived the read
+        if not os.path.exists(os.path.join(path, 'manifest.json')):
+            raise FileNotFoundError(f"Snapshot version removed while loading: {path}")
+        state.sync_indexes()
+        state.initialized = True
+        return state
+    
+    def _fast_candidate_generation(self, center: Location, radius_km: float = 50, count: int = 20,
+                                   rng: Optional[np.random.Generator] = None) -> List[Location]:
         """Ultra-fast candidate generation using vectorized operations"""
+        rng = rng or np.random.default_rng()
         # Generate candidates in a circle around center
         angles = np.linspace(0, 2*np.pi, count)
-        distances = np.random.uniform(1, radius_km, count) * 1000  # Convert to meters
+        distances = rng.uniform(1, radius_km, count) * 1000  # Convert to meters
         
         # Approximate coordinate offsets (fast but less accurate for large distances)
         lat_offset = distances * np.cos(angles) / 111320  # meters to degrees lat
@@ -158,186 +2564,847 @@ class OptimizedHydrogenSystem:
         
         return candidates
     
-    def _fast_scoring(self, candidate: Location, weights: Dict[str, float], constraints: Dict[str, Any] = None) -> Tuple[float, List[str], Dict[str, Any]]:
-        """Scoring with regulatory, cost, and custom constraint support. Returns richer metadata."""
-        score = 100.0
+    @staticmethod
+    def _extend_from_records(table: AssetTable, records: List[Dict], id_prefix: str, default_capacity: float) -> None:
+        """Append request records (dicts with a [lng, lat(, alt)] location) to a table in one batch"""
+        if not records:
+            return
+        base = len(table)
+        locs = [r['location'] for r in records]
+        table.extend(
+            [r.get('id', f"{id_prefix}_{base + i}") for i, r in enumerate(records)],
+            [loc[0] for loc in locs],
+            [loc[1] for loc in locs],
+            [loc[2] if len(loc) > 2 else 0 for loc in locs],
+            [r.get('capacity', default_capacity) for r in records]
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory footprint of the prepared network (tables plus indexes)"""
+        return self._state.nbytes
+
+    def nearest_assets(self, location: List[float], asset_type: str = 'plant', k: int = 5) -> List[Dict]:
+        """k nearest assets of one type to a [lng, lat] location"""
+        assets, index = self._state.group(asset_type)
+        dists, idx = index.nearest([location[0]], [location[1]], k)
+        return [{'asset': assets[i], 'distance_m': float(d)} for d, i in zip(dists[0], idx[0])]
+
+    def nearest_pipelines(self, locations: List[List[float]]) -> List[Dict]:
+        """Nearest existing pipeline per [lng, lat] location, with the tap-in point on its polyline"""
+        state = self._state
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, np.shape(locations)[-1])
+        dist, seg, tap_lng, tap_lat = state.segment_index.nearest(locations[:, 0], locations[:, 1])
+        owner = state.segment_index.owner
+        return [{'pipeline_id': str(state.pipelines.ids[owner[j]]), 'distance_m': float(d),
+                 'tap_in': [float(x), float(y)]} if j >= 0 else None
+                for d, j, x, y in zip(dist, seg, tap_lng, tap_lat)]
+
+    def pipeline_corridor_overlap(self, path: List[List[float]], buffer_m: float = PIPELINE_CORRIDOR_M) -> Dict:
+        """How much of a proposed path runs within `buffer_m` of existing pipelines, and along which"""
+        state = self._state
+        path = np.array([vertex[:2] for vertex in path], dtype=np.float64).reshape(-1, 2)
+        share, shared = state.segment_index.corridor_overlap(path[:, 0], path[:, 1], buffer_m)
+        return {'overlap': share, 'pipelines': [str(state.pipelines.ids[i]) for i in shared]}
+
+    def assets_within(self, location: List[float], radius_km: float, asset_type: str = 'plant') -> List[Dict]:
+        """All assets of one type within radius_km of a [lng, lat] location, nearest first"""
+        assets, index = self._state.group(asset_type)
+        dists, idx = index.within(location[0], location[1], radius_km * 1000)
+        return [{'asset': assets[i], 'distance_m': float(d)} for d, i in zip(dists, idx)]
+
+    @staticmethod
+    def _nearest_plants(state: NetworkState, lngs: np.ndarray, lats: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Minimum distance (m) and nearest plant index for every candidate via the plant index"""
+        dists, idx = state.plant_index.nearest(lngs, lats, 1)
+        return dists[:, 0], idx[:, 0]
+    
+    def _fast_scoring(self, candidate: Location, weights: Dict[str, float], constraints: Dict[str, Any] = None,
+                      state: Optional[NetworkState] = None,
+                      rng: Optional[np.random.Generator] = None) -> Tuple[float, List[str], Dict[str, Any]]:
+        """Scoring with regulatory, cost, and custom constraint support. Returns richer metadata.
+
+        `state` is the network state the caller pinned (the current one by default).
+        """
+        state = state or self._state
+        constraints = constraints or {}
+        scored = score_arrays(np.array([candidate.lng]), np.array([candidate.lat]), state.plant_index,
+                              len(state.plants), state.zone_index, state.cost_model, weights, constraints,
+                              self._safety_scores(1, rng), state.segment_index)
+        return self._explain(state, scored, 0, state.zone_index.containing([candidate.lng], [candidate.lat])[0])
+
+    @staticmethod
+    def _safety_scores(n: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        return 85 + (rng or np.random.default_rng()).uniform(-10, 15, n)
+
+    @staticmethod
+    def _explain(state: NetworkState, scored: Dict[str, np.ndarray], i: int,
+                 zone_ids: np.ndarray) -> Tuple[float, List[str], Dict[str, Any]]:
+        """Reasons and metadata for row i of a `score_arrays` result"""
         reasons = []
         meta = {}
-        constraints = constraints or {}
-        # Distance to nearest plant (if storages exist)
-        if self.plants and weights.get('distance_weight', 0.3) > 0:
-            min_dist = min(candidate.distance_to(p.location) for p in self.plants)
+        if scored['nearest'][i] >= 0:
+            min_dist = float(scored['min_dist'][i])
             meta['min_dist_to_plant'] = min_dist
+            meta['nearest_plant_id'] = str(state.plants.ids[int(scored['nearest'][i])])
             if min_dist > 100000:
-                score -= 30
                 reasons.append("Far from plants")
             elif min_dist < 5000:
-                score += 20
                 reasons.append("Close to plants")
-        # Regulatory zone penalty/bonus
-        in_reg_zone = False
-        for zone in self.regulatory_zones:
-            # Assume zone is a dict with 'polygon' (list of [lng,lat]) and 'penalty' or 'bonus'
-            from shapely.geometry import Point, Polygon
-            poly = Polygon(zone.get('polygon', []))
-            pt = Point(candidate.lng, candidate.lat)
-            if poly.contains(pt):
-                in_reg_zone = True
-                if 'penalty' in zone:
-                    score -= zone['penalty']
-                    reasons.append(f"Regulatory penalty: {zone['penalty']}")
-                if 'bonus' in zone:
-                    score += zone['bonus']
-                    reasons.append(f"Regulatory bonus: {zone['bonus']}")
-        meta['in_regulatory_zone'] = in_reg_zone
-        # Cost model
-        cost = self.cost_model.get('base_cost', 100)
-        cost += self.cost_model.get('distance_cost', 0.01) * meta.get('min_dist_to_plant', 0)
-        meta['cost_estimate'] = cost
-        if 'max_cost' in constraints and cost > constraints['max_cost']:
-            score -= 50
+        for zone_id in zone_ids:
+            zone = state.zone_index.zones[zone_id]
+            if 'penalty' in zone:
+                reasons.append(f"Regulatory penalty: {zone['penalty']}")
+            if 'bonus' in zone:
+                reasons.append(f"Regulatory bonus: {zone['bonus']}")
+        meta['in_regulatory_zone'] = len(zone_ids) > 0
+        meta['cost_estimate'] = float(scored['cost'][i])
+        if scored['over_cost'][i]:
             reasons.append("Cost exceeds max_cost constraint")
-        # Custom constraints
-        if 'min_capacity' in constraints and constraints['min_capacity'] > 0:
-            if getattr(candidate, 'capacity', 100) < constraints['min_capacity']:
-                score -= 20
-                reasons.append("Below min_capacity constraint")
-        # Basic safety check (simulated)
-        safety_score = 85 + np.random.uniform(-10, 15)
-        score = score * (safety_score / 100)
+        if scored['below_capacity'][i]:
+            reasons.append("Below min_capacity constraint")
+        pipeline_dist = float(scored['pipeline_dist'][i])
+        if math.isfinite(pipeline_dist):
+            meta['pipeline_distance_km'] = pipeline_dist / 1000
+            if pipeline_dist < PIPELINE_PROXIMITY_M:
+                reasons.append("Near existing pipeline")
+        safety_score = float(scored['safety'][i])
         meta['safety_score'] = safety_score
         if safety_score < 70:
             reasons.append("Safety concerns")
         elif safety_score > 90:
             reasons.append("Excellent safety")
-        # Capacity bonus
-        if len(self.plants) < 3:
-            score += 10
+        if len(state.plants) < 3:
             reasons.append("Network expansion benefit")
-        meta['final_score'] = max(0, score)
-        return max(0, score), reasons, meta
-    
-    def optimize_plant_location(self, constraints: Dict[str, Any] = None, 
-                              weights: Dict[str, float] = None, 
-                              num_recommendations: int = 5) -> List[Dict]:
-        """Plant location optimization with regulatory/cost/constraint support and rich metadata"""
-        if not self._initialized or not self.storages:
-            return []
-        constraints = constraints or {}
-        weights = weights or {'distance_weight': 0.4, 'safety_weight': 0.6}
-        all_candidates = []
-        for storage in self.storages[:3]:
-            candidates = self._fast_candidate_generation(storage.location, 30, 10)
-            all_candidates.extend(candidates)
+        score = float(scored['score'][i])
+        meta['final_score'] = score
+        return score, reasons, meta
+
+    def _parallel_scorer(self, state: NetworkState, workers: int) -> ParallelScorer:
+        """Process pool bound to `state`, reused until the network or worker count changes"""
+        with self._write_lock:
+            cached = self._scorer
+            if cached is None or cached.state is not state or cached.workers != workers:
+                cached = ParallelScorer(state, workers)
+                self._scorer = cached
+            return cached
+
+    @metrics.timed('scoring')
+    def _score_batch(self, state: NetworkState, lngs: np.ndarray, lats: np.ndarray,
+                     weights: Dict[str, float], constraints: Dict[str, Any], workers: int = 1,
+                     rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+        """Score a candidate array in one vectorized pass (sharded over processes when `workers` > 1)"""
+        safety = self._safety_scores(len(lngs), rng)
+        if workers > 1 and len(lngs) >= PARALLEL_MIN_CANDIDATES:
+            return self._parallel_scorer(state, workers).score(lngs, lats, weights, constraints, safety)
+        return score_arrays(lngs, lats, state.plant_index, len(state.plants), state.zone_index,
+                            state.cost_model, weights, constraints, safety, state.segment_index)
+
+    def _rank_candidates(self, state: NetworkState, lngs: np.ndarray, lats: np.ndarray, alts: np.ndarray,
+                         weights: Dict[str, float], constraints: Dict[str, Any], top_n: int,
+                         workers: int = 1, scored: Optional[Dict[str, np.ndarray]] = None,
+                         rng: Optional[np.random.Generator] = None) -> List[Dict]:
+        """Score a candidate array (unless already `scored`) and describe only the best `top_n`"""
+        if scored is None:
+            scored = self._score_batch(state, lngs, lats, weights, constraints, workers, rng)
+        with metrics.stage('sort'):
+            top = top_k_indices(scored['score'], top_n)
+        return self._describe_sites(state, lngs, lats, alts, scored, top)
+
+    @metrics.timed('describe')
+    def _describe_sites(self, state: NetworkState, lngs: np.ndarray, lats: np.ndarray, alts: np.ndarray,
+                        scored: Dict[str, np.ndarray], rows: np.ndarray) -> List[Dict]:
+        """Recommendation records for the candidate `rows`, in the given order"""
+        zone_hits = state.zone_index.containing(lngs[rows], lats[rows])
         recommendations = []
-        for candidate in all_candidates[:30]:
-            score, reasons, meta = self._fast_scoring(candidate, weights, constraints)
+        for rank, i in enumerate(rows):
+            score, reasons, meta = self._explain(state, scored, i, zone_hits[rank])
             recommendations.append({
-                'location': [candidate.lng, candidate.lat, candidate.alt],
+                'location': [float(lngs[i]), float(lats[i]), float(alts[i])],
                 'score': score,
                 'reasons': reasons,
                 'metadata': meta
             })
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
-        return recommendations[:num_recommendations]
-    
-    def optimize_storage_location(self, constraints: Dict[str, Any] = None,
-                                weights: Dict[str, float] = None,
-                                num_recommendations: int = 5) -> List[Dict]:
-        """Storage location optimization with regulatory/cost/constraint support and rich metadata"""
-        if not self._initialized or not self.plants:
-            return []
-        constraints = constraints or {}
-        weights = weights or {'distance_weight': 0.5, 'safety_weight': 0.5}
-        all_candidates = []
-        for plant in self.plants[:3]:
-            candidates = self._fast_candidate_generation(plant.location, 25, 8)
-            all_candidates.extend(candidates)
+        return recommendations
+
+    def score_locations(self, locations: np.ndarray, constraints: Dict[str, Any] = None,
+                        weights: Dict[str, float] = None, num_recommendations: int = 5,
+                        workers: int = 1, seed: Optional[int] = None) -> List[Dict]:
+        """Rank an arbitrary (n, 2|3) array of [lng, lat(, alt)] candidate sites"""
+        state = self._state
+        locations = np.asarray(locations, dtype=np.float64)
+        alts = locations[:, 2] if locations.shape[1] > 2 else np.zeros(len(locations))
+        return self._rank_candidates(state, locations[:, 0], locations[:, 1], alts, weights or {},
+                                     constraints or {}, num_recommendations, workers,
+                                     rng=np.random.default_rng(seed))
+
+    @staticmethod
+    def _search_lattice(state: NetworkState, padding_km: float, cell_km: Optional[float],
+                        max_cells: int) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Hex lattice over the padded extent of the network with at most `max_cells` cells"""
+        net_lngs = np.concatenate((state.plants.lng, state.storages.lng, state.demands.lng))
+        net_lats = np.concatenate((state.plants.lat, state.storages.lat, state.demands.lat))
+        pad_lat = padding_km * 1000 / METERS_PER_DEGREE
+        mid_cos = max(math.cos(math.radians(float(net_lats.mean()))), 1e-6)
+        pad_lng = pad_lat / mid_cos
+        box = (float(net_lngs.min()) - pad_lng, float(net_lats.min()) - pad_lat,
+               float(net_lngs.max()) + pad_lng, float(net_lats.max()) + pad_lat)
+        max_cells = max(int(max_cells), 1)
+        if cell_km:
+            spacing = float(cell_km) * 1000
+        else:
+            # A hex cell covers sqrt(3)/2 * spacing^2; size the lattice to about max_cells
+            area = (box[2] - box[0]) * mid_cos * (box[3] - box[1]) * METERS_PER_DEGREE ** 2
+            spacing = max(math.sqrt(area / (max_cells * math.sqrt(3) / 2)), 1.0)
+        lngs, lats = hex_lattice(*box, spacing)
+        while len(lngs) > max_cells:
+            spacing *= math.sqrt(len(lngs) / max_cells) * 1.01
+            lngs, lats = hex_lattice(*box, spacing)
+        return lngs, lats, spacing
+
+    def _site_batches(self, state: NetworkState, anchors: List[Asset], radius_km: float, per_anchor: int,
+                      weights: Dict[str, float], constraints: Dict[str, Any], workers: int, search_mode: str,
+                      options: Optional[Dict[str, Any]], rng: np.random.Generator, batch_size: Optional[int],
+                      stats: Dict[str, Any]):
+        """Yield (lngs, lats, alts, scored) candidate batches for an 'anchors' or 'grid' search
+
+        Without `batch_size` each candidate set is scored in one pass; with it, batches start at
+        STREAM_FIRST_BATCH and double up to `batch_size` so the first ranking arrives quickly.
+        """
+        size = min(STREAM_FIRST_BATCH, int(batch_size)) if batch_size else None
+
+        def score_all(lngs: np.ndarray, lats: np.ndarray, alts: np.ndarray):
+            nonlocal size
+            if size is None:
+                scored = self._score_batch(state, lngs, lats, weights, constraints, workers, rng)
+                yield lngs, lats, alts, scored
+                return scored
+            parts, lo = [], 0
+            while lo < len(lngs):
+                hi = lo + size
+                scored = self._score_batch(state, lngs[lo:hi], lats[lo:hi], weights, constraints, workers, rng)
+                parts.append(scored)
+                yield lngs[lo:hi], lats[lo:hi], alts[lo:hi], scored
+                lo, size = hi, min(size * 2, int(batch_size))
+            return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]} if parts else {}
+
+        if search_mode == 'anchors':
+            candidates = []
+            with metrics.stage('candidate_generation'):
+                for anchor in anchors:
+                    candidates.extend(self._fast_candidate_generation(anchor.location, radius_km, per_anchor, rng))
+            yield from score_all(np.array([c.lng for c in candidates], dtype=np.float64),
+                                 np.array([c.lat for c in candidates], dtype=np.float64),
+                                 np.array([c.alt for c in candidates], dtype=np.float64))
+            return
+        # Exhaustive hex-lattice search over the network's extent with coarse-to-fine refinement
+        opts = dict(GRID_SEARCH_DEFAULTS, **(options or {}))
+        with metrics.stage('candidate_generation'):
+            lngs, lats, spacing = self._search_lattice(state, opts['padding_km'], opts['cell_km'], opts['max_cells'])
+        stats.update(coarse_cells=len(lngs), levels=0)
+        scored = yield from score_all(lngs, lats, np.zeros(len(lngs)))
+        factor = max(float(opts['refine_factor']), 1.5)
+        for _ in range(int(opts['levels'])):
+            with metrics.stage('candidate_generation'):
+                best = top_k_indices(scored['score'], int(opts['refine_top']))
+                # Each refined patch spans the parent cell's neighbourhood at 1/factor spacing
+                lngs, lats = hex_patches(lngs[best], lats[best], spacing, spacing / factor)
+            spacing /= factor
+            scored = yield from score_all(lngs, lats, np.zeros(len(lngs)))
+            stats['levels'] += 1
+        stats['final_cell_m'] = round(spacing, 1)
+
+    @metrics.timed('facility_search')
+    def _facility_search(self, state: NetworkState, asset_type: str, weights: Dict[str, float],
+                         constraints: Dict[str, Any], k: int, workers: int,
+                         options: Optional[Dict[str, Any]] = None,
+                         rng: Optional[np.random.Generator] = None) -> Tuple[List[Dict], Dict[str, Any]]:
+        """Pick k new sites together (p-median over a hex lattice), existing sites staying open;
+        returns (recommendations, search stats)
+
+        Demand comes from the demand centers, or from the other asset group when there are none.
+        With `capacity` set, demand is assigned to the chosen sites under capacity limits.
+        """
+        started = time.perf_counter()
+        opts = dict(FACILITY_SEARCH_DEFAULTS, **(options or {}))
+        existing = state.plants if asset_type == 'plant' else state.storages
+        served = state.demands if len(state.demands) else (state.storages if asset_type == 'plant' else state.plants)
+        live = served.capacity > 0
+        d_lngs, d_lats, demand = served.lng[live], served.lat[live], served.capacity[live]
+        if not len(demand) or k < 1:
+            return [], {}
+        max_cells = min(int(opts['max_cells']), max(int(opts['max_matrix']) // len(demand), 1))
+        lngs, lats, spacing = self._search_lattice(state, opts['padding_km'], opts['cell_km'], max_cells)
+        scored = self._score_batch(state, lngs, lats, weights, constraints, workers, rng)
+        # Sites over budget or below the capacity floor are not eligible (unless none are)
+        eligible = ~(scored['over_cost'] | scored['below_capacity'])
+        if eligible.any():
+            lngs, lats = lngs[eligible], lats[eligible]
+            scored = {key: values[eligible] for key, values in scored.items()}
+        dist_km = haversine_matrix(lngs, lats, d_lngs, d_lats) / 1000
+        fixed_km = haversine_matrix(existing.lng, existing.lat, d_lngs, d_lats) / 1000
+        chosen, stats = facility_location(dist_km, demand, k, fixed_km, int(opts['max_swaps']))
+        open_km = np.vstack((fixed_km, dist_km[chosen]))
+        capacity = opts['capacity']
+        if capacity is not None:
+            caps = np.concatenate((existing.capacity, np.full(len(chosen), float(capacity))))
+            amounts, unmet, _ = capacitated_assignment(open_km, demand, caps, int(opts['neighbors']))
+        else:
+            amounts = np.zeros_like(open_km)
+            amounts[np.argmin(open_km, axis=0), np.arange(len(demand))] = demand
+            unmet = np.zeros(len(demand))
+        amounts = amounts[len(existing):]
+        zone_hits = state.zone_index.containing(lngs[chosen], lats[chosen])
         recommendations = []
-        for candidate in all_candidates[:24]:
-            score, reasons, meta = self._fast_scoring(candidate, weights, constraints)
+        for rank, i in enumerate(chosen):
+            score, reasons, meta = self._explain(state, scored, i, zone_hits[rank])
+            assigned = float(amounts[rank].sum())
+            points = int((amounts[rank] > 0).sum())
+            meta['assigned_demand'] = assigned
+            meta['demand_points'] = points
+            meta['mean_distance_km'] = float(amounts[rank] @ dist_km[i] / assigned) if assigned > 0 else None
+            reasons.append(f"Serves {points} demand points")
             recommendations.append({
-                'location': [candidate.lng, candidate.lat, candidate.alt],
+                'location': [float(lngs[i]), float(lats[i]), 0.0],
                 'score': score,
                 'reasons': reasons,
                 'metadata': meta
             })
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
-        return recommendations[:num_recommendations]
+        recommendations.sort(key=lambda r: -r['metadata']['assigned_demand'])
+        return recommendations, dict(
+            stats,
+            mode='facility',
+            capacitated=capacity is not None,
+            unmet_demand=float(unmet.sum()),
+            cell_m=round(spacing, 1),
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 2)
+        )
+
+    def _stream_sites(self, state: NetworkState, asset_type: str, anchors: List[Asset], radius_km: float,
+                      per_anchor: int, constraints: Dict[str, Any], weights: Dict[str, float], top_n: int,
+                      workers: int, search_mode: str, search_options: Optional[Dict[str, Any]],
+                      seed: Optional[int], batch_size: Optional[int] = None):
+        """Run one siting search, yielding progress snapshots; the last has done=True and the final ranking
+
+        With `batch_size`, a snapshot follows every batch that changes the current best `top_n`.
+        Seeded requests are reproducible and served from the result cache.
+        """
+        if search_mode not in ('anchors', 'grid', 'facility'):
+            raise ValueError(f"Unknown search_mode: {search_mode}")
+        started = time.perf_counter()
+
+        def snapshot(recommendations: List[Dict], scored: Optional[int], batches: int, done: bool) -> Dict[str, Any]:
+            return {
+                'recommendations': recommendations,
+                'candidates_scored': scored,
+                'batches': batches,
+                'done': done,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+            }
+
+        key = None
+        if seed is not None:
+            key = ResultCache.key(state.fingerprint, asset_type, search_mode, top_n, constraints, weights,
+                                  search_options, seed)
+            cached = self._results.get(key)
+            if cached is not None:
+                recommendations, stats = cached
+                if stats:
+                    self.last_search_stats = dict(stats, cached=True)
+                yield snapshot(recommendations, None, 0, True)
+                return
+        rng = np.random.default_rng(seed)
+        stats = None
+        if search_mode == 'facility':
+            recommendations, stats = self._facility_search(state, asset_type, weights, constraints, top_n,
+                                                           workers, search_options, rng)
+            scored, batches = stats.get('candidates'), 1
+        else:
+            top = TopK(top_n)
+            grid_stats: Dict[str, Any] = {}
+            for batch in self._site_batches(state, anchors, radius_km, per_anchor, weights, constraints, workers,
+                                            search_mode, search_options, rng, batch_size, grid_stats):
+                if top.push(*batch) and batch_size:
+                    yield snapshot(self._describe_top(state, top), top.seen, top.batches, False)
+            recommendations = self._describe_top(state, top)
+            scored, batches = top.seen, top.batches
+            if search_mode == 'grid':
+                stats = {
+                    'mode': 'grid',
+                    'coarse_cells': grid_stats['coarse_cells'],
+                    'candidates_scored': top.seen,
+                    'levels': grid_stats['levels'],
+                    'final_cell_m': grid_stats['final_cell_m'],
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+                }
+        if stats:
+            # Reporting only: the stats of this search travel in `stats`, never back through the attribute
+            self.last_search_stats = stats
+        if key is not None:
+            self._results.put(key, (recommendations, stats))
+        yield snapshot(recommendations, scored, batches, True)
+
+    def _describe_top(self, state: NetworkState, top: TopK) -> List[Dict]:
+        if not len(top):
+            return []
+        return self._describe_sites(state, top.lngs, top.lats, top.alts, top.scored, np.arange(len(top)))
+
+    def _site_search(self, asset_type: str, constraints: Optional[Dict[str, Any]],
+                     weights: Optional[Dict[str, float]], num_recommendations: int, workers: int,
+                     search_mode: str, search_options: Optional[Dict[str, Any]], seed: Optional[int],
+                     batch_size: Optional[int] = None):
+        state = self._state
+        anchor_group, radius_km, per_anchor, default_weights = self.SITE_SEARCH[asset_type]
+        anchors = getattr(state, anchor_group)
+        if not state.initialized or not anchors:
+            yield {'recommendations': [], 'candidates_scored': 0, 'batches': 0, 'done': True, 'elapsed_ms': 0.0}
+            return
+        yield from self._stream_sites(state, asset_type, anchors[:3], radius_km, per_anchor, constraints or {},
+                                      weights or default_weights, num_recommendations, workers, search_mode,
+                                      search_options, seed, batch_size)
+
+    @staticmethod
+    def _final(progress_stream) -> List[Dict]:
+        for progress in progress_stream:
+            pass
+        return progress['recommendations']
+
+    def optimize_plant_location(self, constraints: Dict[str, Any] = None, 
+                              weights: Dict[str, float] = None, 
+                              num_recommendations: int = 5, workers: int = 1,
+                              search_mode: str = 'anchors', search_options: Dict[str, Any] = None,
+                              seed: Optional[int] = None) -> List[Dict]:
+        """Plant location optimization with regulatory/cost/constraint support and rich metadata
+
+        search_mode='grid' scans a hex lattice over the whole network instead of sampling around anchors;
+        search_mode='facility' picks the `num_recommendations` sites jointly to cover demand.
+        With a `seed` the result is reproducible, and repeats of the same request are cached.
+        """
+        return self._final(self._site_search('plant', constraints, weights, num_recommendations, workers,
+                                             search_mode, search_options, seed))
     
-    def optimize_pipeline_route(self, start_location: List[float], end_location: List[float],
-                              constraints: Dict[str, Any] = None,
-                              weights: Dict[str, float] = None,
-                              num_recommendations: int = 3) -> List[Dict]:
-        """Pipeline route optimization with regulatory/cost/constraint support and rich metadata"""
-        from shapely.geometry import LineString, Point, Polygon
-        start = Location(start_location[0], start_location[1], start_location[2] if len(start_location) > 2 else 0)
-        end = Location(end_location[0], end_location[1], end_location[2] if len(end_location) > 2 else 0)
-        routes = []
-        direct_distance = start.distance_to(end)
-        direct_score = max(10, 100 - (direct_distance / 1000))
-        meta = {'distance_km': direct_distance / 1000}
-        # Regulatory zone intersection
-        line = LineString([(start.lng, start.lat), (end.lng, end.lat)])
+    def optimize_storage_location(self, constraints: Dict[str, Any] = None,
+                                weights: Dict[str, float] = None,
+                                num_recommendations: int = 5, workers: int = 1,
+                                search_mode: str = 'anchors', search_options: Dict[str, Any] = None,
+                                seed: Optional[int] = None) -> List[Dict]:
+        """Storage location optimization with regulatory/cost/constraint support and rich metadata
+
+        search_mode='grid' scans a hex lattice over the whole network instead of sampling around anchors;
+        search_mode='facility' picks the `num_recommendations` sites jointly to cover demand.
+        With a `seed` the result is reproducible, and repeats of the same request are cached.
+        """
+        return self._final(self._site_search('storage', constraints, weights, num_recommendations, workers,
+                                             search_mode, search_options, seed))
+
+    def stream_plant_location(self, constraints: Dict[str, Any] = None, weights: Dict[str, float] = None,
+                              num_recommendations: int = 5, workers: int = 1, search_mode: str = 'anchors',
+                              search_options: Dict[str, Any] = None, seed: Optional[int] = None,
+                              batch_size: int = STREAM_BATCH_SIZE):
+        """Generator form of `optimize_plant_location`: yields the current top-K as candidate batches finish
+
+        Each item is {'recommendations', 'candidates_scored', 'batches', 'done', 'elapsed_ms'}; the last has
+        done=True and matches `optimize_plant_location` for the same arguments.
+        """
+        return self._site_search('plant', constraints, weights, num_recommendations, workers,
+                                 search_mode, search_options, seed, batch_size)
+
+    def stream_storage_location(self, constraints: Dict[str, Any] = None, weights: Dict[str, float] = None,
+                                num_recommendations: int = 5, workers: int = 1, search_mode: str = 'anchors',
+                                search_options: Dict[str, Any] = None, seed: Optional[int] = None,
+                                batch_size: int = STREAM_BATCH_SIZE):
+        """Generator form of `optimize_storage_location` (see `stream_plant_location`)"""
+        return self._site_search('storage', constraints, weights, num_recommendations, workers,
+                                 search_mode, search_options, seed, batch_size)
+
+    def _route_surface(self, state: NetworkState) -> RouteCostSurface:
+        """Cost surface bound to the state's zones, reused until the zones change"""
+        with self._write_lock:
+            cached = self._surface
+            if cached is None or cached.zone_index is not state.zone_index:
+                cached = RouteCostSurface(state.zone_index)
+                self._surface = cached
+            return cached
+
+    def _route_window(self, state: NetworkState, lngs: np.ndarray, lats: np.ndarray, span: float,
+                      max_cells: Optional[int] = None, target_cells: int = ROUTE_TARGET_CELLS):
+        """Grid level and cost window covering a set of endpoints: (cell_deg, row0, col0, mult, dx, dy)
+
+        `span` (degrees, east-west scaled by latitude) over `target_cells` sets the grid level; the
+        window is the endpoints' bounding box plus a corridor margin, coarsened to fit `max_cells`.
+        """
+        span = max(span, 1e-6)
+        # Power-of-two cells keep the grid levels (and their cached tiles) shared across queries
+        cell_deg = 2.0 ** min(max(round(math.log2(span / target_cells)), -14), 0)
+        lat_mid = (float(np.min(lats)) + float(np.max(lats))) / 2
+        while True:
+            pad = max(ROUTE_CORRIDOR_PAD * span, 4 * cell_deg)
+            row0 = math.floor(max(float(np.min(lats)) - pad, -89.0) / cell_deg)
+            row1 = math.floor(min(float(np.max(lats)) + pad, 89.0) / cell_deg)
+            pad_lng = pad / max(math.cos(math.radians(lat_mid)), 1e-6)
+            col0 = math.floor((float(np.min(lngs)) - pad_lng) / cell_deg)
+            col1 = math.floor((float(np.max(lngs)) + pad_lng) / cell_deg)
+            rows, cols = row1 - row0 + 1, col1 - col0 + 1
+            if max_cells is None or rows * cols <= max_cells or cell_deg >= 1:
+                break
+            cell_deg *= 2
+        mult = self._route_surface(state).window(cell_deg, row0, col0, rows, cols)
+        row_lats = (row0 + np.arange(rows) + 0.5) * cell_deg
+        dx = cell_deg * METERS_PER_DEGREE * np.maximum(np.cos(np.radians(row_lats)), 1e-6)
+        return cell_deg, row0, col0, mult, dx, cell_deg * METERS_PER_DEGREE
+
+    @staticmethod
+    def _route_span(start_lngs: np.ndarray, start_lats: np.ndarray,
+                    end_lngs: np.ndarray, end_lats: np.ndarray) -> np.ndarray:
+        """Start-end separation in degrees of latitude (east-west scaled by latitude)"""
+        cos_mid = np.cos(np.radians((np.asarray(start_lats) + np.asarray(end_lats)) / 2))
+        return np.maximum(np.abs(np.asarray(end_lngs) - np.asarray(start_lngs)) * cos_mid,
+                          np.abs(np.asarray(end_lats) - np.asarray(start_lats)))
+
+    def _route_corridor(self, state: NetworkState, start: Location, end: Location):
+        """Grid level and cost window of the corridor between two points"""
+        span = float(self._route_span(start.lng, start.lat, end.lng, end.lat))
+        return self._route_window(state, np.array([start.lng, end.lng]), np.array([start.lat, end.lat]), span)
+
+    @staticmethod
+    def _route_coords(kept: List[int], start: Location, end: Location, cell_deg: float,
+                      row0: int, col0: int, cols: int) -> List[List[float]]:
+        """Polyline through the kept cell centers, pinned to the exact endpoints"""
+        coords = [[start.lng, start.lat, start.alt]]
+        for node in kept[1:-1]:
+            r, c = divmod(node, cols)
+            coords.append([(col0 + c + 0.5) * cell_deg, (row0 + r + 0.5) * cell_deg, 0])
+        coords.append([end.lng, end.lat, end.alt])
+        return coords
+
+    @staticmethod
+    def _zone_guard(state: NetworkState, path: List[int], start: Location, end: Location, cell_deg: float,
+                    row0: int, col0: int, cols: int) -> Optional[Callable[[int, int], bool]]:
+        """Shortcut veto for `_smooth_cells`: no straight segment may enter a penalty zone the cells it
+        skips stay out of (the raster only samples cell centers, so a shortcut can clip a zone corner)
+        """
+        from shapely.geometry import LineString
+        zone_index = state.zone_index
+        if not len(zone_index) or not (zone_index.penalty > 0).any():
+            return None
+        coords = [(c[0], c[1]) for c in OptimizedHydrogenSystem._route_coords(
+            path, start, end, cell_deg, row0, col0, cols)]
+
+        def penalized(line) -> set:
+            hits = zone_index.crossed_by(line)
+            return set(hits[zone_index.penalty[hits] > 0].tolist())
+
+        def blocked(i: int, j: int) -> bool:
+            crossed = penalized(LineString([coords[i], coords[j]]))
+            return bool(crossed) and not crossed <= penalized(LineString(coords[i:j + 1]))
+        return blocked
+
+    def _describe_route(self, state: NetworkState, route_id: str, coords: List[List[float]], surcharge_m: float,
+                        constraints: Dict[str, Any], extra: Dict[str, Any]) -> Dict:
+        """Score a routed polyline: length, zones crossed, cost estimate and constraint penalties
+
+        `surcharge_m` is the zone cost on top of the plain length, in meters of ordinary pipeline.
+        """
+        from shapely.geometry import LineString
+        lngs = np.array([c[0] for c in coords])
+        lats = np.array([c[1] for c in coords])
+        length = float(haversine_pairwise(lngs[:-1], lats[:-1], lngs[1:], lats[1:]).sum())
+        meta = {'distance_km': length / 1000}
         reg_penalty = 0
         reg_zones_crossed = 0
-        for zone in self.regulatory_zones:
-            poly = Polygon(zone.get('polygon', []))
-            if line.intersects(poly):
-                reg_zones_crossed += 1
-                if 'penalty' in zone:
-                    reg_penalty += zone['penalty']
+        for zone_id in state.zone_index.crossed_by(LineString([(c[0], c[1]) for c in coords])):
+            zone = state.zone_index.zones[zone_id]
+            reg_zones_crossed += 1
+            if 'penalty' in zone:
+                reg_penalty += zone['penalty']
         meta['reg_zones_crossed'] = reg_zones_crossed
         meta['reg_penalty'] = reg_penalty
-        total_score = direct_score - reg_penalty
-        # Cost model
-        cost = self.cost_model.get('base_cost', 100) + self.cost_model.get('distance_cost', 0.01) * direct_distance
+        distance_cost = state.cost_model.get('distance_cost', 0.01)
+        cost = state.cost_model.get('base_cost', 100) + distance_cost * (length + surcharge_m)
         meta['cost_estimate'] = cost
+        meta['zone_surcharge'] = distance_cost * surcharge_m
+        if len(state.pipelines):
+            share, shared = state.segment_index.corridor_overlap(lngs, lats, PIPELINE_CORRIDOR_M)
+            meta['pipeline_overlap'] = share
+            meta['shared_corridor_pipelines'] = [str(state.pipelines.ids[i]) for i in shared]
+        meta.update(extra)
+        total_score = max(10, 100 - meta['distance_km']) - reg_penalty
         if constraints and 'max_cost' in constraints and cost > constraints['max_cost']:
             total_score -= 50
-        routes.append({
-            'route_id': 'direct',
-            'path': [[start.lng, start.lat, start.alt], [end.lng, end.lat, end.alt]],
+        return {
+            'route_id': route_id,
+            'path': coords,
             'total_score': total_score,
             'metadata': meta,
-            'reasoning': ['Direct route', 'Minimal infrastructure']
-        })
-        # Add one alternative route with waypoint
-        if num_recommendations > 1:
-            mid_lat = (start.lat + end.lat) / 2 + 0.01
-            mid_lng = (start.lng + end.lng) / 2 + 0.01
-            waypoint_line = LineString([(start.lng, start.lat), (mid_lng, mid_lat), (end.lng, end.lat)])
-            reg_penalty_wp = 0
-            reg_zones_crossed_wp = 0
-            for zone in self.regulatory_zones:
-                poly = Polygon(zone.get('polygon', []))
-                if waypoint_line.intersects(poly):
-                    reg_zones_crossed_wp += 1
-                    if 'penalty' in zone:
-                        reg_penalty_wp += zone['penalty']
-            meta_wp = {
-                'distance_km': meta['distance_km'] * 1.1,
-                'reg_zones_crossed': reg_zones_crossed_wp,
-                'reg_penalty': reg_penalty_wp,
-                'cost_estimate': cost * 1.1
-            }
-            total_score_wp = direct_score - 10 - reg_penalty_wp
-            if constraints and 'max_cost' in constraints and meta_wp['cost_estimate'] > constraints['max_cost']:
-                total_score_wp -= 50
-            routes.append({
-                'route_id': 'waypoint',
-                'path': [[start.lng, start.lat, start.alt], [mid_lng, mid_lat, 0], [end.lng, end.lat, end.alt]],
-                'total_score': total_score_wp,
-                'metadata': meta_wp,
-                'reasoning': ['Alternative path', 'Avoids potential obstacles']
-            })
+            'reasoning': []
+        }
+
+    @staticmethod
+    def _route_shape(state: NetworkState, route: Dict) -> str:
+        from shapely.geometry import LineString
+        crossed = route['metadata']['reg_zones_crossed']
+        if crossed:
+            return f"Crosses {crossed} regulatory zone(s)"
+        path = route['path']
+        if len(path) == 2:
+            return 'Direct corridor'
+        # Only a detour if the direct line would have entered a penalty zone this route stays out of
+        zone_index = state.zone_index
+        direct = zone_index.crossed_by(LineString([path[0][:2], path[-1][:2]]))
+        if (zone_index.penalty[direct] > 0).any():
+            return 'Detours around regulatory zones'
+        return 'Bends off the direct line'
+
+    @metrics.timed('routing')
+    def optimize_pipeline_route(self, start_location: List[float], end_location: List[float],
+                              constraints: Dict[str, Any] = None,
+                              weights: Dict[str, float] = None,
+                              num_recommendations: int = 3) -> List[Dict]:
+        """Least-cost pipeline routes over a zone-weighted cost raster (A*), best first
+
+        Alternatives come from re-running A* with the cells of earlier routes made more
+        expensive, keeping only routes that mostly take a different corridor.
+        """
+        from shapely.geometry import LineString
+        started = time.perf_counter()
+        state = self._state
+        start = Location(start_location[0], start_location[1], start_location[2] if len(start_location) > 2 else 0)
+        end = Location(end_location[0], end_location[1], end_location[2] if len(end_location) > 2 else 0)
+        cell_deg, row0, col0, mult, dx, dy = self._route_corridor(state, start, end)
+        cols = mult.shape[1]
+        src = (math.floor(start.lat / cell_deg) - row0) * cols + math.floor(start.lng / cell_deg) - col0
+        dst = (math.floor(end.lat / cell_deg) - row0) * cols + math.floor(end.lng / cell_deg) - col0
+        search = mult.copy()
+        uniform = float(mult.min()) == float(mult.max())
+        # Corridors of earlier routes, as buffers in degrees with longitude scaled to ground distance
+        lng_scale = math.cos(math.radians((start.lat + end.lat) / 2))
+        taken = []
+        routes = []
+        for _ in range(2 * max(num_recommendations, 1)):
+            if len(routes) >= num_recommendations:
+                break
+            if uniform and not taken:
+                # Nothing to avoid: the straight line is the least-cost corridor, and what alternatives avoid
+                cells, expanded = ([src, dst] if src != dst else [src]), 0
+                line_rows, line_cols = _segment_samples(*divmod(src, cols), *divmod(dst, cols))
+                penalized = line_rows * cols + line_cols
+            else:
+                # Alternatives only need to be good detours, so they trade optimality for speed
+                cells, _, expanded = grid_astar(search, dx, dy, src, dst, 1.0 if not taken else ROUTE_ALT_GREED)
+                penalized = cells
+            if not cells:
+                break
+            guard = self._zone_guard(state, cells, start, end, cell_deg, row0, col0, cols)
+            if uniform and taken:
+                # On a flat raster any detour smooths back onto the straight line, so smooth it on the
+                # penalized raster it was found on and price it on the real one
+                kept, _, grid_length = _smooth_cells(cells, search, dx, dy, guard)
+                weighted = sum(_segment_cost(mult, dx, dy, *divmod(a, cols), *divmod(b, cols))
+                               for a, b in zip(kept, kept[1:]))
+            else:
+                kept, weighted, grid_length = _smooth_cells(cells, mult, dx, dy, guard)
+            # Penalize the whole corridor, not just its cells, so the next search leaves it
+            near = np.zeros(mult.shape, dtype=bool)
+            pen_rows, pen_cols = np.divmod(np.asarray(penalized, dtype=np.int64), cols)
+            for dr in range(-ROUTE_OVERLAP_CELLS, ROUTE_OVERLAP_CELLS + 1):
+                for dc in range(-ROUTE_OVERLAP_CELLS, ROUTE_OVERLAP_CELLS + 1):
+                    near[np.clip(pen_rows + dr, 0, mult.shape[0] - 1), np.clip(pen_cols + dc, 0, cols - 1)] = True
+            search[near] *= ROUTE_ALT_PENALTY
+            # Compare corridors on the smoothed geometry, so a near-parallel copy a cell over is no alternative
+            coords = self._route_coords(kept, start, end, cell_deg, row0, col0, cols)
+            line = LineString([(c[0] * lng_scale, c[1]) for c in coords])
+            if any(line.intersection(prior).length > ROUTE_MAX_OVERLAP * line.length for prior in taken):
+                continue
+            taken.append(line.buffer(ROUTE_OVERLAP_CELLS * cell_deg))
+            routes.append(self._describe_route(state, '', coords, weighted - grid_length, constraints, {
+                'cell_m': round(dy, 1),
+                'cells_expanded': expanded
+            }))
+        # Smoothing can make a later corridor the better one, so rank after the fact
+        routes.sort(key=lambda route: (-route['total_score'], route['metadata']['cost_estimate']))
+        for rank, route in enumerate(routes):
+            route['route_id'] = f'route_{rank + 1}'
+            meta = route['metadata']
+            shape = self._route_shape(state, route)
+            if rank == 0:
+                route['reasoning'] = ['Recommended route', shape]
+            else:
+                extra_cost = meta['cost_estimate'] / routes[0]['metadata']['cost_estimate'] - 1
+                route['reasoning'] = ['Alternative corridor', shape, f'{extra_cost * 100:+.1f}% cost vs recommended']
+        elapsed = round((time.perf_counter() - started) * 1000, 2)
+        for route in routes:
+            route['metadata']['routing_ms'] = elapsed
         return routes[:num_recommendations]
 
+    @metrics.timed('batch_routing')
+    def route_pairs(self, origins: List[List[float]], destinations: List[List[float]],
+                    pairs: Optional[List[Tuple[int, int]]] = None, constraints: Dict[str, Any] = None,
+                    workers: int = 1) -> List[Dict]:
+        """Least-cost route for many origin/destination pairs in one batch (every pair by default)
+
+        All pairs share one cost window built once from the cached tiles, and each distinct
+        origin cell runs a single one-to-many Dijkstra for all of its destinations. Origin
+        chunks are spread over a process pool when `workers` > 1.
+        """
+        started = time.perf_counter()
+        state = self._state
+        origins = [Location(o[0], o[1], o[2] if len(o) > 2 else 0) for o in origins]
+        destinations = [Location(d[0], d[1], d[2] if len(d) > 2 else 0) for d in destinations]
+        if pairs is None:
+            pairs = [(i, j) for i in range(len(origins)) for j in range(len(destinations))]
+        if not pairs:
+            return []
+        o_lng, o_lat = np.array([o.lng for o in origins]), np.array([o.lat for o in origins])
+        d_lng, d_lat = np.array([d.lng for d in destinations]), np.array([d.lat for d in destinations])
+        pi = np.array([i for i, _ in pairs])
+        pj = np.array([j for _, j in pairs])
+        span = float(np.median(self._route_span(o_lng[pi], o_lat[pi], d_lng[pj], d_lat[pj])))
+        cell_deg, row0, col0, mult, dx, dy = self._route_window(
+            state, np.concatenate((o_lng[pi], d_lng[pj])), np.concatenate((o_lat[pi], d_lat[pj])),
+            span, ROUTE_BATCH_MAX_CELLS, ROUTE_BATCH_TARGET_CELLS)
+        cols = mult.shape[1]
+        o_cell = ((np.floor(o_lat / cell_deg) - row0) * cols + np.floor(o_lng / cell_deg) - col0).astype(np.int64)
+        d_cell = ((np.floor(d_lat / cell_deg) - row0) * cols + np.floor(d_lng / cell_deg) - col0).astype(np.int64)
+        # One search per distinct origin cell, reaching all of that origin's destinations
+        by_source: Dict[int, List[int]] = {}
+        for k, (i, _) in enumerate(pairs):
+            by_source.setdefault(int(o_cell[i]), []).append(k)
+        sources = list(by_source)
+        targets = [[int(d_cell[pairs[k][1]]) for k in by_source[src]] for src in sources]
+        chunk = max(1, -(-len(sources) // max(workers, 1)))
+        chunks = [(sources[lo:lo + chunk], targets[lo:lo + chunk]) for lo in range(0, len(sources), chunk)]
+        if float(mult.min()) == float(mult.max()):
+            # Nothing to avoid: every least-cost corridor is the straight line
+            found = [[[[src, dst] if src != dst else [src] for dst in tgt] for src, tgt in zip(*chunk)]
+                     for chunk in chunks]
+        elif workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(min(workers, len(chunks))) as pool:
+                found = list(pool.map(_route_sources, [mult] * len(chunks), [dx] * len(chunks),
+                                      [dy] * len(chunks), *zip(*chunks)))
+        else:
+            graph = _route_graph(mult, dx, dy)
+            found = [_route_sources(mult, dx, dy, src, tgt, graph) for src, tgt in chunks]
+        cell_paths: List[List[int]] = [[] for _ in pairs]
+        for (chunk_sources, _), chunk_paths in zip(chunks, found):
+            for src, paths in zip(chunk_sources, chunk_paths):
+                for k, path in zip(by_source[src], paths):
+                    cell_paths[k] = path
+        routes = []
+        for k, (i, j) in enumerate(pairs):
+            if not cell_paths[k]:
+                continue
+            guard = self._zone_guard(state, cell_paths[k], origins[i], destinations[j], cell_deg, row0, col0, cols)
+            kept, weighted, grid_length = _smooth_cells(cell_paths[k], mult, dx, dy, guard)
+            coords = self._route_coords(kept, origins[i], destinations[j], cell_deg, row0, col0, cols)
+            route = self._describe_route(state, f'pair_{i}_{j}', coords, weighted - grid_length, constraints,
+                                         {'cell_m': round(dy, 1)})
+            route['origin'] = i
+            route['destination'] = j
+            route['reasoning'] = ['Least-cost route', self._route_shape(state, route)]
+            routes.append(route)
+        elapsed = round((time.perf_counter() - started) * 1000, 2)
+        for route in routes:
+            route['metadata']['routing_ms'] = elapsed
+            route['metadata']['batch_pairs'] = len(pairs)
+        return routes
+
+    def optimize_pipeline_network(self, constraints: Dict[str, Any] = None,
+                                  max_pairs: int = ROUTE_BATCH_MAX_PAIRS, workers: int = 1) -> List[Dict]:
+        """Route every plant to every storage site in one batch
+
+        Beyond `max_pairs`, each plant is routed only to its nearest storage sites.
+        """
+        state = self._state
+        n_plants, n_storages = len(state.plants), len(state.storages)
+        if not state.initialized or not n_plants or not n_storages or max_pairs < 1:
+            return []
+        if n_plants * n_storages <= max_pairs:
+            pairs = [(i, j) for i in range(n_plants) for j in range(n_storages)]
+        else:
+            k = max(1, min(max_pairs // n_plants, n_storages))
+            _, nearest = state.storage_index.nearest(state.plants.lng, state.plants.lat, k)
+            pairs = [(i, int(j)) for i in range(n_plants) for j in nearest[i]][:max_pairs]
+        plants = np.column_stack((state.plants.lng, state.plants.lat, state.plants.alt)).tolist()
+        storages = np.column_stack((state.storages.lng, state.storages.lat, state.storages.alt)).tolist()
+        routes = self.route_pairs(plants, storages, pairs, constraints, workers)
+        for route in routes:
+            route['plant_id'] = str(state.plants.ids[route.pop('origin')])
+            route['storage_id'] = str(state.storages.ids[route.pop('destination')])
+            route['route_id'] = f"{route['plant_id']}->{route['storage_id']}"
+        return routes
+
+    @metrics.timed('flows')
+    def optimize_flows(self, neighbors: int = FLOW_NEIGHBORS, warm_start: bool = True) -> Dict[str, Any]:
+        """Min-cost allocation of plant output through storage sites and pipelines to demand centers
+
+        The last solution is kept and, after the network changes, carried over as a warm start,
+        so a small edit is repaired in a few primal-dual phases instead of a full re-solve.
+        """
+        state = self._state
+        if not state.initialized:
+            raise ValueError("System not initialized")
+        started = time.perf_counter()
+        with self._flow_lock:
+            cached = self._flow_solution
+            if cached is not None and cached[0]() is state and cached[1] == neighbors:
+                network, x, pi, stats = cached[2:]
+                stats = dict(stats, mode='cached', solve_ms=0.0)
+            else:
+                network = FlowNetwork.from_state(state, neighbors)
+                build_ms = (time.perf_counter() - started) * 1000
+                if warm_start and cached is not None:
+                    x, pi, phases = network.repair(*network.warm_start(cached[2], cached[3], cached[4]))
+                    mode = 'warm'
+                else:
+                    x, pi, phases = network.solve_cold()
+                    mode = 'cold'
+                stats = {'mode': mode, 'phases': phases, 'build_ms': build_ms,
+                         'solve_ms': (time.perf_counter() - started) * 1000 - build_ms,
+                         'nodes': network.n_nodes, 'arcs': len(network.tail)}
+                self._flow_solution = (weakref.ref(state), neighbors, network, x, pi, stats)
+        return self._describe_flows(state, network, x, stats)
+
+    @staticmethod
+    def _describe_flows(state: 'NetworkState', network: FlowNetwork, x: np.ndarray,
+                        stats: Dict[str, Any]) -> Dict[str, Any]:
+        amount = x / network.scale
+        n_p, n_s = len(state.plants), len(state.storages)
+        # Node number -> (kind, id) for reporting
+        groups = [('plant', state.plants), ('storage', state.storages), ('storage', state.storages),
+                  ('demand', state.demands)]
+        node_kind = ['source', 'sink'] + [kind for kind, table in groups for _ in range(len(table))]
+        node_id = ['', ''] + [str(i) for _, table in groups for i in table.ids]
+        moving = np.flatnonzero((x > 0) & np.isin(network.kind, (FlowNetwork.TRUCK, FlowNetwork.PIPE)))
+        flows = [{
+            'from_type': node_kind[network.tail[a]], 'from_id': node_id[network.tail[a]],
+            'to_type': node_kind[network.head[a]], 'to_id': node_id[network.head[a]],
+            'amount': float(amount[a]),
+            'distance_km': float(network.distance[a] / 1000),
+            'cost': float(network.cost[a] * amount[a]),
+            'via_pipeline': str(state.pipelines.ids[network.ref[a]]) if network.kind[a] == FlowNetwork.PIPE else None
+        } for a in moving]
+        sink = network.kind == FlowNetwork.SINK
+        supply = network.kind == FlowNetwork.SUPPLY
+        store = network.kind == FlowNetwork.STORE
+        unmet = network.kind == FlowNetwork.UNMET
+        utilization = lambda arcs: np.divide(x[arcs], network.cap[arcs], out=np.zeros(int(arcs.sum())),
+                                             where=network.cap[arcs] > 0)
+        return {
+            'flows': flows,
+            'served': {node_id[t]: float(a) for t, a in zip(network.tail[sink], amount[sink])},
+            'served_total': float(amount[sink].sum()),
+            'unmet': float(amount[unmet].sum()),
+            'transport_cost': float((network.cost * amount)[~unmet].sum()),
+            'plant_utilization': dict(zip(node_id[2:2 + n_p], utilization(supply).tolist())),
+            'storage_utilization': dict(zip(node_id[2 + n_p:2 + n_p + n_s], utilization(store).tolist())),
+            'solver': stats
+        }
+
 class FastAPIInterface:
     """Lightweight API interface for the optimized system"""
     
-    def __init__(self):
-        self.system = OptimizedHydrogenSystem()
+    def __init__(self, system: Optional[OptimizedHydrogenSystem] = None):
+        self.system = system or OptimizedHydrogenSystem()
     
     def initialize_system(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Fast system initialization"""
@@ -347,53 +3414,86 @@ class FastAPIInterface:
             return {
                 'success': True,
                 'message': 'System initialized successfully',
-                'stats': {
-                    'plants': len(self.system.plants),
-                    'storages': len(self.system.storages), 
-                    'pipelines': len(self.system.pipelines)
-                }
+                'stats': self.stats()
             }
         else:
             return {'success': False, 'error': 'Initialization failed'}
     
-    def get_plant_recommendations(self, constraints: Dict = None, weights: Dict = None, count: int = 5) -> Dict:
+    def stats(self) -> Dict[str, int]:
+        return {
+            'plants': len(self.system.plants),
+            'storages': len(self.system.storages),
+            'pipelines': len(self.system.pipelines),
+            'demands': len(self.system.demands)
+        }
+    
+    def get_plant_recommendations(self, constraints: Dict = None, weights: Dict = None, count: int = 5,
+                                   search_mode: str = 'anchors', search_options: Dict = None,
+                                   seed: Optional[int] = None) -> Dict:
         """Fast plant recommendations"""
         try:
-            recommendations = self.system.optimize_plant_location(constraints, weights, count)
+            recommendations = self.system.optimize_plant_location(constraints, weights, count,
+                                                                  search_mode=search_mode,
+                                                                  search_options=search_options, seed=seed)
             
             return {
                 'success': True,
                 'count': len(recommendations),
-                'recommendations': [
-                    {
-                        'location': [r.location.lng, r.location.lat, r.location.alt],
-                        'total_score': r.score,
-                        'reasoning': r.reasons
-                    } for r in recommendations
-                ]
+                'recommendations': self._site_records(recommendations)
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_storage_recommendations(self, constraints: Dict = None, weights: Dict = None, count: int = 5) -> Dict:
+    def get_storage_recommendations(self, constraints: Dict = None, weights: Dict = None, count: int = 5,
+                                     search_mode: str = 'anchors', search_options: Dict = None,
+                                     seed: Optional[int] = None) -> Dict:
         """Fast storage recommendations"""
         try:
-            recommendations = self.system.optimize_storage_location(constraints, weights, count)
+            recommendations = self.system.optimize_storage_location(constraints, weights, count,
+                                                                    search_mode=search_mode,
+                                                                    search_options=search_options, seed=seed)
             
             return {
                 'success': True,
                 'count': len(recommendations),
-                'recommendations': [
-                    {
-                        'location': [r.location.lng, r.location.lat, r.location.alt],
-                        'total_score': r.score,
-                        'reasoning': r.reasons
-                    } for r in recommendations
-                ]
+                'recommendations': self._site_records(recommendations)
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    @staticmethod
+    def _site_records(recommendations: List[Dict]) -> List[Dict]:
+        return [
+            {
+                'location': r['location'],
+                'total_score': r['score'],
+                'reasoning': r['reasons']
+            } for r in recommendations
+        ]
+
+    def stream_site_recommendations(self, asset_type: str = 'plant', constraints: Dict = None, weights: Dict = None,
+                                    count: int = 5, search_mode: str = 'anchors', search_options: Dict = None,
+                                    seed: Optional[int] = None, batch_size: int = STREAM_BATCH_SIZE):
+        """Progressive plant/storage recommendations: one response-shaped update per improved top-K"""
+        try:
+            if asset_type not in ('plant', 'storage'):
+                raise ValueError(f"Unknown asset_type: {asset_type}")
+            stream = (self.system.stream_plant_location if asset_type == 'plant'
+                      else self.system.stream_storage_location)
+            for progress in stream(constraints, weights, count, search_mode=search_mode,
+                                   search_options=search_options, seed=seed, batch_size=batch_size):
+                yield {
+                    'success': True,
+                    'asset_type': asset_type,
+                    'done': progress['done'],
+                    'candidates_scored': progress['candidates_scored'],
+                    'elapsed_ms': progress['elapsed_ms'],
+                    'count': len(progress['recommendations']),
+                    'recommendations': self._site_records(progress['recommendations'])
+                }
+        except Exception as e:
+            yield {'success': False, 'asset_type': asset_type, 'done': True, 'error': str(e)}
+
     def get_pipeline_recommendations(self, start_location: List, end_location: List,
                                    constraints: Dict = None, weights: Dict = None, count: int = 3) -> Dict:
         """Fast pipeline recommendations"""
@@ -408,6 +3508,110 @@ class FastAPIInterface:
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
+    def get_pipeline_network_recommendations(self, constraints: Dict = None, max_pairs: int = ROUTE_BATCH_MAX_PAIRS,
+                                             workers: int = 1) -> Dict:
+        """Batch plant-to-storage routes for the whole network"""
+        try:
+            routes = self.system.optimize_pipeline_network(constraints, max_pairs, workers)
+            
+            return {
+                'success': True,
+                'count': len(routes),
+                'recommendations': routes
+            }
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def get_flow_allocation(self, neighbors: int = FLOW_NEIGHBORS) -> Dict:
+        """Min-cost supply allocation across the network"""
+        try:
+            return {'success': True, **self.system.optimize_flows(neighbors)}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+class NetworkSessionRegistry:
+    """Prepared systems reused across requests, keyed by (project id, content hash).
+
+    Least recently used sessions are evicted once the summed system footprint
+    exceeds `max_bytes`; the most recent session is always kept.
+    """
+    
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._sessions: 'OrderedDict[Tuple[str, str], OptimizedHydrogenSystem]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def content_hash(data: Dict[str, Any]) -> str:
+        """Stable digest of a network payload (key order independent)"""
+        def columns(value: Any) -> str:
+            return value.digest() if isinstance(value, AssetColumns) else str(value)
+        payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=columns)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(system.nbytes for system in self._sessions.values())
+    
+    def get(self, project_id: Optional[str], content_hash: str) -> Optional[OptimizedHydrogenSystem]:
+        key = (str(project_id), content_hash)
+        with self._lock:
+            system = self._sessions.get(key)
+            if system is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(key)
+            self.hits += 1
+            return system
+    
+    def put(self, project_id: Optional[str], content_hash: str, system: OptimizedHydrogenSystem) -> None:
+        key = (str(project_id), content_hash)
+        with self._lock:
+            self._sessions[key] = system
+            self._sessions.move_to_end(key)
+            total = sum(s.nbytes for s in self._sessions.values())
+            while total > self.max_bytes and len(self._sessions) > 1:
+                _, evicted = self._sessions.popitem(last=False)
+                total -= evicted.nbytes
+    
+    def evict(self, project_id: Optional[str]) -> int:
+        """Drop every session of a project; returns how many were removed"""
+        with self._lock:
+            keys = [key for key in self._sessions if key[0] == str(project_id)]
+            for key in keys:
+                del self._sessions[key]
+            return len(keys)
+    
+    def open(self, project_id: Optional[str], data: Dict[str, Any],
+             content_hash: Optional[str] = None) -> Tuple[FastAPIInterface, Dict[str, Any]]:
+        """Interface bound to the prepared system for this payload, initializing only on a miss
+
+        The session key is always hashed from `data`; a client-supplied `content_hash` is only
+        compared against it, so a stale or wrong one cannot select another network.
+        """
+        supplied_hash = content_hash
+        content_hash = self.content_hash(data)
+        system = self.get(project_id, content_hash)
+        reused = system is not None
+        if reused:
+            api = FastAPIInterface(system)
+            init_result = {'success': True, 'message': 'Reused prepared session', 'stats': api.stats()}
+        else:
+            api = FastAPIInterface()
+            init_result = api.initialize_system(data)
+            if init_result.get('success'):
+                self.put(project_id, content_hash, api.system)
+        init_result['session'] = {'project_id': project_id, 'content_hash': content_hash, 'reused': reused}
+        if supplied_hash is not None and supplied_hash != content_hash:
+            init_result['session']['supplied_hash_mismatch'] = True
+        return api, init_result
+
 # Quick test function
 def quick_performance_test():
     """Test the optimized system performance"""
@@ -472,5 +3676,55 @@ def quick_performance_test():
     
     return api
 
+def concurrency_stress_test(clients: int = 64, rounds: int = 20, datasets: int = 8) -> bool:
+    """Hammer one shared system from many threads while it is re-initialized underneath them.
+
+    Each dataset sits in its own region with id-prefixed assets, so a recommendation mixing
+    one network's candidates with another network's plants is detected immediately.
+    """
+    import time
+    
+    print(f"🧪 Concurrency stress test: {clients} clients x {rounds} rounds")
+    rng = np.random.default_rng(0)
+    networks = []
+    for d in range(datasets):
+        center = (-120.0 + 6.0 * d, 40.0)
+        networks.append({
+            'center': center,
+            'plants': [{'id': f"d{d}-p{i}", 'location': [center[0] + dx, center[1] + dy], 'capacity': 100}
+                       for i, (dx, dy) in enumerate(rng.uniform(-0.3, 0.3, (200, 2)))],
+            'storage_facilities': [{'id': f"d{d}-s{i}", 'location': [center[0] + dx, center[1] + dy], 'capacity': 1000}
+                                   for i, (dx, dy) in enumerate(rng.uniform(-0.1, 0.1, (5, 2)))]
+        })
+    system = OptimizedHydrogenSystem()
+    system.initialize(networks[0])
+    
+    def client(c: int) -> List[str]:
+        errors = []
+        for r in range(rounds):
+            if (c + r) % 4 == 0:
+                system.initialize(networks[(c + r) % datasets])
+            for recs in (system.optimize_plant_location(), system.optimize_storage_location()):
+                if not recs:
+                    errors.append(f"client {c} round {r}: empty result")
+                    continue
+                for rec in recs:
+                    plant_id = rec['metadata'].get('nearest_plant_id', '')
+                    center = networks[int(plant_id.split('-')[0][1:])]['center']
+                    if Location(*rec['location'][:2]).distance_to(Location(*center)) > 150000:
+                        errors.append(f"client {c} round {r}: candidate scored against {plant_id}")
+        return errors
+    
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        errors = [e for result in pool.map(client, range(clients)) for e in result]
+    elapsed = time.time() - start_time
+    
+    print(f"{'✅' if not errors else '❌'} {clients * rounds * 2} optimizations in {elapsed*1000:.1f}ms, {len(errors)} inconsistent")
+    for error in errors[:5]:
+        print(f"   {error}")
+    return not errors
+
 if __name__ == "__main__":
     api = quick_performance_test()
+    concurrency_stress_test()
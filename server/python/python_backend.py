@@ -5,20 +5,60 @@ Hydrogen Infrastructure Optimization - Python Backend Service
 High-performance optimization engine for Node.js Express integration
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import json
+import os
 import sys
 import traceback
 from datetime import datetime
 
+import numpy as np
+
 # Import your optimization system
-from optimized_hydrogen_system import FastAPIInterface
+from optimized_hydrogen_system import (AssetColumns, NetworkSessionRegistry, ProfileStore, STREAM_BATCH_SIZE,
+                                       PROFILE_INTERVAL_S, metrics)
+
+try:
+    import orjson  # Optional: several times faster than json for large request bodies
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize the optimization system
-optimize_api = FastAPIInterface()
+# Prepared networks are cached per project/content hash and reused across requests
+sessions = NetworkSessionRegistry(
+    max_bytes=int(os.environ.get('OPTIMIZER_SESSION_MAX_MB', 512)) * 1024 * 1024
+)
+
+# Stack profiling is opt-in per deployment; requests then ask for it with 'X-Profile: 1' or '?profile=1'
+PROFILING_ENABLED = os.environ.get('OPTIMIZER_PROFILING', '0') == '1'
+profiles = ProfileStore(os.environ.get('OPTIMIZER_PROFILE_DIR'))
+
+# Network-wide routing is opt-in ('route_network' or 'max_route_pairs'); pair budget when only the flag is set
+ROUTE_NETWORK_DEFAULT_PAIRS = 50
+
+# Columnar wire format for /optimize, negotiated with Content-Type / Accept
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+ARROW_GROUPS = (('plant', 'plants'), ('storage', 'storages'), ('demand', 'demands'))
+ARROW_SITE_GROUPS = (('plant', 'plants'), ('storage', 'storages'))
+ARROW_ROUTE_GROUPS = ('pipelines', 'pipeline_network')
+ARROW_FLOW_TOTALS = ('served', 'plant_utilization', 'storage_utilization')
+ARROW_SECTIONS = ('sites', 'routes', 'flows', 'flow_totals')
+
+def loads_json(raw):
+    """Parse a JSON document with orjson when installed, else the standard library"""
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def request_json():
+    """The Flask request body as JSON, same contract as `request.get_json()` but parsed with `loads_json`"""
+    if orjson is None or not request.is_json:
+        return request.get_json()
+    try:
+        return loads_json(request.get_data(cache=False))
+    except ValueError as e:
+        return request.on_json_loading_failed(e)
 
 def validate_coordinates(lat, lng):
     """Validate latitude and longitude values"""
@@ -33,281 +73,532 @@ def validate_coordinates(lat, lng):
     
     return True, None
 
-def validate_plant(plant):
-    """Validate a single plant object"""
+def read_asset(asset, label):
+    """Validate one plant/storage record and read it in the same pass: (error, (lng, lat, alt, capacity))"""
     # Check required fields
-    if 'id' not in plant:
-        return False, "Plant must have an 'id' field"
+    if 'id' not in asset:
+        return f"{label} must have an 'id' field", None
     
-    if 'capacity' not in plant:
-        return False, "Plant must have a 'capacity' field"
+    if 'capacity' not in asset:
+        return f"{label} must have a 'capacity' field", None
     
-    if 'location' not in plant:
-        return False, "Plant must have a 'location' field"
+    if 'location' not in asset:
+        return f"{label} must have a 'location' field", None
     
     # Validate capacity
-    if not isinstance(plant['capacity'], (int, float)):
-        return False, "Plant capacity must be a number"
+    capacity = asset['capacity']
+    if not isinstance(capacity, (int, float)):
+        return f"{label} capacity must be a number", None
     
-    if plant['capacity'] <= 0:
-        return False, f"Plant capacity must be positive, got {plant['capacity']}"
+    if capacity <= 0:
+        return f"{label} capacity must be positive, got {capacity}", None
     
-    # Validate location
-    location = plant['location']
+    # Validate location ({lat, lng(, alt)} or [lng, lat(, alt)])
+    location = asset['location']
     if isinstance(location, dict):
         if 'lat' not in location or 'lng' not in location:
-            return False, "Location must have 'lat' and 'lng' fields"
-        
-        valid, error = validate_coordinates(location['lat'], location['lng'])
-        if not valid:
-            return False, f"Invalid location: {error}"
+            return "Location must have 'lat' and 'lng' fields", None
+        lng, lat, alt = location['lng'], location['lat'], location.get('alt', 0)
     
     elif isinstance(location, list):
         if len(location) < 2:
-            return False, "Location array must have at least 2 elements [lng, lat]"
-        
-        valid, error = validate_coordinates(location[1], location[0])  # [lng, lat] format
-        if not valid:
-            return False, f"Invalid location: {error}"
+            return "Location array must have at least 2 elements [lng, lat]", None
+        lng, lat = location[0], location[1]
+        alt = location[2] if len(location) > 2 else 0
     
     else:
-        return False, "Location must be either a dict with lat/lng or array [lng, lat]"
+        return "Location must be either a dict with lat/lng or array [lng, lat]", None
     
-    return True, None
+    valid, error = validate_coordinates(lat, lng)
+    if not valid:
+        return f"Invalid location: {error}", None
+    
+    return None, (lng, lat, alt, capacity)
+
+def validate_plant(plant):
+    """Validate a single plant object"""
+    error, _ = read_asset(plant, 'Plant')
+    return error is None, error
 
 def validate_storage(storage):
     """Validate a single storage facility object"""
-    # Check required fields
-    if 'id' not in storage:
-        return False, "Storage must have an 'id' field"
-    
-    if 'capacity' not in storage:
-        return False, "Storage must have a 'capacity' field"
-    
-    if 'location' not in storage:
-        return False, "Storage must have a 'location' field"
-    
-    # Validate capacity
-    if not isinstance(storage['capacity'], (int, float)):
-        return False, "Storage capacity must be a number"
-    
-    if storage['capacity'] <= 0:
-        return False, f"Storage capacity must be positive, got {storage['capacity']}"
-    
-    # Validate location (same as plant)
-    location = storage['location']
-    if isinstance(location, dict):
-        if 'lat' not in location or 'lng' not in location:
-            return False, "Location must have 'lat' and 'lng' fields"
-        
-        valid, error = validate_coordinates(location['lat'], location['lng'])
-        if not valid:
-            return False, f"Invalid location: {error}"
-    
-    elif isinstance(location, list):
-        if len(location) < 2:
-            return False, "Location array must have at least 2 elements [lng, lat]"
-        
-        valid, error = validate_coordinates(location[1], location[0])  # [lng, lat] format
-        if not valid:
-            return False, f"Invalid location: {error}"
-    
-    else:
-        return False, "Location must be either a dict with lat/lng or array [lng, lat]"
-    
-    return True, None
-
-def validate_optimization_data(data):
-    """Validate the complete optimization request data"""
-    errors = []
-    
+    error, _ = read_asset(storage, 'Storage')
+    return error is None, error
+
+def _read_assets(records, label, errors):
+    """Plant/storage records as AssetColumns, appending one error per invalid record"""
+    ids, lngs, lats, alts, capacities = [], [], [], [], []
+    for i, asset in enumerate(records):
+        error, values = read_asset(asset, label)
+        if error:
+            errors.append(f"{label} {i}: {error}")
+        elif not errors:
+            # Once anything is invalid the request fails, so only errors are collected from then on
+            ids.append(asset['id'])
+            lng, lat, alt, capacity = values
+            lngs.append(lng)
+            lats.append(lat)
+            alts.append(alt)
+            capacities.append(capacity)
+    return AssetColumns(ids, lngs, lats, alts, capacities)
+
+def _read_demands(records, errors):
+    """Demand records as AssetColumns (amount from 'demand' or 'quantity'), locations as objects or [lng, lat] arrays"""
+    ids, lngs, lats, alts, amounts = [], [], [], [], []
+    for i, demand in enumerate(records):
+        if 'location' not in demand:
+            errors.append(f"Demand {i}: must have a 'location' field")
+            continue
+        location = demand['location']
+        if isinstance(location, dict):
+            if 'lat' not in location or 'lng' not in location:
+                errors.append(f"Demand {i}: location must have 'lat' and 'lng' fields")
+                continue
+            valid, error = validate_coordinates(location['lat'], location['lng'])
+            if not valid:
+                errors.append(f"Demand {i}: {error}")
+                continue
+            lng, lat, alt = location['lng'], location['lat'], location.get('alt', 0)
+        elif not isinstance(location, (list, tuple)) or len(location) < 2:
+            errors.append(f"Demand {i}: location must be an object or a [lng, lat] array")
+            continue
+        else:
+            valid, error = validate_coordinates(location[1], location[0])
+            if not valid:
+                errors.append(f"Demand {i}: {error}")
+                continue
+            lng, lat = location[0], location[1]
+            alt = location[2] if len(location) > 2 else 0
+        if not errors:
+            ids.append(demand.get('id', f"d_{i}"))
+            lngs.append(lng)
+            lats.append(lat)
+            alts.append(alt)
+            amounts.append(demand.get('demand', demand.get('quantity', 0)))
+    try:
+        return AssetColumns(ids, lngs, lats, alts, amounts)
+    except (TypeError, ValueError):
+        errors.append("Demands: location and demand values must be numeric")
+        return None
+
+def _check_columns(columns, label, errors, location_error='Invalid location: '):
+    """`read_asset` checks over a columnar group, one error per invalid row; plants and storages
+    also need positive capacities"""
+    with np.errstate(invalid='ignore'):
+        valid = (np.abs(columns.lat) <= 90) & (np.abs(columns.lng) <= 180)
+        if location_error and columns.capacity is not None:
+            valid &= columns.capacity > 0
+    if location_error and columns.capacity is None:
+        errors.append(f"{label} rows must have a 'capacity' column")
+    missing_ids = [i for i, asset_id in enumerate(columns.ids) if asset_id is None]
+    for i in sorted(set(missing_ids).union(np.flatnonzero(~valid).tolist())):
+        capacity = None if columns.capacity is None else float(columns.capacity[i])
+        if columns.ids[i] is None:
+            error = f"{label} must have an 'id' field"
+        elif location_error and capacity is not None and np.isnan(capacity):
+            error = f"{label} must have a 'capacity' field"
+        elif location_error and capacity is not None and capacity <= 0:
+            error = f"{label} capacity must be positive, got {capacity}"
+        else:
+            # NaN marks a null coordinate, which reads as a non-number
+            lat, lng = (None if np.isnan(value) else float(value) for value in (columns.lat[i], columns.lng[i]))
+            error = location_error + validate_coordinates(lat, lng)[1]
+        errors.append(f"{label} {i}: {error}")
+    return columns
+
+def parse_optimization_data(data):
+    """Validate a request and convert it in one pass: (errors, optimization data)
+
+    Plants, storages and demands are read straight into AssetColumns for `initialize`; the errors
+    (and their order) are those `validate_optimization_data` has always reported. Groups that arrive
+    as AssetColumns (Arrow requests) are checked column-wise and passed through.
+    """
     # Check if data has required structure
     if not isinstance(data, dict):
-        return False, ["Data must be a JSON object"]
+        return ["Data must be a JSON object"], None
     
-    # Validate plants
-    if 'plants' in data:
-        if not isinstance(data['plants'], list):
-            errors.append("'plants' must be an array")
-        elif len(data['plants']) == 0:
+    errors = []
+    result = {'plants': AssetColumns([], [], []), 'storage_facilities': AssetColumns([], [], []), 'pipelines': []}
+    for key, target, label in (('plants', 'plants', 'Plant'), ('storages', 'storage_facilities', 'Storage')):
+        if key not in data:
+            continue
+        records = data[key]
+        if not isinstance(records, (list, AssetColumns)):
+            errors.append(f"'{key}' must be an array")
+        elif key == 'plants' and len(records) == 0:
             errors.append("'plants' array cannot be empty")
+        elif isinstance(records, AssetColumns):
+            result[target] = _check_columns(records, label, errors)
         else:
-            for i, plant in enumerate(data['plants']):
-                valid, error = validate_plant(plant)
-                if not valid:
-                    errors.append(f"Plant {i}: {error}")
-    
-    # Validate storages
-    if 'storages' in data:
-        if not isinstance(data['storages'], list):
-            errors.append("'storages' must be an array")
-        else:
-            for i, storage in enumerate(data['storages']):
-                valid, error = validate_storage(storage)
-                if not valid:
-                    errors.append(f"Storage {i}: {error}")
+            result[target] = _read_assets(records, label, errors)
     
     # Validate demands
     if 'demands' in data:
-        if not isinstance(data['demands'], list):
+        if isinstance(data['demands'], AssetColumns):
+            result['demand_centers'] = _check_columns(data['demands'], 'Demand', errors, location_error='')
+        elif not isinstance(data['demands'], list):
             errors.append("'demands' must be an array")
         else:
-            for i, demand in enumerate(data['demands']):
-                if 'location' not in demand:
-                    errors.append(f"Demand {i}: must have a 'location' field")
-                elif isinstance(demand['location'], dict):
-                    if 'lat' not in demand['location'] or 'lng' not in demand['location']:
-                        errors.append(f"Demand {i}: location must have 'lat' and 'lng' fields")
-                    else:
-                        valid, error = validate_coordinates(demand['location']['lat'], demand['location']['lng'])
-                        if not valid:
-                            errors.append(f"Demand {i}: {error}")
+            result['demand_centers'] = _read_demands(data['demands'], errors)
+    
+    max_pairs = data.get('max_route_pairs')
+    if max_pairs is not None and (isinstance(max_pairs, bool) or not isinstance(max_pairs, int) or max_pairs <= 0):
+        errors.append(f"'max_route_pairs' must be a positive integer, got {max_pairs!r}")
     
     # Check if we have at least some data to work with
-    has_plants = 'plants' in data and isinstance(data['plants'], list) and len(data['plants']) > 0
-    has_storages = 'storages' in data and isinstance(data['storages'], list) and len(data['storages']) > 0
-    has_demands = 'demands' in data and isinstance(data['demands'], list) and len(data['demands']) > 0
+    groups = (list, AssetColumns)
+    has_plants = 'plants' in data and isinstance(data['plants'], groups) and len(data['plants']) > 0
+    has_storages = 'storages' in data and isinstance(data['storages'], groups) and len(data['storages']) > 0
+    has_demands = 'demands' in data and isinstance(data['demands'], groups) and len(data['demands']) > 0
     
     if not (has_plants or has_storages or has_demands):
         errors.append("Request must contain at least one non-empty array of plants, storages, or demands")
     
+    return errors, (None if errors else result)
+
+def validate_optimization_data(data):
+    """Validate the complete optimization request data"""
+    errors, _ = parse_optimization_data(data)
     return len(errors) == 0, errors
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
+def is_arrow(header):
+    """Whether a Content-Type or Accept header names the Arrow IPC stream format"""
+    return ARROW_STREAM in (header or '').lower()
+
+def _arrow_floats(table, name, fill=None):
+    """A float64 column as numpy (nulls as NaN, or `fill`), or None when absent; single-chunk float64
+    columns without nulls are viewed in place"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    if name not in table.column_names:
+        return None
+    column = table.column(name)
+    if fill is not None and column.null_count:
+        column = pc.fill_null(column, fill)
+    if column.type != pa.float64():
+        column = column.cast(pa.float64())
+    if column.num_chunks == 1:
+        return column.chunk(0).to_numpy(zero_copy_only=False)
+    return column.to_numpy()
+
+def decode_arrow_request(body):
+    """An Arrow IPC stream /optimize request as the dict `parse_optimization_data` takes
+
+    One row per asset: kind ('plant', 'storage' or 'demand'), id, lng, lat and optionally alt,
+    capacity and demand. The other request fields travel as a JSON object under the schema
+    metadata key 'request'. Rows of one kind sent contiguously in a single record batch reach
+    AssetColumns without being copied. Raises ValueError for streams that cannot be read.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    if not body:
+        return None
+    table = pa.ipc.open_stream(body).read_all()
+    metadata = table.schema.metadata or {}
+    data = loads_json(metadata[b'request']) if b'request' in metadata else {}
+    if not isinstance(data, dict):
+        raise ValueError("'request' metadata must be a JSON object")
+    missing = [name for name in ('kind', 'lng', 'lat') if name not in table.column_names]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+
+    kinds = table.column('kind')
+    if pa.types.is_dictionary(kinds.type):
+        kinds = kinds.cast(pa.string())
+    for kind, key in ARROW_GROUPS:
+        mask = pc.fill_null(pc.equal(kinds, kind), False)
+        rows = pc.indices_nonzero(mask)
+        if not len(rows):
+            continue
+        first, last = rows[0].as_py(), rows[-1].as_py()
+        group = table.slice(first, len(rows)) if last - first + 1 == len(rows) else table.filter(mask)
+        ids = group.column('id').to_pylist() if 'id' in group.column_names else [None] * len(group)
+        if kind == 'demand':
+            # Demand ids are optional, as in JSON requests
+            ids = [f"d_{i}" if asset_id is None else asset_id for i, asset_id in enumerate(ids)]
+            amount = _arrow_floats(group, 'demand', fill=0.0)
+            if amount is None:
+                amount = _arrow_floats(group, 'quantity', fill=0.0)
+            capacity = np.zeros(len(group)) if amount is None else amount
+        else:
+            capacity = _arrow_floats(group, 'capacity')
+        data[key] = AssetColumns(ids, _arrow_floats(group, 'lng'), _arrow_floats(group, 'lat'),
+                                 _arrow_floats(group, 'alt', fill=0.0), capacity)
+    return data
+
+def _arrow_paths(paths):
+    """Route paths as list<fixed_size_list<double, 3>> built from one flat coordinate buffer"""
+    import pyarrow as pa
+    points = [np.asarray(path, dtype=np.float64).reshape(-1, np.shape(path)[-1] if len(path) else 3) for path in paths]
+    points = [np.pad(p[:, :3], ((0, 0), (0, 3 - min(p.shape[1], 3)))) for p in points]
+    offsets = np.zeros(len(points) + 1, dtype=np.int32)
+    np.cumsum([len(p) for p in points], out=offsets[1:])
+    values = np.concatenate(points).ravel() if points else np.empty(0)
+    return pa.ListArray.from_arrays(pa.array(offsets), pa.FixedSizeListArray.from_arrays(pa.array(values), 3))
+
+def _arrow_ids(values):
+    import pyarrow as pa
+    return pa.array([None if value is None else str(value) for value in values], pa.string())
+
+def _arrow_sections(data):
+    """Split a response's `data` into Arrow tables by section, leaving the small fields in `data`"""
+    import pyarrow as pa
+    site_rows, route_rows, flow_rows, total_rows = [], [], [], []
+    for kind, key in ARROW_SITE_GROUPS:
+        group = data.get(key)
+        if isinstance(group, dict) and 'recommendations' in group:
+            site_rows += [(kind, rank, site) for rank, site in enumerate(group['recommendations'])]
+            data[key] = {name: value for name, value in group.items() if name != 'recommendations'}
+    for key in ARROW_ROUTE_GROUPS:
+        group = data.get(key)
+        if isinstance(group, dict) and 'recommendations' in group:
+            route_rows += [(key, route) for route in group['recommendations']]
+            data[key] = {name: value for name, value in group.items() if name != 'recommendations'}
+    flows = data.get('flows')
+    if isinstance(flows, dict) and 'flows' in flows:
+        flow_rows = flows['flows']
+        # Per-asset totals become rows of one (total, id, value) table
+        for total in ARROW_FLOW_TOTALS:
+            total_rows += [(total, asset_id, value) for asset_id, value in (flows.get(total) or {}).items()]
+        data['flows'] = {name: value for name, value in flows.items()
+                         if name != 'flows' and name not in ARROW_FLOW_TOTALS}
+
+    locations = np.array([(list(site['location']) + [0.0, 0.0, 0.0])[:3] for _, _, site in site_rows],
+                         dtype=np.float64).reshape(-1, 3)
+    sites = pa.table({
+        'kind': pa.array([kind for kind, _, _ in site_rows], pa.string()),
+        'rank': pa.array([rank for _, rank, _ in site_rows], pa.int32()),
+        'lng': locations[:, 0],
+        'lat': locations[:, 1],
+        'alt': locations[:, 2],
+        'total_score': pa.array([site['total_score'] for _, _, site in site_rows], pa.float64()),
+        'reasoning': pa.array([site['reasoning'] for _, _, site in site_rows], pa.list_(pa.string()))
+    })
+    routes = [route for _, route in route_rows]
+    route_metadata = [route.get('metadata') or {} for route in routes]
+    routes = pa.table({
+        'group': pa.array([key for key, _ in route_rows], pa.string()),
+        'route_id': _arrow_ids([route.get('route_id') for route in routes]),
+        'plant_id': _arrow_ids([route.get('plant_id') for route in routes]),
+        'storage_id': _arrow_ids([route.get('storage_id') for route in routes]),
+        'total_score': pa.array([route.get('total_score') for route in routes], pa.float64()),
+        'path': _arrow_paths([route.get('path') or [] for route in routes]),
+        'reasoning': pa.array([route.get('reasoning') or [] for route in routes], pa.list_(pa.string())),
+        'metadata': pa.array(route_metadata) if any(route_metadata) else pa.nulls(len(routes), pa.struct([]))
+    })
+    flows = pa.table({
+        'from_type': pa.array([flow['from_type'] for flow in flow_rows], pa.string()),
+        'from_id': _arrow_ids([flow['from_id'] for flow in flow_rows]),
+        'to_type': pa.array([flow['to_type'] for flow in flow_rows], pa.string()),
+        'to_id': _arrow_ids([flow['to_id'] for flow in flow_rows]),
+        'amount': pa.array([flow['amount'] for flow in flow_rows], pa.float64()),
+        'distance_km': pa.array([flow['distance_km'] for flow in flow_rows], pa.float64()),
+        'cost': pa.array([flow['cost'] for flow in flow_rows], pa.float64()),
+        'via_pipeline': _arrow_ids([flow.get('via_pipeline') for flow in flow_rows])
+    })
+    totals = pa.table({
+        'total': pa.array([total for total, _, _ in total_rows], pa.string()),
+        'id': _arrow_ids([asset_id for _, asset_id, _ in total_rows]),
+        'value': pa.array([value for _, _, value in total_rows], pa.float64())
+    })
+    return {'sites': sites, 'routes': routes, 'flows': flows, 'flow_totals': totals}
+
+def encode_arrow_response(payload):
+    """A successful /optimize payload as consecutive Arrow IPC streams, one per section
+
+    The sections come in ARROW_SECTIONS order, each naming itself under the schema metadata key
+    'section':
+      sites        plant/storage recommendations (kind, rank, lng, lat, alt, total_score, reasoning)
+      routes       pipeline routes (group, route_id, plant_id, storage_id, total_score,
+                   path as list<fixed_size_list<double, 3>>, reasoning, metadata)
+      flows        flow allocation rows (from/to type and id, amount, distance_km, cost, via_pipeline)
+      flow_totals  per-asset served demand and utilization (total, id, value)
+    The remaining scalars (success flags, counts, solver stats, response metadata) are JSON under
+    the first stream's 'response' metadata key.
+    """
+    import pyarrow as pa
+    data = dict(payload['data'])
+    tables = _arrow_sections(data)
+    sink = pa.BufferOutputStream()
+    for i, section in enumerate(ARROW_SECTIONS):
+        metadata = {'section': section}
+        if i == 0:
+            metadata['response'] = json.dumps(dict(payload, data=data))
+        table = tables[section].replace_schema_metadata(metadata)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def health_payload():
+    return {
         'status': 'healthy',
         'service': 'hydrogen-optimization-engine',
         'timestamp': datetime.now().isoformat(),
         'version': '1.0.0'
-    })
-
-@app.route('/optimize', methods=['POST'])
-def optimize_infrastructure():
-    """Main optimization endpoint for Node.js backend"""
-    try:
-        data = request.get_json()
-
-        if not data:
-            return jsonify({
-                'error': 'No data provided',
-                'success': False
-            }), 400
-
-        # Validate the input data
-        is_valid, validation_errors = validate_optimization_data(data)
-        if not is_valid:
-            return jsonify({
-                'error': 'Validation failed',
-                'details': validation_errors,
-                'success': False
-            }), 400
+    }
 
-        # Convert the data format for the optimization system
-        optimization_data = convert_to_optimization_format(data)
+def error_payload(e):
+    return {
+        'error': str(e),
+        'success': False,
+        'timestamp': datetime.now().isoformat()
+    }
 
-        # Initialize optimization
-        init_result = optimize_api.initialize_system(optimization_data)
-        
-        if not init_result.get('success', False):
-            return jsonify({
-                'error': 'Failed to initialize optimization system',
-                'details': init_result.get('error', 'Unknown error'),
-                'success': False
-            }), 500
+def open_optimization_session(data):
+    """Validate and convert a request, then open its session: (api, init_result, data, (error, status))"""
+    if not data:
+        return None, None, None, ({
+            'error': 'No data provided',
+            'success': False
+        }, 400)
+
+    # Validate the input data and convert it for the optimization system in the same pass
+    with metrics.stage('validation'):
+        validation_errors, optimization_data = parse_optimization_data(data)
+    if validation_errors:
+        return None, None, None, ({
+            'error': 'Validation failed',
+            'details': validation_errors,
+            'success': False
+        }, 400)
+
+    # Initialize optimization (or reuse the prepared session for this project/network)
+    with metrics.stage('session'):
+        optimize_api, init_result = sessions.open(
+            data.get('project_id'), optimization_data, data.get('content_hash')
+        )
 
-        # Get recommendations
+    if not init_result.get('success', False):
+        return None, None, None, ({
+            'error': 'Failed to initialize optimization system',
+            'details': init_result.get('error', 'Unknown error'),
+            'success': False
+        }, 500)
+    return optimize_api, init_result, optimization_data, None
+
+def wants_profile(headers, args):
+    """Whether a request asked for a stack profile (and profiling is enabled)"""
+    flag = str(headers.get('X-Profile') or args.get('profile') or '').lower()
+    return PROFILING_ENABLED and flag in ('1', 'true', 'yes')
+
+def run_optimization(data, profile=False):
+    """Body of /optimize as (payload, status); shared by the Flask and ASGI front ends"""
+    with metrics.trace() as trace:
+        if profile:
+            (payload, status), record = profiles.profile(_run_optimization, data)
+        else:
+            payload, status = _run_optimization(data)
+    if status == 200:
+        payload['metadata']['timings'] = metrics.summary(trace)
+        if profile:
+            payload['metadata']['profile'] = {key: record[key] for key in
+                                              ('id', 'samples', 'interval_ms', 'collapsed')}
+    return payload, status
+
+def _run_optimization(data):
+    try:
+        optimize_api, init_result, optimization_data, error = open_optimization_session(data)
+        if error:
+            return error
+
+        # Get recommendations ('grid' scans the whole network instead of sampling around anchors)
+        # A 'seed' makes the answer reproducible and lets repeats come from the result cache
+        search_mode = data.get('search_mode', 'anchors')
+        search_options = data.get('search_options')
+        seed = data.get('seed')
         recommendations = {
-            'plants': optimize_api.get_plant_recommendations(),
-            'storages': optimize_api.get_storage_recommendations(),
+            'plants': optimize_api.get_plant_recommendations(
+                search_mode=search_mode, search_options=search_options, seed=seed
+            ),
+            'storages': optimize_api.get_storage_recommendations(
+                search_mode=search_mode, search_options=search_options, seed=seed
+            ),
         }
         
         # Add pipeline recommendations if we have both plants and storages
         if optimization_data.get('plants') and optimization_data.get('storage_facilities'):
-            plant_loc = optimization_data['plants'][0]['location']
-            storage_loc = optimization_data['storage_facilities'][0]['location']
+            plant_loc = optimization_data['plants'].location(0)
+            storage_loc = optimization_data['storage_facilities'].location(0)
             recommendations['pipelines'] = optimize_api.get_pipeline_recommendations(
                 plant_loc, storage_loc
             )
-
-        return jsonify({
+            # Route plant-storage pairs when asked (nearest storages per plant beyond the pair budget)
+            max_pairs = data.get('max_route_pairs')
+            if max_pairs is not None or data.get('route_network'):
+                recommendations['pipeline_network'] = optimize_api.get_pipeline_network_recommendations(
+                    max_pairs=max_pairs or ROUTE_NETWORK_DEFAULT_PAIRS
+                )
+
+        # Allocate plant output to demand centers over storage sites and existing pipelines
+        if optimization_data.get('demand_centers'):
+            recommendations['flows'] = optimize_api.get_flow_allocation()
+
+        return {
             'success': True,
             'data': recommendations,
             'metadata': {
                 'timestamp': datetime.now().isoformat(),
                 'validation': 'passed',
-                'init_stats': init_result.get('stats', {})
+                'init_stats': init_result.get('stats', {}),
+                'session': init_result.get('session', {})
             }
-        })
+        }, 200
 
     except Exception as e:
         print("Error in optimization: {}".format(str(e)))
         traceback.print_exc()
+        return error_payload(e), 500
 
-        return jsonify({
-            'error': str(e),
-            'success': False,
-            'timestamp': datetime.now().isoformat()
-        }), 500
-
-def convert_to_optimization_format(data):
-    """Convert request data to the format expected by the optimization system"""
-    result = {
-        'plants': [],
-        'storage_facilities': [],
-        'pipelines': []
+def open_recommendation_stream(data):
+    """Progressive plant/storage updates for a request as (iterator, (error, status))"""
+    sizes = {'count': 5, 'batch_size': STREAM_BATCH_SIZE}
+    errors = []
+    for key in sizes:
+        value = data.get(key, sizes[key]) if data else sizes[key]
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            errors.append(f"'{key}' must be a positive integer, got {value!r}")
+        sizes[key] = value
+    if errors:
+        return None, ({
+            'error': 'Validation failed',
+            'details': errors,
+            'success': False
+        }, 400)
+
+    optimize_api, _, _, error = open_optimization_session(data)
+    if error:
+        return None, error
+
+    asset_types = data.get('asset_types', ['plant', 'storage'])
+    options = {
+        'count': sizes['count'],
+        'search_mode': data.get('search_mode', 'anchors'),
+        'search_options': data.get('search_options'),
+        'seed': data.get('seed'),
+        'batch_size': sizes['batch_size']
     }
-    
-    # Convert plants
-    if 'plants' in data:
-        for plant in data['plants']:
-            location = plant['location']
-            if isinstance(location, dict):
-                # Convert {lat, lng} to [lng, lat, alt]
-                converted_location = [location['lng'], location['lat'], location.get('alt', 0)]
-            else:
-                # Assume it's already [lng, lat] or [lng, lat, alt]
-                converted_location = location[:] if len(location) >= 2 else [0, 0, 0]
-                if len(converted_location) == 2:
-                    converted_location.append(0)  # Add altitude
-            
-            result['plants'].append({
-                'id': plant['id'],
-                'location': converted_location,
-                'capacity': plant['capacity']
-            })
-    
-    # Convert storages
-    if 'storages' in data:
-        for storage in data['storages']:
-            location = storage['location']
-            if isinstance(location, dict):
-                converted_location = [location['lng'], location['lat'], location.get('alt', 0)]
-            else:
-                converted_location = location[:] if len(location) >= 2 else [0, 0, 0]
-                if len(converted_location) == 2:
-                    converted_location.append(0)
-            
-            result['storage_facilities'].append({
-                'id': storage['id'],
-                'location': converted_location,
-                'capacity': storage['capacity']
-            })
-    
-    return result
 
-@app.route('/validate', methods=['POST'])
-def validate_infrastructure():
-    """Validate infrastructure configuration"""
-    try:
-        data = request.get_json()
+    def updates():
+        for asset_type in asset_types:
+            yield from optimize_api.stream_site_recommendations(asset_type, **options)
 
+    return updates(), None
+
+def stream_frame(update, sse):
+    """One NDJSON line, or one SSE event when `sse`"""
+    payload = json.dumps(update)
+    if sse:
+        return f"event: {'done' if update['done'] else 'progress'}\ndata: {payload}\n\n"
+    return payload + '\n'
+
+def run_validation(data):
+    """Body of /validate as (payload, status)"""
+    try:
         if not data:
-            return jsonify({
+            return {
                 'error': 'No data provided',
                 'success': False
-            }), 400
+            }, 400
 
         validation_result = {
             'success': True,
@@ -315,33 +606,34 @@ def validate_infrastructure():
             'data': data
         }
 
-        return jsonify({
+        return {
             'success': True,
             'data': validation_result,
             'timestamp': datetime.now().isoformat()
-        })
+        }, 200
 
     except Exception as e:
         print("Error in validation: {}".format(str(e)))
         traceback.print_exc()
-
-        return jsonify({
-            'error': str(e),
-            'success': False,
-            'timestamp': datetime.now().isoformat()
-        }), 500
-
-@app.route('/status', methods=['GET'])
-def get_status():
-    """Status endpoint for Node.js backend - provides system status and logs"""
-    import requests
+        return error_payload(e), 500
+
+def run_status(data):
+    """Body of /status as (payload, status, log) where `log` is the (url, payload) to report, if any"""
+    with metrics.trace() as trace:
+        payload, status, log = _run_status(data)
+    if status == 200:
+        timings = metrics.summary(trace)
+        payload['metadata']['processing_time_ms'] = timings['total_ms']
+        payload['metadata']['timings'] = timings
+    return payload, status, log
+
+def _run_status(data):
     try:
-        data = request.get_json()
         if not data:
-            return jsonify({
+            return {
                 'error': 'No data provided',
                 'success': False
-            }), 400
+            }, 400, None
 
         # Accept full project/asset data from Node.js
         project_id = data.get('project_id')
@@ -352,10 +644,10 @@ def get_status():
         legacy_params = {k: data.get(k) for k in ['longitude', 'latitude', 'demand_mw', 'budget_millions'] if k in data}
 
         # Initialize optimize with full asset/project data if present
-        if asset_data:
-            init_result = optimize_api.initialize_system(asset_data)
-        else:
-            init_result = optimize_api.initialize_system(legacy_params)
+        with metrics.stage('session'):
+            optimize_api, init_result = sessions.open(
+                project_id, asset_data if asset_data else legacy_params, data.get('content_hash')
+            )
 
         # Run optimization (example: get plant/storage/pipeline recommendations)
         recommendations = {
@@ -373,14 +665,10 @@ def get_status():
             'status': 'success',
             'error': None
         }
-        try:
-            # You may need to set the correct URL and authentication if required
-            log_url = data.get('log_url', 'http://localhost:3000/api/optimization-logs')
-            requests.post(log_url, json=log_payload, timeout=3)
-        except Exception as log_err:
-            print(f"Warning: Could not log optimization result to Node.js backend: {log_err}")
+        # You may need to set the correct URL and authentication if required
+        log_url = data.get('log_url', 'http://localhost:3000/api/optimization-logs')
 
-        return jsonify({
+        return {
             'success': True,
             'data': recommendations,
             'metadata': {
@@ -388,15 +676,139 @@ def get_status():
                 'timestamp': datetime.now().isoformat(),
                 'parameters': asset_data if asset_data else legacy_params
             }
-        })
+        }, 200, (log_url, log_payload)
     except Exception as e:
         print("Error in optimization: {}".format(str(e)))
         traceback.print_exc()
-        return jsonify({
-            'error': str(e),
-            'success': False,
-            'timestamp': datetime.now().isoformat()
-        }), 500
+        return error_payload(e), 500, None
+
+def metrics_text(gauges=None):
+    """Prometheus exposition of optimizer stage timings, counters and session cache gauges"""
+    return metrics.prometheus(gauges=dict({'sessions': len(sessions), 'session_bytes': sessions.nbytes},
+                                          **(gauges or {})))
+
+def profile_index():
+    return {'success': True, 'enabled': PROFILING_ENABLED, 'profiles': profiles.list()}
+
+def start_profile_window(data):
+    """Start sampling every thread for data['seconds'] as (payload, status)"""
+    if not PROFILING_ENABLED:
+        return {'error': 'Profiling is disabled (set OPTIMIZER_PROFILING=1)', 'success': False}, 403
+    data = data or {}
+    try:
+        seconds = float(data.get('seconds', 10))
+        interval = float(data.get('interval_ms', PROFILE_INTERVAL_S * 1000)) / 1000
+    except (TypeError, ValueError) as e:
+        return {'error': f"Invalid profile window: {e}", 'success': False}, 400
+    record = profiles.start_window(seconds, max(interval, 0.001))
+    if record is None:
+        return {'error': 'A profile window is already running', 'success': False}, 409
+    return {'success': True, 'profile': record}, 202
+
+def profile_collapsed(profile_id):
+    """A finished profile as collapsed stacks: (body, status, content_type)"""
+    record = profiles.get(profile_id)
+    if record is None:
+        return json.dumps({'error': 'Profile not found', 'success': False}), 404, 'application/json'
+    if record['status'] != 'done':
+        return json.dumps({'success': True, 'status': record['status']}), 202, 'application/json'
+    return record['collapsed'], 200, 'text/plain'
+
+def post_optimization_log(log_url, log_payload, timeout=3):
+    """Report an optimization result to the Node.js backend; failures only warn"""
+    import requests
+    try:
+        requests.post(log_url, json=log_payload, timeout=timeout)
+    except Exception as log_err:
+        print(f"Warning: Could not log optimization result to Node.js backend: {log_err}")
+
+@app.after_request
+def count_request(response):
+    # Route templates, not raw paths, keep the label set bounded
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.count('requests', endpoint=endpoint, status=str(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics_text(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profile', methods=['GET'])
+def list_profiles():
+    """Recent stack profiles"""
+    return jsonify(profile_index())
+
+@app.route('/profile', methods=['POST'])
+def start_profile():
+    """Profile the whole process for a time window"""
+    payload, status = start_profile_window(request.get_json(silent=True))
+    return jsonify(payload), status
+
+@app.route('/profile/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Collapsed stacks of one profile, ready for flamegraph.pl or speedscope"""
+    body, status, content_type = profile_collapsed(profile_id)
+    return Response(body, status=status, mimetype=content_type)
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify(health_payload())
+
+@app.route('/optimize', methods=['POST'])
+def optimize_infrastructure():
+    """Main optimization endpoint for Node.js backend
+
+    Takes and returns JSON, or Arrow IPC streams with Content-Type / Accept: application/vnd.apache.arrow.stream.
+    """
+    if is_arrow(request.content_type):
+        try:
+            data = decode_arrow_request(request.get_data(cache=False))
+        except ValueError as e:
+            return jsonify({'error': f"Invalid Arrow request: {e}", 'success': False}), 400
+    else:
+        data = request_json()
+    payload, status = run_optimization(data, wants_profile(request.headers, request.args))
+    if status == 200 and is_arrow(request.headers.get('Accept')):
+        return Response(encode_arrow_response(payload), mimetype=ARROW_STREAM)
+    return jsonify(payload), status
+
+@app.route('/optimize/stream', methods=['POST'])
+def optimize_infrastructure_stream():
+    """Progressive plant/storage recommendations as NDJSON (or SSE with Accept: text/event-stream)
+
+    Each update carries the current best sites; the last one per asset type has done=true.
+    """
+    try:
+        updates, error = open_recommendation_stream(request_json())
+        if error:
+            return jsonify(error[0]), error[1]
+        sse = 'text/event-stream' in request.headers.get('Accept', '')
+        frames = (stream_frame(update, sse) for update in updates)
+        return Response(stream_with_context(frames),
+                        mimetype='text/event-stream' if sse else 'application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    except Exception as e:
+        print("Error in optimization: {}".format(str(e)))
+        traceback.print_exc()
+        return jsonify(error_payload(e)), 500
+
+@app.route('/validate', methods=['POST'])
+def validate_infrastructure():
+    """Validate infrastructure configuration"""
+    payload, status = run_validation(request_json())
+    return jsonify(payload), status
+
+@app.route('/status', methods=['GET'])
+def get_status():
+    """Status endpoint for Node.js backend - provides system status and logs"""
+    payload, status, log = run_status(request_json())
+    # The threaded dev server blocks on the log call; asgi_backend ships it off the request path
+    if log:
+        post_optimization_log(*log)
+    return jsonify(payload), status
 
 if __name__ == '__main__':
     try: